@@ -12,6 +12,8 @@ from pygase import Client
 
 # For backends:
 from pygase import GameState, GameStateStore, GameStateMachine, Server
+# For relays that serve more clients on other nodes:
+from pygase import Relay
 # Not necessary but might come in handy:
 from pygase import get_availabe_ip_addresses
 ```
@@ -19,7 +21,9 @@ from pygase import get_availabe_ip_addresses
 """
 
 from pygase.client import Client
-from pygase.backend import Backend, Server, GameStateStore, GameStateMachine
+from pygase.backend import GameStateStore, GameStateMachine, Backend
+from pygase.server import Server
+from pygase.relay import Relay
 from pygase.gamestate import GameState
 from pygase.utils import get_available_ip_addresses
 
@@ -29,6 +33,7 @@ __all__ = [
     "GameState",
     "GameStateMachine",
     "GameStateStore",
+    "Relay",
     "Server",
     "get_available_ip_addresses",
 ]
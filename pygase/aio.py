@@ -6,6 +6,9 @@ import asyncio
 import functools
 import inspect
 import socket as _socket
+import threading
+import time
+from collections import deque
 
 CancelledError = asyncio.CancelledError
 iscoroutinefunction = inspect.iscoroutinefunction
@@ -58,6 +61,83 @@ async def sleep(delay):
     await asyncio.sleep(delay)
 
 
+async def sleep_until(deadline, spin_time=0.0):
+    """Suspend execution until ``time.perf_counter()`` reaches ``deadline``.
+
+    Sleeps until ``spin_time`` seconds before the deadline and then yields to the
+    event loop in a tight loop, which trades CPU time for sub-millisecond precision.
+
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_time:
+        await asyncio.sleep(remaining - spin_time)
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(0)
+
+
+def is_running_in(loop) -> bool:
+    """Return ``True`` when called from within ``loop``."""
+    return _is_running_loop() and asyncio.get_running_loop() is loop
+
+
+def call_in_loop(loop, func, *args):
+    """Call ``func(*args)`` in ``loop``, directly if it is the running loop, else thread-safely as soon as possible.
+
+    Scheduling via ``loop.call_soon_threadsafe`` wakes up the loop right away, even while it waits for I/O.
+
+    """
+    if loop is None or is_running_in(loop):
+        func(*args)
+    else:
+        loop.call_soon_threadsafe(func, *args)
+
+
+class Notifier:
+    """Wake up coroutines that wait in the event loops of any threads, from any thread.
+
+    ``notify`` schedules the wake-up of each waiter via its loop's ``call_soon_threadsafe``,
+    so notifications from another thread don't have to wait for the waiting loop to poll.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: list = []
+
+    async def wait_for(self, predicate):
+        """Wait until ``predicate()`` is true, checking it whenever ``notify`` has been called."""
+        loop = asyncio.get_running_loop()
+        while True:
+            future = loop.create_future()
+            # Register before checking, so a notification right after the check isn't missed.
+            with self._lock:
+                self._waiters.append((loop, future))
+            try:
+                if predicate():
+                    return
+                await future
+            finally:
+                with self._lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+
+    def notify(self):
+        """Wake up all waiting coroutines."""
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                call_in_loop(loop, _resolve, future)
+            except RuntimeError:
+                # The waiting loop has been closed in the meantime.
+                pass
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
 class Task:
     """Wrap an ``asyncio.Task`` with Curio-like methods."""
 
@@ -85,31 +165,179 @@ async def spawn(func, *args):
     return Task(asyncio.create_task(coro))
 
 
-class UniversalQueue:
-    """Queue supporting sync ``put`` and async consumption."""
+QUEUE_POLICIES = ("block", "drop_oldest", "drop_newest", "coalesce")
 
-    def __init__(self):
-        self._queue: asyncio.Queue = asyncio.Queue()
 
-    def put(self, item):
-        """Put an item, returning a coroutine when inside an event loop."""
-        if _is_running_loop():
-            return self._queue.put(item)
-        self._queue.put_nowait(item)
+def _completed():
+    """Return an awaitable that is already done when inside an event loop, else ``None``."""
+    if not _is_running_loop():
         return None
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(None)
+    return future
+
+
+class _Slot:
+    """Position of an item in a ``UniversalQueue``, whose item can be replaced while it is pending."""
+
+    __slots__ = ("item", "key", "overflow_key")
+
+    def __init__(self, item, key, overflow_key):
+        self.item = item
+        self.key = key
+        self.overflow_key = overflow_key
+
+
+class UniversalQueue:
+    """Queue supporting sync ``put`` and async consumption.
+
+    Items put with a coalescing ``key`` replace a pending item with the same key, so only the latest
+    of them is retrieved, at the queue position of the first one.
+
+    With a ``maxsize``, the ``policy`` decides what happens to an item that is put into the full queue:
+
+    - ``"block"``: ``put`` waits until an item has been retrieved (raises ``asyncio.QueueFull`` outside an event loop)
+    - ``"drop_oldest"``: the oldest pending item is discarded to make room for the new one
+    - ``"drop_newest"``: the new item is discarded
+    - ``"coalesce"``: the new item replaces the newest pending item with the same ``overflow_key(item)``
+      (the item itself by default), or is discarded if there is none
+
+    Every put into the full queue is counted in ``overflow_count``, discarded items are passed to ``on_drop``.
+
+    """
+
+    def __init__(self, maxsize=0, policy="block", overflow_key=None, on_drop=None):
+        # The queue itself is unbounded and never replaced, so getters waiting on it survive limit changes.
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._putters: deque = deque()
+        # Guards the pending slots, since coalescing puts may come from another thread than the consumer.
+        self._slot_lock = threading.Lock()
+        self._latest: dict = {}
+        self._newest_by_overflow_key: dict = {}
+        self.maxsize = 0
+        self.policy = "block"
+        self.overflow_key = overflow_key
+        self.on_drop = on_drop
+        self.overflow_count = 0
+        self.set_limit(maxsize, policy)
+
+    def set_limit(self, maxsize, policy="block"):
+        """Bound the number of pending items, ``0`` for an unbounded queue.
+
+        Raises ``ValueError`` for unknown policies and ``RuntimeError`` if the queue is not empty.
+
+        """
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {QUEUE_POLICIES}.")
+        if not self.empty():
+            raise RuntimeError("Queue limits can only be changed while the queue is empty.")
+        self.maxsize = maxsize
+        self.policy = policy
+
+    def put(self, item, key=None):
+        """Put an item, returning an awaitable when inside an event loop."""
+        if key is not None and self._replace(key, item):
+            return _completed()
+        slot = _Slot(item, key, None)
+        if self.policy == "coalesce":
+            slot.overflow_key = item if self.overflow_key is None else self.overflow_key(item)
+        if self.full():
+            self.overflow_count += 1
+            if self.policy == "block":
+                if not _is_running_loop():
+                    raise asyncio.QueueFull
+                self._register(slot)
+                return self._put_when_room(slot)
+            if self.policy == "drop_oldest":
+                self._drop(self._queue.get_nowait())
+                self._queue.task_done()
+            else:
+                discarded = item
+                with self._slot_lock:
+                    pending_slot = self._newest_by_overflow_key.get(slot.overflow_key)
+                    if self.policy == "coalesce" and pending_slot is not None:
+                        discarded, pending_slot.item = pending_slot.item, item
+                self._discard(discarded)
+                return _completed()
+        self._register(slot)
+        self._queue.put_nowait(slot)
+        return _completed()
 
     async def get(self):
         """Asynchronously retrieve and return the next queued item."""
-        return await self._queue.get()
+        slot = await self._queue.get()
+        self._forget(slot)
+        self._wake_putter()
+        return slot.item
 
     def empty(self) -> bool:
         """Return ``True`` when the queue has no items."""
         return self._queue.empty()
 
+    def full(self) -> bool:
+        """Return ``True`` when the queue has ``maxsize`` pending items."""
+        return 0 < self.maxsize <= self._queue.qsize()
+
+    def qsize(self) -> int:
+        """Return the number of pending items."""
+        return self._queue.qsize()
+
     async def task_done(self):
         """Mark the most recently retrieved task as completed."""
         self._queue.task_done()
 
+    async def _put_when_room(self, slot):
+        try:
+            while self.full():
+                waiter = asyncio.get_running_loop().create_future()
+                self._putters.append(waiter)
+                await waiter
+        except asyncio.CancelledError:
+            self._forget(slot)
+            # Pass on the wakeup this putter may have received, so no other putter misses its turn.
+            self._wake_putter()
+            raise
+        self._queue.put_nowait(slot)
+
+    def _wake_putter(self):
+        while self._putters:
+            waiter = self._putters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _replace(self, key, item):
+        """Replace the item of the pending slot with a coalescing key, return ``False`` if there is none."""
+        with self._slot_lock:
+            slot = self._latest.get(key)
+            if slot is None:
+                return False
+            slot.item = item
+            return True
+
+    def _register(self, slot):
+        with self._slot_lock:
+            if slot.key is not None:
+                self._latest[slot.key] = slot
+            if self.policy == "coalesce":
+                self._newest_by_overflow_key[slot.overflow_key] = slot
+
+    def _forget(self, slot):
+        # Once forgotten, no put replaces the item of the slot anymore, so it can be read without the lock.
+        with self._slot_lock:
+            if slot.key is not None and self._latest.get(slot.key) is slot:
+                del self._latest[slot.key]
+            if self._newest_by_overflow_key.get(slot.overflow_key) is slot:
+                del self._newest_by_overflow_key[slot.overflow_key]
+
+    def _drop(self, slot):
+        self._forget(slot)
+        self._discard(slot.item)
+
+    def _discard(self, item):
+        if self.on_drop is not None:
+            self.on_drop(item)
+
 
 class AsyncSocket:
     """Asynchronous UDP socket wrapper around stdlib sockets."""
@@ -1,27 +1,39 @@
 # -*- coding: utf-8 -*-
-"""Serve PyGaSe clients.
+"""Progress and sync game states.
 
-Provides the `Server` class and all PyGaSe components that deal with progression and syncing of game states.
+Provides the PyGaSe components that store and progress game states, and the `Backend` class that integrates
+them with a #pygase.Server.
 
 # Contents
 - #GameStateStore: main API class for game state repositories
-- #Server: main API class for PyGaSe servers
 - #GameStateMachine: main API class for game logic components
 - #Backend: main API class for a fully integrated PyGaSe backend
 
 """
 
 import time
+import asyncio
 import threading
+from bisect import bisect_right
 from collections.abc import Callable, Mapping
+from typing import Any, Awaitable, cast
 
 from pygase import aio
-from pygase.aio import socket, awaitable
-
-from pygase.connection import ServerConnection, EventWire
-from pygase.gamestate import GameState, GameStateUpdate, GameStatus
+from pygase.aio import awaitable, iscoroutinefunction
+
+from pygase.server import Server
+from pygase.simulation import (
+    SimulationWorker,
+    WorkingState,
+    run_time_steps,
+    working_copy,
+    merge_event_update,
+    record_input_ack,
+    apply_update_dict,
+)
+from pygase.gamestate import GameState, GameStateUpdate, GameStatus, merge_update_dicts
 from pygase.event import UniversalEventHandler, Event, EventHandler
-from pygase.utils import logger
+from pygase.utils import JitterStats, Sqn, logger
 
 
 class GameStateStore:
@@ -33,9 +45,16 @@ class GameStateStore:
     # Raises
     TypeError: if 'initial_game_state' is not an instance of #GameState
 
+    ---
+    Besides the update cache, the store keeps a history of past game states for lag compensation, see
+    #GameStateStore.get_game_state_at(). To keep it compact, only every `_keyframe_interval`-th state is kept
+    as a snapshot (keyframe), the states in between are reconstructed from the pushed updates.
+
     """
 
     _update_cache_size: int = 100
+    _history_size: int = 100  # minimum number of past time orders whose game states can be reconstructed
+    _keyframe_interval: int = 10  # number of time orders between two snapshots of the game state in the history
 
     def __init__(self, initial_game_state: GameState = None):
         logger.debug("Creating GameStateStore instance.")
@@ -45,11 +64,32 @@ class GameStateStore:
                 f"'initial_game_state' should be of type 'GameState', not '{self._game_state.__class__.__name__}'."
             )
         self._game_state_update_cache = [GameStateUpdate(0)]
+        self._combined_updates: dict[tuple[int, int], GameStateUpdate] = {}
+        self._input_acks: dict[tuple[str, int], Sqn] = {}
+        self._update_notifier = aio.Notifier()
+        self._keyframes = [working_copy(self._game_state)]
+        self._history: list[tuple[float, GameStateUpdate]] = []
+        self._past_game_states: dict[int, GameState] = {}
 
     def get_update_cache(self) -> list[GameStateUpdate]:
         """Return the latest state updates."""
         return self._game_state_update_cache.copy()
 
+    def get_update_since(self, time_order: int) -> GameStateUpdate:
+        """Return the combination of all cached state updates with a time order higher than `time_order`.
+
+        Combined updates are shared between all callers that ask for the same time order until the next update
+        is pushed, so clients with the same last known state don't combine the same updates over and over.
+
+        """
+        update_cache = self.get_update_cache()
+        key = (int(time_order), int(update_cache[-1].time_order))
+        combined_updates = self._combined_updates
+        if key not in combined_updates:
+            update_base = GameStateUpdate(time_order)
+            combined_updates[key] = sum((upd for upd in update_cache if upd > update_base), update_base)
+        return combined_updates[key]
+
     def get_game_state(self) -> GameState:
         """Return the current game state."""
         return self._game_state
@@ -64,6 +104,7 @@ class GameStateStore:
         self._game_state_update_cache.append(update)
         if len(self._game_state_update_cache) > self._update_cache_size:
             del self._game_state_update_cache[0]
+        self._combined_updates = {}
         if update > self._game_state:
             logger.debug(
                 (
@@ -72,174 +113,97 @@ class GameStateStore:
                 )
             )
             self._game_state += update
-
-
-class Server:
-    """Listen to clients and orchestrate the flow of events and state updates.
-
-    The #Server instance does not contain game logic or state, it is only responsible for connections
-    to clients. The state is provided by a #GameStateStore and game logic by a #GameStateMachine.
-
-    # Arguments
-    game_state_store (GameStateStore): part of the backend that provides an interface to the #pygase.GameState
-
-    # Attributes
-    connections (dict): contains each clients address as a key leading to the
-        corresponding #pygase.connection.ServerConnection instance
-    host_client (tuple): address of the host client (who has permission to shutdown the server), if there is any
-    game_state_store (GameStateStore): game state repository
-
-    # Members
-    hostname (str): read-only access to the servers hostname
-    port (int): read-only access to the servers port number
-
-    """
-
-    def __init__(self, game_state_store: GameStateStore):
-        logger.debug("Creating Server instance.")
-        self.connections: dict = {}
-        self.host_client: tuple = None
-        self.game_state_store = game_state_store
-        self._universal_event_handler: UniversalEventHandler = UniversalEventHandler()
-        self._hostname: str = None
-        self._port: int = None
-
-    def run(self, port: int = 0, hostname: str = "localhost", event_wire: EventWire | None = None) -> None:
-        """Start the server under a specified address.
-
-        This is a blocking function but can also be spawned as a coroutine or in a thread
-        via #Server.run_in_thread().
+            self._record_history(update)
+        self._update_notifier.notify()
+
+    def _record_history(self, update: GameStateUpdate) -> None:
+        """Add an applied update to the history and take a keyframe if it is due, dropping expired history."""
+        self._history.append((time.time(), update))
+        self._past_game_states = {}
+        if self._game_state.time_order - self._keyframes[-1].time_order < self._keyframe_interval:
+            return
+        # Expired history is dropped by replacing the lists, so lookups from other threads never see them shrink.
+        # Applied updates replace changed entity tables and nested dicts, so a shallow copy is a snapshot.
+        keyframes = self._keyframes + [working_copy(self._game_state)]
+        expiry = self._game_state.time_order - self._history_size
+        expired = bisect_right(keyframes, expiry, key=lambda keyframe: keyframe.time_order)
+        self._keyframes = keyframes = keyframes[max(expired - 1, 0) :]
+        self._history = self._history[bisect_right(self._history, keyframes[0].time_order, key=_history_time_order) :]
+
+    def get_game_state_at(self, time_order: int) -> GameState:
+        """Return the game state as it was at a past time order.
+
+        The state is reconstructed from the latest keyframe before `time_order` and the updates pushed since then,
+        so a lookup takes a binary search and the combination of at most `_keyframe_interval` updates.
+        Reconstructed states are shared between all callers until the next update is pushed and must not be changed.
 
         # Arguments
-        port (int): port number the server will be bound to, default will be an available
-           port chosen by the computers network controller
-        hostname (str): hostname or IP address the server will be bound to.
-           Defaults to `'localhost'`.
-        event_wire (GameStateMachine): object to which events are to be repeated
-           (has to implement a `_push_event(event)` method and is typically a #GameStateMachine)
-
-        """
-        aio.run(self.run, port, hostname, event_wire)
-
-    @awaitable(run)
-    async def run(  # pylint: disable=function-redefined
-        self, port: int = 0, hostname: str = "localhost", event_wire: EventWire | None = None
-    ) -> None:
-        # pylint: disable=missing-docstring
-        await ServerConnection.loop(hostname, port, self, event_wire)
-
-    def run_in_thread(
-        self, port: int = 0, hostname: str = "localhost", event_wire: EventWire | None = None, daemon: bool = True
-    ) -> threading.Thread:
-        """Start the server in a seperate thread.
-
-        See #Server.run().
+        time_order (int): time order of the game state, the current game state is returned for
+            time orders that have not been reached yet
 
         # Returns
-        threading.Thread: the thread the server loop runs in
-
-        """
-        thread = threading.Thread(target=self.run, args=(port, hostname, event_wire), daemon=daemon)
-        thread.start()
-        return thread
-
-    @property
-    def hostname(self) -> str:
-        """Get the hostname or IP address on which the server listens.
+        GameState: the latest game state with a time order not higher than `time_order`
 
-        Returns `None` when the server is not running.
+        # Raises
+        KeyError: if `time_order` is older than the history of the store
 
         """
-        return "localhost" if self._hostname == "127.0.0.1" else self._hostname
-
-    @property
-    def port(self) -> int:
-        """Get the port number on which the server listens.
-
-        Returns `None` when the server is not running.
+        if not self._game_state.time_order > time_order:
+            return self._game_state
+        if time_order not in self._past_game_states:
+            keyframes, history = self._keyframes, self._history
+            index = bisect_right(keyframes, time_order, key=lambda keyframe: keyframe.time_order) - 1
+            if index < 0:
+                raise KeyError(f"Game state of time order {time_order} is no longer in the history.")
+            keyframe = keyframes[index]
+            start = bisect_right(history, keyframe.time_order, key=_history_time_order)
+            end = bisect_right(history, time_order, key=_history_time_order)
+            changes = sum((update for _, update in history[start:end]), GameStateUpdate(keyframe.time_order))
+            game_state = working_copy(keyframe)
+            apply_update_dict(game_state, changes.data)
+            game_state.time_order = changes.time_order
+            self._past_game_states[time_order] = game_state
+        return self._past_game_states[time_order]
+
+    def get_time_order_at(self, timestamp: float) -> int:
+        """Return the time order of the game state that was current at a `time.time()` timestamp.
+
+        Returns the time order of the oldest state in the history, if `timestamp` is older than the history.
 
         """
-        return self._port
+        history = self._history
+        index = bisect_right(history, timestamp, key=lambda entry: entry[0])
+        if index == 0:
+            return int(self._keyframes[0].time_order)
+        return int(history[index - 1][1].time_order)
 
-    def shutdown(self) -> None:
-        """Shut down the server.
+    async def wait_for_update(self, time_order: int) -> GameStateUpdate:
+        """Wait until the game state has progressed beyond `time_order` and return the update since then.
 
-        The server can be restarted via #Server.run() in which case it will remember previous connections.
-        This method can also be spawned as a coroutine.
+        This coroutine is woken up as soon as the update is pushed, even if the state is progressed
+        by a #GameStateMachine that runs in another thread.
 
         """
-        aio.run(self.shutdown)
+        await self._update_notifier.wait_for(lambda: self._game_state.time_order > time_order)
+        return self.get_update_since(time_order)
 
-    @awaitable(shutdown)
-    async def shutdown(self) -> None:  # pylint: disable=function-redefined
-        # pylint: disable=missing-docstring
-        async with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            await sock.sendto("shut_me_down".encode("utf-8"), (self._hostname, self._port))
+    def get_input_ack(self, client_address: tuple[str, int]) -> Sqn:
+        """Return the sequence number of the last input event from a client that has been applied."""
+        return self._input_acks.get(client_address, Sqn(0))
 
-    # advanced type checking for target client and callback would be helpful
-    def dispatch_event(
-        self,
-        event_type: str,
-        *args: object,
-        target_client: tuple[str, int] | str = "all",
-        retries: int = 0,
-        ack_callback: EventHandler | None = None,
-        **kwargs: object,
-    ) -> None:
-        """Send an event to one or all clients.
-
-        # Arguments
-        event_type (str): identifies the event and links it to a handler
-        target_client (tuple, str): either `'all'` for an event broadcast, or a clients address as a tuple
-        retries (int): number of times the event is to be resent in case it times out
-        ack_callback (callable, coroutine): will be executed after the event was received
-            and be passed a reference to the corresponding #pygase.connection.ServerConnection instance
-
-        Additional positional and keyword arguments will be sent as event data and passed to the clients
-        handler function.
-
-        """
-        event = Event(event_type, *args, **kwargs)
-
-        def get_ack_callback(connection: object) -> Callable[[], object] | None:
-            if ack_callback is not None:
-                return lambda: ack_callback(connection)
-            return None
-
-        if retries > 0:
-
-            def timeout_callback() -> None:
-                self.dispatch_event(
-                    event_type,
-                    *args,
-                    target_client=target_client,
-                    retries=retries - 1,
-                    ack_callback=ack_callback,
-                    **kwargs,
-                )
-                logger.warning(f"Event of type {event_type} timed out. Retrying to send event to server.")
-
-        else:
-            timeout_callback = None
-
-        if target_client == "all":
-            for connection in self.connections.values():
-                connection.dispatch_event(event, get_ack_callback(connection), timeout_callback, **kwargs)
-        else:
-            self.connections[target_client].dispatch_event(
-                event, get_ack_callback(self.connections[target_client]), timeout_callback, **kwargs
-            )
+    def push_input_acks(self, input_acks: Mapping[tuple[str, int], Sqn]) -> None:
+        """Acknowledge client input events whose effects are contained in the pushed updates.
 
-    # add advanced type checking for handler functions
-    def register_event_handler(self, event_type: str, event_handler_function: EventHandler) -> None:
-        """Register an event handler for a specific event type.
+        This method will usually be called by a #GameStateMachine right after pushing the update of a time step,
+        so clients using prediction can reconcile their predicted state with the authoritative one.
 
         # Arguments
-        event_type (str): event type to link the handler function to
-        handler_func (callable, coroutine): will be called for received events of the given type
+        input_acks (dict): maps client addresses to the sequence number of their last applied input event
 
         """
-        self._universal_event_handler.register_event_handler(event_type, event_handler_function)
+        for client_address, input_sequence in input_acks.items():
+            if input_sequence > self.get_input_ack(client_address):
+                self._input_acks[client_address] = Sqn(input_sequence)
 
 
 class GameStateMachine:
@@ -254,101 +218,396 @@ class GameStateMachine:
 
     # Attributes
     game_time (float): duration the game has been running in seconds
+    overruns (int): number of network ticks in fixed time step mode after which the simulation could not
+        catch up with real time within `_max_catch_up_steps` time steps
+    tick_jitter (pygase.utils.JitterStats): how late the game loop started its iterations compared to schedule
 
     """
 
+    _max_catch_up_steps: int = 5  # maximum number of fixed time steps per network tick
+    _spin_time: float = 0.002  # time in seconds before a tick deadline in which precise timing stops sleeping
+    _max_rewind_time: float = 0.5  # maximum time in seconds by which lag compensation rewinds the game state
+
     def __init__(self, game_state_store: GameStateStore):
         logger.debug("Creating GameStateMachine instance.")
         self.game_time: float = 0.0
-        self._event_queue = aio.UniversalQueue()
+        self.overruns: int = 0
+        self.tick_jitter = JitterStats()
+        self._event_queue = aio.UniversalQueue(overflow_key=lambda event: event.type)
         self._universal_event_handler: UniversalEventHandler = UniversalEventHandler()
+        self._batch_event_handlers: dict[str, EventHandler] = {}
+        self._worker_event_handlers: dict[str, EventHandler] = {}
+        self._lag_compensated_event_types: set[str] = set()
+        self._worker: SimulationWorker | None = None
         self._game_state_store = game_state_store
         self._game_loop_is_running = False
+        self._loop: asyncio.AbstractEventLoop | None = None
 
     def _push_event(self, event: Event) -> None:
         """Push an event into the state machines event queue.
 
-        This method can be spawned as a coroutine.
+        This method can be spawned as a coroutine. It is thread-safe, events pushed from another thread than
+        the one running the game loop are handed over to the game loop's event loop, which is woken up right away.
+        Only a full event queue with the `'block'` policy makes the caller wait for the game loop.
 
         """
         logger.debug(f"State machine receiving event of type {event.type} via event wire.")
-        self._event_queue.put(event)
+        loop = self._loop
+        if loop is None:
+            self._event_queue.put(event)
+        elif self._event_queue.policy != "block":
+            loop.call_soon_threadsafe(self._event_queue.put, event)
+        else:
+            asyncio.run_coroutine_threadsafe(self._put_event(event), loop).result()
 
     @awaitable(_push_event)
     async def _push_event(self, event: Event) -> None:  # pylint: disable=function-redefined
         logger.debug(f"State machine receiving event of type {event.type} via event wire.")
+        loop = self._loop
+        if loop is None or aio.is_running_in(loop):
+            await self._put_event(event)
+        elif self._event_queue.policy != "block":
+            loop.call_soon_threadsafe(self._event_queue.put, event)
+        else:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._put_event(event), loop))
+
+    async def _put_event(self, event: Event) -> None:
         await self._event_queue.put(event)
 
+    def set_queue_limit(self, queue: str, maxsize: int, policy: str = "drop_oldest") -> None:
+        """Bound the number of events waiting to be handled by the state machine.
+
+        # Arguments
+        queue (str): `'events'`, the only queue of the state machine
+        maxsize (int): maximum number of pending events, `0` for no limit
+        policy (str): `'drop_oldest'`, `'drop_newest'`, `'coalesce'` (keep the latest event of each type)
+            or `'block'` (slow down receiving events from clients), see #pygase.aio.UniversalQueue
+
+        # Raises
+        KeyError: if `queue` is unknown
+        ValueError: if `policy` is unknown
+        RuntimeError: if events are waiting to be handled
+
+        """
+        self._get_queues()[queue].set_limit(maxsize, policy)
+
+    def get_queue_overflows(self) -> dict[str, int]:
+        """Return how many events have been pushed to the state machine while its event queue was full."""
+        return {name: queue.overflow_count for name, queue in self._get_queues().items()}
+
+    def _get_queues(self) -> dict[str, aio.UniversalQueue]:
+        return {"events": self._event_queue}
+
     # advanced type checking for the handler function would be helpful
-    def register_event_handler(self, event_type: str, event_handler_function: EventHandler) -> None:
+    def register_event_handler(
+        self,
+        event_type: str,
+        event_handler_function: EventHandler,
+        in_worker_process: bool = False,
+        lag_compensated: bool = False,
+    ) -> None:
         """Register an event handler for a specific event type.
 
-        For event handlers to have any effect, the events have to be wired from a #Server to
-        the #GameStateMachine via the `event_wire` argument of the #Server.run() method.
+        For event handlers to have any effect, the events have to be wired from a #pygase.Server to
+        the #GameStateMachine via the `event_wire` argument of the #pygase.Server.run() method.
 
         # Arguments
         event_type (str): which type of event to link the handler function to
-        handler_func (callable, coroutine): function or coroutine to be invoked for events of the given type
+        event_handler_function (callable, coroutine): function or coroutine to be invoked for events of the given type
+        in_worker_process (bool): whether the handler runs in the worker process when the game loop runs with
+            `worker_process=True` (see #GameStateMachine.run_game_loop()), in which case it has to be picklable
+        lag_compensated (bool): whether the handler also gets passed the game state as the sending client saw it,
+            see #GameStateMachine.get_client_game_state()
+
+        # Raises
+        ValueError: if a lag-compensated handler is to run in the worker process, which has no state history
 
         ---
         In addition to the event data, a #GameStateMachine handler function gets passed
         the following keyword arguments
 
-        - `game_state`: game state at the time of the event
+        - `game_state`: game state at the time of the event, including the effects of events
+          that were handled before it in the same time step
         - `dt`: time since the last time step
         - `client_address`: client which sent the event that is being handled
+        - `client_game_state`: only for lag-compensated handlers, the past game state the client saw when it
+          sent the event, e.g. to validate hits against the positions the client aimed at
 
-        It is expected to return an update dict like the `time_step` method.
+        It is expected to return an update dict like the `time_step` method. The update dicts of all handlers
+        of a time step are merged deeply, so nested dicts only need to contain the changed entries, and entries
+        are removed by setting them to #pygase.gamestate.TO_DELETE.
 
         """
+        if in_worker_process and lag_compensated:
+            raise ValueError("Lag-compensated event handlers can't run in the worker process.")
         self._universal_event_handler.register_event_handler(event_type, event_handler_function)
+        if lag_compensated:
+            self._lag_compensated_event_types.add(event_type)
+        else:
+            self._lag_compensated_event_types.discard(event_type)
+        if in_worker_process:
+            self._worker_event_handlers[event_type] = event_handler_function
+        else:
+            self._worker_event_handlers.pop(event_type, None)
+
+    def get_client_game_state(self, event: Event) -> GameState:
+        """Return the game state as the client that sent an event saw it, for lag compensation.
+
+        The game state is rewound to the `view_time_order` of the event (see #pygase.event.Event), but by no more
+        than `_max_rewind_time` seconds, so clients with a very high latency can't act on long outdated states.
+        Events without a view time order, e.g. ones that don't come from clients, get the current game state.
+        This method can also be used by batch handlers and #GameStateMachine.time_step().
+
+        # Arguments
+        event (pygase.event.Event): an event received from a client
+
+        # Returns
+        GameState: past game state from the history of the #GameStateStore, which must not be changed
+
+        """
+        game_state_store = self._game_state_store
+        if event.view_time_order == 0:
+            return game_state_store.get_game_state()
+        earliest = Sqn(game_state_store.get_time_order_at(time.time() - self._max_rewind_time))
+        return game_state_store.get_game_state_at(max(Sqn(event.view_time_order), earliest))
+
+    def register_batch_event_handler(self, event_type: str, event_handler_function: EventHandler) -> None:
+        """Register an event handler that handles all queued events of a specific type at once.
+
+        Instead of being invoked once per event, a batch handler is invoked once per time step with the list of
+        all #pygase.event.Event objects of its type that arrived since the last time step, which allows it to
+        process them in a vectorized way. A batch handler takes precedence over a handler of the same event type
+        registered via #GameStateMachine.register_event_handler().
+
+        # Arguments
+        event_type (str): which type of event to link the handler function to
+        event_handler_function (callable, coroutine): function or coroutine to be invoked with a list of events
 
-    def run_game_loop(self, interval: float = 0.02) -> None:
+        # Raises
+        TypeError: if `event_handler_function` is not callable
+
+        ---
+        In addition to the list of events, a batch handler function gets passed the `game_state` and `dt` keyword
+        arguments like a regular #GameStateMachine handler function. The event data is available via the
+        `handler_args` and `handler_kwargs` attributes of each event, including the `client_address`.
+        Batches are handled after all other events of the time step, in the order in which the first event
+        of each batch arrived.
+
+        It is expected to return a single update dict for the whole batch.
+
+        """
+        logger.info(f"Registering batch event handler for events of type {event_type}.")
+        if not callable(event_handler_function):
+            raise TypeError(f"'{event_handler_function.__class__.__name__}' object is not callable.")
+        self._batch_event_handlers[event_type] = event_handler_function
+
+    def run_game_loop(
+        self,
+        interval: float = 0.02,
+        fixed_dt: float | None = None,
+        precise_timing: bool = False,
+        worker_process: bool = False,
+    ) -> None:
         """Simulate the game world.
 
         This function blocks as it continuously progresses the game state through time
-        but it can also be spawned as a coroutine or in a thread via #Server.run_game_loop_in_thread().
+        but it can also be spawned as a coroutine or in a thread via #pygase.Server.run_game_loop_in_thread().
         As long as the simulation is running, the `game_state.status` will be `GameStatus.ACTIVE`.
 
         # Arguments
-        interval (float): (minimum) duration in seconds between consecutive time steps
+        interval (float): (minimum) duration in seconds between consecutive time steps, or between consecutive
+            state updates (network ticks) if `fixed_dt` is set
+        fixed_dt (float): run the simulation in fixed time steps of this duration in seconds
+        precise_timing (bool): schedule iterations against absolute deadlines and wait for them with
+            #pygase.aio.sleep_until(), which spins for the last `_spin_time` seconds of each interval
+        worker_process (bool): run #GameStateMachine.time_step() and the event handlers registered with
+            `in_worker_process=True` in a separate process
+
+        ---
+        By default #GameStateMachine.time_step() is called once per interval with the measured time since the last
+        time step, so simulation results depend on scheduling jitter. In fixed time step mode, elapsed real time is
+        accumulated and #GameStateMachine.time_step() is called as many times with `dt=fixed_dt` as fit into
+        it, which makes the simulation deterministic. All fixed time steps of a network tick are combined into a
+        single state update. If the simulation falls behind by more than `_max_catch_up_steps` time steps,
+        the excess time is dropped and counted in `overruns`.
+
+        Sleeping for the remainder of each interval is subject to the granularity of the event loop, so by default
+        iterations start up to a few milliseconds late. With `precise_timing` the game loop keeps a fixed phase
+        at the cost of some CPU time. In both modes, the lateness of each iteration is recorded in `tick_jitter`.
+
+        In worker process mode, CPU-heavy simulation doesn't compete with the server's network I/O for the GIL.
+        The worker process keeps a mirror of the game state by applying the same state updates as the
+        #GameStateStore and only ships the update dicts of its time steps and events back. `time_step` and the
+        worker event handlers must be picklable (e.g. module-level functions) and are passed to the worker when
+        the game loop starts. Events for the worker are handled there after the time step, events for all other
+        handlers are handled in the game loop thread as usual and take precedence over the worker's updates.
 
         """
-        aio.run(self.run_game_loop, interval)
+        aio.run(self.run_game_loop, interval, fixed_dt, precise_timing, worker_process)
 
     @awaitable(run_game_loop)
-    async def run_game_loop(self, interval: float = 0.02) -> None:  # pylint: disable=function-redefined
+    async def run_game_loop(  # pylint: disable=function-redefined
+        self,
+        interval: float = 0.02,
+        fixed_dt: float | None = None,
+        precise_timing: bool = False,
+        worker_process: bool = False,
+    ) -> None:
         # pylint: disable=missing-docstring
-        if self._game_state_store.get_game_state().game_status == GameStatus.PAUSED:
+        game_state = self._game_state_store.get_game_state()
+        if worker_process:
+            # Start the worker first, so the game isn't left active without a game loop if it fails to start.
+            # It mirrors the game state from here on and picks up the status update with the next sync.
+            self._worker = SimulationWorker(self.time_step, self._worker_event_handlers, game_state)
+        if game_state.game_status == GameStatus.PAUSED:
             self._game_state_store.push_update(
-                GameStateUpdate(self._game_state_store.get_game_state().time_order + 1, game_status=GameStatus.ACTIVE)
+                GameStateUpdate(game_state.time_order + 1, game_status=GameStatus.ACTIVE)
             )
         game_state = self._game_state_store.get_game_state()
         dt = interval
         last_step_ts = None
+        accumulator = 0.0
+        next_tick = None
+        self._loop = asyncio.get_running_loop()
         self._game_loop_is_running = True
         logger.info(f"State machine starting game loop with interval of {interval} seconds.")
-        while game_state.game_status == GameStatus.ACTIVE:
-            loop_start = time.perf_counter()
-            dt = interval if last_step_ts is None else loop_start - last_step_ts
-            last_step_ts = loop_start
-            update_dict = self.time_step(game_state, dt)
-            while not self._event_queue.empty():
-                event = await self._event_queue.get()
-                event_update = await self._universal_event_handler.handle(event, game_state=game_state, dt=dt)
-                if isinstance(event_update, Mapping):
-                    update_dict.update(event_update)
-                if time.perf_counter() - loop_start > 0.95 * interval:
-                    break
-            self._game_state_store.push_update(GameStateUpdate(game_state.time_order + 1, **update_dict))
-            game_state = self._game_state_store.get_game_state()
-            compute_time = time.perf_counter() - loop_start
-            await aio.sleep(max(0, interval - compute_time))
-            self.game_time += dt
+        try:
+            while game_state.game_status == GameStatus.ACTIVE:
+                loop_start = time.perf_counter()
+                if next_tick is not None:
+                    self.tick_jitter.record(loop_start - next_tick)
+                dt = interval if last_step_ts is None else loop_start - last_step_ts
+                last_step_ts = loop_start
+                steps = 1
+                if fixed_dt is not None:
+                    steps, accumulator = self._count_fixed_time_steps(accumulator + dt, fixed_dt)
+                    dt = steps * fixed_dt
+                update_dict, input_acks = await self._simulate_tick(
+                    game_state, dt, steps, fixed_dt, loop_start + 0.95 * interval
+                )
+                self._game_state_store.push_update(GameStateUpdate(game_state.time_order + 1, **update_dict))
+                if input_acks:
+                    self._game_state_store.push_input_acks(input_acks)
+                game_state = self._game_state_store.get_game_state()
+                compute_end = time.perf_counter()
+                if precise_timing:
+                    # Schedule against the previous deadline, so waking up late doesn't shift all following ticks.
+                    next_tick = max((loop_start if next_tick is None else next_tick) + interval, compute_end)
+                    await aio.sleep_until(next_tick, self._spin_time)
+                else:
+                    next_tick = max(loop_start + interval, compute_end)
+                    await aio.sleep(max(0, interval - (compute_end - loop_start)))
+                self.game_time += dt
+        finally:
+            self._loop = None
+            if self._worker is not None:
+                self._worker.shutdown()
+                self._worker = None
         logger.info("Game loop stopped.")
         self._game_loop_is_running = False
 
-    def run_game_loop_in_thread(self, interval: float = 0.02) -> threading.Thread:
+    def _count_fixed_time_steps(self, accumulator: float, fixed_dt: float) -> tuple[int, float]:
+        """Return the number of fixed time steps that fit into the accumulated time and the remaining time."""
+        steps = int((accumulator + 1e-9) // fixed_dt)
+        if steps > self._max_catch_up_steps:
+            self.overruns += 1
+            logger.warning(
+                f"Game loop is {steps} fixed time steps behind, dropping all but {self._max_catch_up_steps}."
+            )
+            steps = self._max_catch_up_steps
+            accumulator = steps * fixed_dt
+        return steps, max(0.0, accumulator - steps * fixed_dt)
+
+    async def _simulate_tick(
+        self, game_state: GameState, dt: float, steps: int, fixed_dt: float | None, deadline: float
+    ) -> tuple[dict[str, object], dict[tuple[str, int], Sqn]]:
+        """Run the time steps of a network tick and handle queued events.
+
+        Time steps and events for worker process handlers are run in the worker process, if there is one.
+
+        # Returns
+        tuple: `(update_dict, input_acks)` with the combined update dict of the tick and the input acks
+            returned by #GameStateMachine._handle_events()
+
+        """
+        if self._worker is None:
+            if fixed_dt is None:
+                update_dict = self.time_step(game_state, dt)
+            else:
+                update_dict = run_time_steps(self.time_step, game_state, steps, fixed_dt)
+            input_acks = await self._handle_events(game_state, dt, update_dict, deadline)
+            return update_dict, input_acks
+        local_update_dict: dict[str, object] = {}
+        worker_events: list[Event] = []
+        input_acks = await self._handle_events(game_state, dt, local_update_dict, deadline, worker_events)
+        update_dict = await self._worker.step(self._game_state_store, dt, steps, fixed_dt, worker_events)
+        merge_update_dicts(update_dict, local_update_dict)
+        for event in worker_events:
+            record_input_ack(input_acks, event)
+        return update_dict, input_acks
+
+    async def _handle_events(
+        self,
+        game_state: GameState,
+        dt: float,
+        update_dict: dict[str, object],
+        deadline: float,
+        worker_events: list[Event] | None = None,
+    ) -> dict[tuple[str, int], Sqn]:
+        """Handle queued events and merge their updates into `update_dict`.
+
+        Each handler is passed a working copy of `game_state` that contains the effects of the events handled
+        before it, so consecutive events (e.g. two inputs of the same client) build upon one another.
+        Events with a batch handler are collected and handled per type after all other events.
+        If a `worker_events` list is given, events for worker process handlers are appended to it instead.
+        Dequeuing events stops once the `time.perf_counter()` value `deadline` has passed.
+
+        # Returns
+        dict: maps client addresses to the sequence number of their last handled input event
+
+        """
+        input_acks: dict[tuple[str, int], Sqn] = {}
+        batches: dict[str, list[Event]] = {}
+        working_state = WorkingState(game_state)
+        while not self._event_queue.empty():
+            event = await self._event_queue.get()
+            if worker_events is not None and event.type in self._worker_event_handlers:
+                worker_events.append(event)
+            elif event.type in self._batch_event_handlers:
+                batches.setdefault(event.type, []).append(event)
+            else:
+                event_update = await self._handle_event(event, working_state.game_state, dt)
+                merge_event_update(working_state, update_dict, event_update)
+                record_input_ack(input_acks, event)
+            if time.perf_counter() > deadline:
+                break
+        for event_type, events in batches.items():
+            batch_handler = self._batch_event_handlers[event_type]
+            logger.debug(f"Handling batch of {len(events)} {event_type} events.")
+            batch_update = batch_handler(events, game_state=working_state.game_state, dt=dt)
+            if iscoroutinefunction(batch_handler):
+                batch_update = await cast(Awaitable[object], batch_update)
+            merge_event_update(working_state, update_dict, batch_update)
+            for event in events:
+                record_input_ack(input_acks, event)
+        return input_acks
+
+    async def _handle_event(self, event: Event, game_state: GameState, dt: float) -> object:
+        """Invoke the handler of an event, lag-compensated handlers also get the state the client saw."""
+        if event.type in self._lag_compensated_event_types:
+            client_game_state = self.get_client_game_state(event)
+            return await self._universal_event_handler.handle(
+                event, game_state=game_state, dt=dt, client_game_state=client_game_state
+            )
+        return await self._universal_event_handler.handle(event, game_state=game_state, dt=dt)
+
+    def run_game_loop_in_thread(
+        self,
+        interval: float = 0.02,
+        fixed_dt: float | None = None,
+        precise_timing: bool = False,
+        worker_process: bool = False,
+    ) -> threading.Thread:
         """Simulate the game in a seperate thread.
 
         See #GameStateMachine.run_game_loop().
@@ -357,7 +616,7 @@ class GameStateMachine:
         threading.Thread: the thread the game loop runs in
 
         """
-        thread = threading.Thread(target=self.run_game_loop, args=(interval,))
+        thread = threading.Thread(target=self.run_game_loop, args=(interval, fixed_dt, precise_timing, worker_process))
         thread.start()
         return thread
 
@@ -416,6 +675,8 @@ class Backend:
     time_step_function (callable): function that takes a game state and a time difference and returns
         a dict of updated game state attributes (see #GameStateMachine.time_step())
     event_handlers (dict): a dict with event types as keys and event handler functions as values
+    batch_event_handlers (dict): a dict with event types as keys and batch event handler functions as values
+        (see #GameStateMachine.register_batch_event_handler())
 
     # Attributes
     game_state_store (GameStateStore): the backends game state repository
@@ -443,6 +704,7 @@ class Backend:
         initial_game_state: GameState,
         time_step_function: Callable[[GameState, float], Mapping[str, object]],
         event_handlers: dict[str, EventHandler] | None = None,
+        batch_event_handlers: dict[str, EventHandler] | None = None,
     ) -> None:
         logger.info("Assembling Backend ...")
         self.game_state_store = GameStateStore(initial_game_state)
@@ -451,10 +713,21 @@ class Backend:
         if event_handlers is not None:
             for event_type, handler_function in event_handlers.items():
                 self.game_state_machine.register_event_handler(event_type, handler_function)
+        if batch_event_handlers is not None:
+            for event_type, handler_function in batch_event_handlers.items():
+                self.game_state_machine.register_batch_event_handler(event_type, handler_function)
         self.server = Server(self.game_state_store)
         logger.info("Backend assembled and ready.")
 
-    def run(self, hostname: str, port: int, interval: float = 0.02) -> None:
+    def run(
+        self,
+        hostname: str,
+        port: int,
+        interval: float = 0.02,
+        fixed_dt: float | None = None,
+        precise_timing: bool = False,
+        worker_process: bool = False,
+    ) -> None:
         """Run state machine and server and bind the server to a given address.
 
         # Arguments
@@ -462,13 +735,83 @@ class Backend:
         port (int): port number the server will be bound to
         interval (float): target game loop interval in seconds, forwarded to
             #GameStateMachine.run_game_loop_in_thread(); defaults to `0.02` (50 updates per second)
+        fixed_dt (float): fixed time step duration in seconds, see #GameStateMachine.run_game_loop()
+        precise_timing (bool): whether the game loop and the client connections use precise tick scheduling,
+            see #GameStateMachine.run_game_loop() and the `precise_timing` attribute of #pygase.Server
+        worker_process (bool): whether the game simulation runs in a separate process,
+            see #GameStateMachine.run_game_loop()
 
         """
-        self.game_state_machine.run_game_loop_in_thread(interval=interval)
+        game_loop_kwargs: dict[str, Any] = {"interval": interval}
+        if fixed_dt is not None:
+            game_loop_kwargs["fixed_dt"] = fixed_dt
+        if precise_timing:
+            game_loop_kwargs["precise_timing"] = True
+        if worker_process:
+            game_loop_kwargs["worker_process"] = True
+        self.server.precise_timing = precise_timing
+        self.game_state_machine.run_game_loop_in_thread(**game_loop_kwargs)
         self.server.run(port, hostname, self.game_state_machine)
         self.game_state_machine.stop()
         logger.info("Backend successfully shut down.")
 
+    def run_single_loop(
+        self,
+        hostname: str,
+        port: int,
+        interval: float = 0.02,
+        fixed_dt: float | None = None,
+        precise_timing: bool = False,
+        worker_process: bool = False,
+    ) -> None:
+        """Run state machine and server as tasks of one event loop and bind the server to a given address.
+
+        Unlike #Backend.run(), which runs the game loop in a thread of its own, this avoids contention for the GIL
+        and thread switches between game loop and server: events are pushed to the state machine and updates are
+        published to client connections by direct calls within the event loop. It suits simulations whose time
+        steps are short compared to the game loop interval, as the server can't handle packages during a time step
+        (unless it runs in a worker process). This method can also be spawned as a coroutine.
+
+        # Arguments
+        hostname (str): hostname or IPv4 address the server will be bound to
+        port (int): port number the server will be bound to
+        interval (float): target game loop interval in seconds, see #GameStateMachine.run_game_loop()
+        fixed_dt (float): fixed time step duration in seconds, see #GameStateMachine.run_game_loop()
+        precise_timing (bool): whether the game loop and the client connections use precise tick scheduling,
+            see #GameStateMachine.run_game_loop() and the `precise_timing` attribute of #pygase.Server
+        worker_process (bool): whether the game simulation runs in a separate process,
+            see #GameStateMachine.run_game_loop()
+
+        """
+        aio.run(self.run_single_loop, hostname, port, interval, fixed_dt, precise_timing, worker_process)
+
+    @awaitable(run_single_loop)
+    async def run_single_loop(  # pylint: disable=function-redefined
+        self,
+        hostname: str,
+        port: int,
+        interval: float = 0.02,
+        fixed_dt: float | None = None,
+        precise_timing: bool = False,
+        worker_process: bool = False,
+    ) -> None:
+        # pylint: disable=missing-docstring
+        self.server.precise_timing = precise_timing
+        game_loop = await aio.spawn(
+            self.game_state_machine.run_game_loop, interval, fixed_dt, precise_timing, worker_process
+        )
+        try:
+            server_loop = await aio.spawn(self.server.run, port, hostname, self.game_state_machine)
+            await server_loop.join()
+            await (await aio.spawn(self.game_state_machine.stop)).join()
+        finally:
+            await game_loop.cancel()
+        logger.info("Backend successfully shut down.")
+
     def shutdown(self) -> None:
         """Shut down server and stop game loop."""
         self.server.shutdown()
+
+
+def _history_time_order(entry: tuple[float, GameStateUpdate]) -> Sqn:
+    return entry[1].time_order
@@ -3,19 +3,22 @@
 
 # Contents
 - #Client: main API class for PyGaSe clients
+- #StatePredictor: class for client-side prediction of the game state
 
 """
 
+import copy
 import time
 import threading
-from collections.abc import Callable
+from collections import deque
+from collections.abc import Callable, Mapping
 from typing import Awaitable, Callable as TypingCallable, TypeVar, cast
 
-from pygase.gamestate import GameState
-from pygase.utils import LockedResource
+from pygase.gamestate import GameState, StateSubscriptions, InterpolationBuffer, merge_update_dicts
+from pygase.utils import LockedResource, Sqn
 
 from pygase import aio
-from pygase.aio import awaitable
+from pygase.aio import awaitable, iscoroutinefunction
 
 from pygase.connection import ClientConnection
 from pygase.event import UniversalEventHandler, Event, EventHandler
@@ -24,11 +27,87 @@ from pygase.utils import logger
 ReturnT = TypeVar("ReturnT")
 
 
+class StatePredictor:
+    """Predict the game state on the client side by applying input events before the server confirms them.
+
+    Input events of types with a registered prediction handler are tagged with ascending input sequence numbers
+    and applied to a predicted copy of the game state right away. Whenever an authoritative game state arrives,
+    the predicted state is rebuilt from it by replaying all inputs the server has not yet acknowledged.
+
+    # Attributes
+    predicted_state_context (pygase.utils.LockedResource): provides thread-safe access to the predicted
+        #pygase.GameState
+
+    """
+
+    def __init__(self) -> None:
+        self.predicted_state_context = LockedResource(GameState())
+        self._prediction_handlers: dict[str, Callable[..., Mapping | None]] = {}
+        self._input_sequence = Sqn(0)
+        self._pending_inputs: deque[Event] = deque()
+
+    def register_prediction_handler(self, event_type: str, prediction_handler: Callable[..., Mapping | None]) -> None:
+        """Register a function that predicts the effect of events of a specific type.
+
+        # Arguments
+        event_type (str): event type to link the prediction handler to
+        prediction_handler (callable): gets passed the event data and the predicted `game_state` as keyword
+            argument and returns an update dict like a #pygase.GameStateMachine event handler
+
+        # Raises
+        TypeError: if `prediction_handler` is not callable or is a coroutine function
+
+        """
+        if not callable(prediction_handler) or iscoroutinefunction(prediction_handler):
+            raise TypeError("Prediction handlers have to be synchronous functions.")
+        self._prediction_handlers[event_type] = prediction_handler
+
+    def has_event_type(self, event_type: str) -> bool:
+        """Check if a prediction handler was registered for `event_type`."""
+        return event_type in self._prediction_handlers
+
+    def predict(self, event: Event) -> None:
+        """Tag an input event with the next input sequence number and apply it to the predicted state."""
+        with self.predicted_state_context as predicted_state:
+            # Sequence numbers are assigned under the lock, so inputs from several threads are queued in order.
+            self._input_sequence += 1
+            event.input_sequence = int(self._input_sequence)
+            self._pending_inputs.append(event)
+            self._apply(event, predicted_state)
+
+    def reconcile(self, game_state: GameState, input_ack: Sqn) -> None:
+        """Rebuild the predicted state from an authoritative game state.
+
+        # Arguments
+        game_state (GameState): the authoritative game state received from the server
+        input_ack (pygase.utils.Sqn): input sequence number of the last input contained in `game_state`
+
+        """
+        if not self._prediction_handlers:
+            return
+        with self.predicted_state_context:
+            while self._pending_inputs and not Sqn(self._pending_inputs[0].input_sequence) > input_ack:
+                self._pending_inputs.popleft()
+            predicted_state = copy.deepcopy(game_state)
+            for event in self._pending_inputs:
+                self._apply(event, predicted_state)
+            self.predicted_state_context.resource = predicted_state
+
+    def _apply(self, event: Event, predicted_state: GameState) -> None:
+        handler = self._prediction_handlers[event.type]
+        update = handler(*event.handler_args, **dict(event.handler_kwargs, game_state=predicted_state))
+        if isinstance(update, Mapping):
+            merge_update_dicts(predicted_state.data, update, delete=True)
+
+
 class Client:
     """Exchange events with a PyGaSe server and access a synchronized game state.
 
     # Attributes
     connection (pygase.connection.ClientConnection): object that contains all networking information
+    precise_timing (bool): whether the connection sends packages on absolute deadlines with
+        #pygase.aio.sleep_until(), which keeps a fixed send phase at the cost of some CPU time
+        (applies to connections established afterwards)
 
     # Example
     ```python
@@ -48,13 +127,32 @@ class Client:
     def __init__(self) -> None:
         logger.debug("Creating Client instance.")
         self.connection: ClientConnection | None = None
+        self.precise_timing = False
         self._universal_event_handler = UniversalEventHandler()
+        self._state_subscriptions = StateSubscriptions()
+        self._interpolation_buffer: InterpolationBuffer | None = None
+        self._state_predictor = StatePredictor()
+        self._coalescing_keys: dict[str, int | str | None] = {}
+        self._queue_limits: dict[str, tuple[int, str]] = {}
+        self._flush_event_types: set[str] = set()
 
     def _require_connection(self) -> ClientConnection:
         if self.connection is None:
             raise RuntimeError("Client is not connected.")
         return self.connection
 
+    def _create_connection(self, port: int, hostname: str) -> ClientConnection:
+        self.connection = ClientConnection((hostname, port), self._universal_event_handler)
+        self.connection.state_subscriptions = self._state_subscriptions
+        self.connection.interpolation_buffer = self._interpolation_buffer
+        self.connection.predictor = self._state_predictor
+        self.connection.coalescing_keys = self._coalescing_keys
+        self.connection.flush_event_types = self._flush_event_types
+        self.connection.precise_timing = self.precise_timing
+        for queue, (maxsize, policy) in self._queue_limits.items():
+            self.connection.set_queue_limit(queue, maxsize, policy)
+        return self.connection
+
     def connect(self, port: int, hostname: str = "localhost") -> None:
         """Open a connection to a PyGaSe server.
 
@@ -66,14 +164,12 @@ class Client:
         hostname (str): hostname or IPv4 address of the server to which to connect
 
         """
-        self.connection = ClientConnection((hostname, port), self._universal_event_handler)
-        aio.run(self._require_connection().loop)
+        aio.run(self._create_connection(port, hostname).loop)
 
     @awaitable(connect)
     async def connect(self, port: int, hostname: str = "localhost") -> None:  # pylint: disable=function-redefined
         # pylint: disable=missing-docstring
-        self.connection = ClientConnection((hostname, port), self._universal_event_handler)
-        await cast(TypingCallable[[], Awaitable[None]], self._require_connection().loop)()
+        await cast(TypingCallable[[], Awaitable[None]], self._create_connection(port, hostname).loop)()
 
     def connect_in_thread(self, port: int, hostname: str = "localhost") -> threading.Thread:
         """Open a connection in a seperate thread.
@@ -84,8 +180,7 @@ class Client:
         threading.Thread: the thread the client loop runs in
 
         """
-        self.connection = ClientConnection((hostname, port), self._universal_event_handler)
-        thread = threading.Thread(target=aio.run, args=(self._require_connection().loop,))
+        thread = threading.Thread(target=aio.run, args=(self._create_connection(port, hostname).loop,))
         thread.start()
         return thread
 
@@ -120,6 +215,101 @@ class Client:
         """
         return self._require_connection().game_state_context
 
+    def enable_interpolation(
+        self, delay: float = 0.1, buffer_size: int = 32, path_patterns: list[str] | None = None
+    ) -> None:
+        """Keep a buffer of recent game states to render interpolated states via #Client.interpolated_state().
+
+        # Arguments
+        delay (float): time in seconds by which the default render time lags behind the current time,
+            should be somewhat larger than the servers package interval plus expected network jitter
+        buffer_size (int): number of time-stamped game states to keep
+        path_patterns (list): key path patterns like `'players.*.position'` to restrict interpolation to,
+            see #pygase.gamestate.InterpolationBuffer
+
+        ---
+        The connection stores a deep copy of the whole game state for every received update, so the cost of
+        interpolation grows with the size of the game state and the rate of state updates.
+
+        """
+        self._interpolation_buffer = InterpolationBuffer(buffer_size, delay, path_patterns)
+        if self.connection is not None:
+            self.connection.interpolation_buffer = self._interpolation_buffer
+
+    def server_time(self) -> float:
+        """Return the current time of the server's clock, as `time.time()` would on the server.
+
+        The server's clock is estimated from timestamps exchanged with each package, accounting for
+        the offset between the clocks and their drift. Until the first exchange, the local time is returned.
+
+        # Raises
+        RuntimeError: if the client is not connected
+
+        """
+        return self._require_connection().server_clock.remote_time(time.time())
+
+    def interpolated_state(self, render_time: float | None = None) -> GameState:
+        """Return a copy of the game state linearly interpolated to a point in time.
+
+        Numeric values are interpolated between the two received game states surrounding `render_time`,
+        which allows smooth rendering at frame rates higher than the rate of state updates.
+
+        # Arguments
+        render_time (float): `time.time()` timestamp to interpolate to, defaults to the current time minus the
+            `delay` set in #Client.enable_interpolation()
+
+        # Returns
+        GameState: interpolated copy of the game state
+
+        # Raises
+        RuntimeError: if interpolation has not been enabled
+        LookupError: if no game state has been received yet
+
+        """
+        if self._interpolation_buffer is None:
+            raise RuntimeError("Interpolation is not enabled, call Client.enable_interpolation() first.")
+        if render_time is None:
+            render_time = time.time() - self._interpolation_buffer.delay
+        return self._interpolation_buffer.interpolate(render_time)
+
+    def register_prediction_handler(self, event_type: str, prediction_handler: Callable[..., Mapping | None]) -> None:
+        """Predict the effect of input events locally instead of waiting for the server.
+
+        Events of the given type that are dispatched via #Client.dispatch_event() will be applied to a predicted
+        game state right away (accessible via #Client.access_predicted_state()). Whenever the client receives
+        a game state update, the predicted state is rebuilt from the authoritative state by replaying all input
+        events that the server has not yet applied. This hides the round trip time for player input.
+
+        # Arguments
+        event_type (str): event type to link the prediction handler to
+        prediction_handler (callable): synchronous function that gets passed the event data and the predicted
+            `game_state` as keyword argument and returns an update dict, typically the same function that
+            handles the event in the #pygase.GameStateMachine
+
+        # Example
+        ```python
+        def on_move(player_id, new_position, game_state, **kwargs):
+            return {"players": {player_id: {"position": new_position}}}
+
+        client.register_prediction_handler("MOVE", on_move)
+        client.dispatch_event("MOVE", player_id=0, new_position=(1, 2))
+        with client.access_predicted_state() as predicted_state:
+            assert predicted_state.players[0]["position"] == (1, 2)
+        ```
+
+        """
+        self._state_predictor.register_prediction_handler(event_type, prediction_handler)
+
+    def access_predicted_state(self) -> LockedResource[GameState]:
+        """Return a context manager to access the predicted game state.
+
+        The predicted state is the latest received game state with all unacknowledged predicted input events
+        applied to it. It is only maintained if prediction handlers have been registered via
+        #Client.register_prediction_handler().
+
+        """
+        return self._state_predictor.predicted_state_context
+
     def wait_until(self, game_state_condition: Callable[[GameState], bool], timeout: float = 1.0) -> None:
         """Block until a condition on the game state is satisfied.
 
@@ -178,6 +368,8 @@ class Client:
         *args: object,
         retries: int = 0,
         ack_callback: EventHandler | None = None,
+        delivery: str = "unreliable",
+        flush: bool = False,
         **kwargs: object,
     ) -> None:
         """Send an event to the server.
@@ -186,20 +378,52 @@ class Client:
         event_type (str): event type identifier that links to a handler
         retries (int): number of times the event is to be resent in case it times out
         ack_callback (callable, coroutine): will be invoked after the event was received
+        delivery (str): `'unreliable'`, `'reliable'` or `'ordered'`, see #pygase.connection.Connection.dispatch_event()
+        flush (bool): whether to send the event right away instead of with the next regularly scheduled package,
+            see #Client.register_flush_event()
 
         Additional positional and keyword arguments will be sent as event data and passed to the handler function.
 
+        # Raises
+        RuntimeError: if the client is not connected, in which case the event is not predicted either
+
         ---
         `ack_callback` should not perform any long-running blocking operations (say a `while True` loop), as that will
         block the connections asynchronous event loop. Use a coroutine instead, with appropriately placed `await`s.
 
+        If a prediction handler is registered for `event_type`, the event is applied to the predicted game state
+        immediately (see #Client.register_prediction_handler()).
+
+        If interpolation is enabled, the event carries the time order of the game state rendered by default
+        (see #Client.interpolated_state()), so lag-compensated handlers on the server see the state the user saw.
+
+        Reliable events are resent as soon as their loss is detected, which makes `retries` unnecessary for them.
+
         """
+        # Check the connection first, so inputs are never predicted without being sent.
+        connection = self._require_connection()
         event = Event(event_type, *args, **kwargs)
+        if self._interpolation_buffer is not None:
+            # Interpolated states lag behind the latest one, lag compensation has to rewind to what was rendered.
+            view_time_order = self._interpolation_buffer.time_order_at(time.time() - self._interpolation_buffer.delay)
+            if view_time_order:
+                event.view_time_order = view_time_order
+        if self._state_predictor.has_event_type(event_type):
+            self._state_predictor.predict(event)
+        if delivery != "unreliable":
+            connection.dispatch_event(event, ack_callback, None, delivery)
+        else:
+            self._send_event(event, retries, ack_callback)
+        if flush:
+            connection.flush()
+
+    def _send_event(self, event: Event, retries: int, ack_callback: EventHandler | None) -> None:
         if retries > 0:
 
             def timeout_callback() -> None:
-                self.dispatch_event(event_type, *args, retries=retries - 1, ack_callback=ack_callback, **kwargs)
-                logger.warning(f"Event of type {event_type} timed out. Retrying to send event to server.")
+                # Resend the same event, so predicted inputs keep their input sequence number.
+                self._send_event(event, retries - 1, ack_callback)
+                logger.warning(f"Event of type {event.type} timed out. Retrying to send event to server.")
 
         else:
             timeout_callback = None
@@ -211,7 +435,101 @@ class Client:
 
         # Arguments
         event_type (str): event type to link the handler function to
-        handler_func (callable, coroutine): will be called for events of the given type
+        event_handler_function (callable, coroutine): will be called for events of the given type
 
         """
         self._universal_event_handler.register_event_handler(event_type, event_handler_function)
+
+    def register_flush_event(self, event_type: str) -> None:
+        """Send events of a type right away when they are dispatched, like inputs of a fast-paced game.
+
+        Packages are usually sent every 25 ms (50 ms while the connection is throttled), so a dispatched event
+        waits for half that time on average. A flushed event leaves with the next package as soon as possible,
+        but no sooner than a few milliseconds after the previous package and not while the connection is throttled.
+
+        # Arguments
+        event_type (str): type of the events to flush
+
+        """
+        self._flush_event_types.add(event_type)
+
+    def register_coalescing_event(self, event_type: str, key: int | str | None = None) -> None:
+        """Only send the latest pending event of a type, like continuous inputs that supersede each other.
+
+        If a new event of the type is dispatched before the previous one has been sent, it replaces the
+        previous one in the outgoing queue. Events that are reliable or have an `ack_callback` are never replaced.
+
+        # Arguments
+        event_type (str): type of the events to coalesce
+        key (int, str): position or keyword of the event argument that distinguishes events which don't
+            replace each other, e.g. a player id, or `None` to keep only one pending event of the type
+
+        # Example
+        ```python
+        # Only send the latest position of each player, even if the connection is throttled.
+        client.register_coalescing_event("MOVE", key="player_id")
+        client.dispatch_event("MOVE", player_id=1, position=(3.0, 4.0))
+        ```
+
+        """
+        logger.info(f"Registering coalescing event type {event_type}.")
+        self._coalescing_keys[event_type] = key
+
+    def set_queue_limit(self, queue: str, maxsize: int, policy: str = "drop_oldest") -> None:
+        """Bound the number of pending items in a queue of the client's connection.
+
+        The limit applies to connections established afterwards.
+
+        # Arguments
+        queue (str): `'outgoing_events'`, `'incoming_events'` or `'commands'`
+        maxsize (int): maximum number of pending items, `0` for no limit
+        policy (str): `'drop_oldest'`, `'drop_newest'`, `'coalesce'` (keep the latest event of each type)
+            or `'block'`, see #pygase.connection.Connection.set_queue_limit()
+
+        # Raises
+        KeyError: if `queue` is unknown
+        ValueError: if `policy` is unknown or `'block'` for the outgoing event queue
+
+        """
+        if queue not in ("outgoing_events", "incoming_events", "commands"):
+            raise KeyError(queue)
+        if policy not in aio.QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {aio.QUEUE_POLICIES}.")
+        if queue == "outgoing_events" and policy == "block":
+            raise ValueError("Dispatching events can't block, choose a policy that drops or coalesces events.")
+        self._queue_limits[queue] = (maxsize, policy)
+
+    def subscribe(self, path_pattern: str, callback: Callable[[tuple, object], object]) -> None:
+        """Invoke a callback whenever a received state update touches a key path.
+
+        Only the key paths contained in each applied update are matched against the subscriptions,
+        so there is no need to compare whole game states in order to detect changes.
+
+        # Arguments
+        path_pattern (str): dot-separated key path in which `*` matches any single key, e.g. `'players.*.position'`
+        callback (callable, coroutine): will be passed the matching key path as a tuple and the updated value
+            (which is #pygase.gamestate.TO_DELETE if the entry was removed)
+
+        # Example
+        ```python
+        def on_position_change(path, position):
+            _, player_id, _ = path
+            move_sprite(player_id, position)
+
+        client.subscribe("players.*.position", on_position_change)
+        ```
+
+        ---
+        Callbacks are invoked in the connection's event loop, so the same restrictions as for event handlers apply.
+
+        """
+        self._state_subscriptions.subscribe(path_pattern, callback)
+
+    def unsubscribe(self, path_pattern: str, callback: Callable[[tuple, object], object]) -> None:
+        """Remove a callback that was subscribed via #Client.subscribe().
+
+        # Raises
+        ValueError: if `callback` is not subscribed to `path_pattern`
+
+        """
+        self._state_subscriptions.unsubscribe(path_pattern, callback)
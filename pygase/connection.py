@@ -4,17 +4,14 @@
 This module is not supposed to be required by users of this library.
 
 # Contents
-- #PROTOCOL_ID: 4 byte identifier for the PyGaSe package protocol
-- #ProtocolIDMismatchError: exception for receiving non-PyGaSe packages
-- #DuplicateSequenceError: exception for duplicate packages
-- #Header: class for PyGaSe package headers
-- #Package: class for PyGaSe UDP packages
-- #ClientPackage: subclass of #Package for packages sent by clients
-- #ServerPackage: subclass of #Package for packages sent by servers
+- #RELAY_HANDSHAKE: type of the event with which relays identify themselves to the upstream server
+- #EventHandlerProtocol: protocol for event handler registries used by connections
+- #EventWire: protocol for components that can receive forwarded events
+- #GameStateStoreProtocol: protocol for game state stores consumed by connections
+- #StatePredictorProtocol: protocol for client-side state predictors
 - #ConnectionStatus: enum for the status of a client-server connection
 - #Connection: class for the core network logic of client-server connections
 - #ClientConnection: subclass of #Connection for the client side
-- #ServerConnection: subclass of #Connection for the server side
 
 """
 
@@ -22,18 +19,33 @@ import time
 import asyncio
 from contextlib import suppress
 from collections.abc import Callable
-from typing import Protocol, cast
+from typing import Protocol
+from enum import IntEnum
 
 from pygase import aio
 from pygase.aio import socket, awaitable, iscoroutinefunction
 
-from enum import IntEnum
-
-from pygase.utils import Sqn, LockedResource, Comparable, logger
-from pygase.event import Event, EventHandler
-from pygase.gamestate import GameState, GameStateUpdate
-
-PROTOCOL_ID: bytes = bytes.fromhex("ffd0fab9")  # unique 4 byte identifier for pygase packages
+from pygase.utils import (
+    Sqn,
+    LockedResource,
+    JitterStats,
+    RttEstimator,
+    ClockSync,
+    logger,
+)
+from pygase.event import Event
+from pygase.gamestate import GameState, GameStateUpdate, StateSubscriptions, InterpolationBuffer
+from pygase.packages import (
+    ProtocolIDMismatchError,
+    DuplicateSequenceError,
+    Header,
+    Package,
+    ClientPackage,
+    ServerPackage,
+    ReliableEventChannel,
+)
+
+RELAY_HANDSHAKE: str = "__relay__"  # event type reserved for relays that identify themselves to the server
 
 
 class EventHandlerProtocol(Protocol):
@@ -55,278 +67,23 @@ class GameStateStoreProtocol(Protocol):
 
     def get_update_cache(self) -> list[GameStateUpdate]: ...
 
-    def get_game_state(self) -> GameState: ...
-
-
-class ServerProtocol(Protocol):
-    """Protocol for server state accessed in the server connection loop."""
-
-    _hostname: str | None
-    _port: int | None
-    _universal_event_handler: EventHandlerProtocol
-    game_state_store: GameStateStoreProtocol
-    connections: dict[tuple[str, int], "ServerConnection"]
-    host_client: tuple[str, int] | None
-
-
-class ProtocolIDMismatchError(ValueError):
-    """Bytestring could not be identified as a valid PyGaSe package."""
-
-
-class DuplicateSequenceError(ConnectionError):
-    """Received a package with a sequence number that was already received before."""
-
-
-class Header(Comparable):
-    """Create a PyGaSe package header.
-
-    # Arguments
-    sequence (int): package sequence number
-    ack (int): sequence number of the last received package
-    ack_bitfield (str): A 32 character string representing the 32 sequence numbers prior to the last one received,
-        with the first character corresponding the package directly preceding it and so forth.
-        '1' means that package has been received, '0' means it hasn't.
-
-    # Attributes
-    sequence (int): see corresponding constructor argument
-    ack (int): see corresponding constructor argument
-    ack_bitfield (str): see corresponding constructor argument
-
-    ---
-    Sequence numbers: A sequence of 0 means no packages have been sent or received.
-    After 65535 sequence numbers wrap around to 1, so they can be stored in 2 bytes.
-
-    """
-
-    def __init__(self, sequence: int, ack: int, ack_bitfield: str):
-        self.sequence = Sqn(sequence)
-        self.ack = Sqn(ack)
-        self.ack_bitfield = ack_bitfield
-
-    def to_bytearray(self) -> bytearray:
-        """Return 12 bytes representing the header."""
-        result = bytearray(PROTOCOL_ID)
-        result.extend(self.sequence.to_sqn_bytes())
-        result.extend(self.ack.to_sqn_bytes())
-        result.extend(int(self.ack_bitfield, 2).to_bytes(4, "big"))
-        return result
-
-    def destructure(self) -> tuple:
-        """Return the tuple `(sequence, ack, ack_bitfield)`."""
-        return (self.sequence, self.ack, self.ack_bitfield)
-
-    @classmethod
-    def deconstruct_datagram(cls, datagram: bytes) -> tuple:
-        """Return a tuple containing the header and the rest of the datagram.
-
-        # Arguments
-        datagram (bytes): serialized PyGaSe package to deconstruct
-
-        # Returns
-        tuple: `(header, payload)` with `payload` being a bytestring of the rest of the datagram
-
-        """
-        if datagram[:4] != PROTOCOL_ID:
-            raise ProtocolIDMismatchError
-        sequence = Sqn.from_sqn_bytes(datagram[4:6])
-        ack = Sqn.from_sqn_bytes(datagram[6:8])
-        ack_bitfield = bin(int.from_bytes(datagram[8:12], "big"))[2:].zfill(32)
-        payload = datagram[12:]
-        return (cls(sequence, ack, ack_bitfield), payload)
-
-
-class Package(Comparable):
-    """Create a UDP package implementing the PyGaSe protocol.
-
-    # Arguments
-    header (Header): package header
-
-    # Arguments
-    events (pygase.event.Event): list events to attach to this package
-
-    # Attributes
-    header (Header):
-
-    # Members
-    events (pygase.event.Event): see corresponding constructor argument
-
-    ---
-    PyGaSe servers and clients use the subclasses #ServerPackage and #ClientPackage respectively.
-    The #Package class would also work on its own (it's not an 'abstract' class), in which case you would have
-    all features of PyGaSe except for a synchronized game state.
+    def get_update_since(self, time_order: int) -> GameStateUpdate: ...
 
-    """
-
-    _timeout: float = 1.0  # package timeout in seconds
-    _max_size: int = 2048  # the maximum size of PyGaSe package in bytes
-
-    def __init__(self, header: Header, events: list = None):
-        self.header = header
-        self._events = events if events is not None else []
-        self._datagram: bytes = None
-
-    @property
-    def events(self) -> list:
-        """Get a list of the events in the package."""
-        return self._events.copy()
-
-    def add_event(self, event: Event) -> None:
-        """Add a PyGaSe event to the package.
-
-        # Arguments
-        event (pygase.event.Event): the event to be attached to this package
-
-        # Raises
-        OverflowError: if the package has previously been converted to a datagram and
-           and its size with the added event would exceed #Package._max_size (2048 bytex)
-
-        """
-        if self._datagram is not None:
-            bytepack = event.to_bytes()
-            if len(self._datagram) + len(bytepack) + 2 > self._max_size:
-                raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
-            self._datagram += len(bytepack).to_bytes(2, "big") + bytepack
-        self._events.append(event)
-
-    def get_bytesize(self) -> int:
-        """Return the size in bytes the package has as a datagram."""
-        if self._datagram is None:
-            self._datagram = self.to_datagram()
-        return len(self._datagram)
-
-    def to_datagram(self) -> bytes:
-        """Return package compactly serialized to `bytes`.
-
-        # Raises
-        OverflowError: if the resulting datagram would exceed #Package._max_size
-
-        """
-        if self._datagram is not None:
-            return self._datagram
-        datagram = self.header.to_bytearray()
-        # The header makes up the first 12 bytes of the package
-        datagram.extend(self._create_event_block())
-        if len(datagram) > self._max_size:
-            raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
-        self._datagram = bytes(datagram)
-        return self._datagram
-
-    def _create_event_block(self) -> bytearray:
-        event_block = bytearray()
-        for event in self._events:
-            bytepack = event.to_bytes()
-            event_block.extend(len(bytepack).to_bytes(2, "big"))
-            event_block.extend(bytepack)
-        return event_block
-
-    @classmethod
-    def from_datagram(cls, datagram: bytes) -> "Package":
-        """Deserialize datagram to #Package.
-
-        # Arguments
-        datagram (bytes): bytestring to deserialize, typically received via network
-
-        # Returns
-        Package: the deserialized package
-
-        # Raises
-        ProtocolIDMismatchError: if the first four bytes don't match the PyGaSe protocol ID
-
-        """
-        header, payload = Header.deconstruct_datagram(datagram)
-        events = cls._read_out_event_block(payload)
-        result = cls(header, events)
-        result._datagram = datagram  # pylint: disable=protected-access
-        return result
+    def get_game_state(self) -> GameState: ...
 
-    @staticmethod
-    def _read_out_event_block(event_block: bytes) -> list:
-        events = []
-        while event_block:
-            bytesize = int.from_bytes(event_block[:2], "big")
-            events.append(Event.from_bytes(event_block[2 : bytesize + 2]))
-            event_block = event_block[bytesize + 2 :]
-        return events
+    def get_input_ack(self, client_address: tuple[str, int]) -> Sqn: ...
 
+    async def wait_for_update(self, time_order: int) -> GameStateUpdate: ...
 
-class ClientPackage(Package):
-    """Subclass of #Package for packages sent by PyGaSe clients.
+    def get_time_order_at(self, timestamp: float) -> int: ...
 
-    # Arguments
-    time_order (int): the clients last known time order of the game state
+    def push_update(self, update: GameStateUpdate) -> None: ...
 
-    # Attributes
-    time_order (int): see corresponding constructor argument
 
-    """
+class StatePredictorProtocol(Protocol):
+    """Protocol for client-side state predictors that reconcile with received game states."""
 
-    def __init__(self, header: Header, time_order: int, events: list = None):
-        super().__init__(header, events)
-        self.time_order = Sqn(time_order)
-
-    def to_datagram(self) -> bytes:
-        """Override `Package.to_datagram` to include `time_order`."""
-        if self._datagram is not None:
-            return self._datagram
-        datagram = self.header.to_bytearray()
-        # The header makes up the first 12 bytes of the package
-        datagram.extend(self.time_order.to_sqn_bytes())
-        datagram.extend(self._create_event_block())
-        if len(datagram) > self._max_size:
-            raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
-        self._datagram = bytes(datagram)
-        return self._datagram
-
-    @classmethod
-    def from_datagram(cls, datagram: bytes) -> "ClientPackage":
-        """Override #Package.from_datagram to include `time_order`."""
-        header, payload = Header.deconstruct_datagram(datagram)
-        time_order = Sqn.from_sqn_bytes(payload[:2])
-        payload = payload[2:]
-        events = cls._read_out_event_block(payload)
-        result = cls(header, time_order, events)
-        result._datagram = datagram  # pylint: disable=protected-access
-        return result
-
-
-class ServerPackage(Package):
-    """Subclass of #Package for packages sent by PyGaSe servers.
-
-    # Arguments
-    game_state_update (pygase.gamestate.GameStateUpdate): the servers most recent minimal update for the client
-
-    """
-
-    def __init__(self, header: Header, game_state_update: GameStateUpdate, events: list = None):
-        super().__init__(header, events)
-        self.game_state_update = game_state_update
-
-    def to_datagram(self) -> bytes:
-        """Override #Package.to_datagram to include `game_state_update`."""
-        if self._datagram is not None:
-            return self._datagram
-        datagram = self.header.to_bytearray()
-        # The header makes up the first 12 bytes of the package
-        state_update_bytepack = self.game_state_update.to_bytes()
-        datagram.extend(len(state_update_bytepack).to_bytes(2, "big"))
-        datagram.extend(state_update_bytepack)
-        datagram.extend(self._create_event_block())
-        if len(datagram) > self._max_size:
-            raise OverflowError("package exceeds the maximum size of " + str(self._max_size) + " bytes")
-        self._datagram = bytes(datagram)
-        return self._datagram
-
-    @classmethod
-    def from_datagram(cls, datagram: bytes) -> "ServerPackage":
-        """Override #Package.from_datagram to include `game_state_update`."""
-        header, payload = Header.deconstruct_datagram(datagram)
-        state_update_bytesize = int.from_bytes(payload[:2], "big")
-        game_state_update = cast(GameStateUpdate, GameStateUpdate.from_bytes(payload[2 : state_update_bytesize + 2]))
-        payload = payload[state_update_bytesize + 2 :]
-        events = cls._read_out_event_block(payload)
-        result = cls(header, game_state_update, events)
-        result._datagram = datagram  # pylint: disable=protected-access
-        return result
+    def reconcile(self, game_state: GameState, input_ack: Sqn) -> None: ...
 
 
 class ConnectionStatus(IntEnum):
@@ -364,13 +121,31 @@ class Connection:
     local_sequence (pygase.utils.Sqn): sequence number of the last sent package
     remote_sequence (pygase.utils.Sqn): sequence number of the last received package
     ack_bitfield (str): acks for the 32 packages prior to `self.remote_sequence`
-    latency (float): the last registered RTT (round trip time)
+    rtt (pygase.utils.RttEstimator): smoothed RTT (round trip time), its variation and the timeout after which
+        a sent package counts as lost, which is derived from them; `rtt.summary()` returns min, avg and p99 RTT
     status (ConnectionStatus): enum value that informs about the state of the connections
     quality (str): either `'good'` or `'bad'` depending on latency, used internally for
         congestion avoidance
+    send_jitter (pygase.utils.JitterStats): how late packages were sent compared to schedule
+    coalescing_keys (dict): maps types of events of which only the latest pending one is sent to the handler
+        argument that distinguishes them (position in `handler_args` or name in `handler_kwargs`), or `None`
+    precise_timing (bool): whether packages are sent on absolute deadlines via #pygase.aio.sleep_until(),
+        which spins for the last `_spin_time` seconds before each deadline (defaults to the class attribute)
+
+    # Members
+    latency (float): the smoothed RTT in seconds
 
     ---
-    PyGaSe servers and clients use the subclasses #ServerConnection and #ClientConnection respectively.
+    Events dispatched with `delivery='reliable'` are resent as soon as the ack bitfields of received packages
+    show that the package carrying them was lost, see #pygase.packages.ReliableEventChannel. The receiving side
+    handles every reliable event once, and events dispatched with `delivery='ordered'` only after all reliable
+    events dispatched before them.
+
+    While neither side has anything to send, #pygase.server.ServerConnection and #ClientConnection become idle and
+    only send a keepalive package every `_idle_interval` seconds, well within the connection timeout. They resume
+    the normal send rate as soon as either side has events or game state changes to send again.
+
+    PyGaSe servers and clients use the subclasses #pygase.server.ServerConnection and #ClientConnection respectively.
     The #Connection class would also work on its own (it's not an 'abstract' class), in which case you would have
     all features of PyGaSe except for a synchronized game state.
 
@@ -384,6 +159,13 @@ class Connection:
         "bad": 1 / 20,
     }  # maps connection.quality to time between sent packages in seconds
     _latency_threshold: float = 0.25  # latency that will trigger throttling
+    precise_timing: bool = False  # default for sending packages on absolute deadlines via aio.sleep_until
+    _spin_time: float = 0.002  # time in seconds before a send deadline in which precise timing stops sleeping
+    _loss_inference_distance: int = 3  # number of newer acked sequences after which a package counts as lost
+    _max_events_per_package: int = 5  # maximum number of events sent with one package
+    _idle_interval: float = 0.5  # time in seconds between keepalive packages of an idle connection
+    _min_package_timeout: float = 0.2  # lower bound of the RTT based package timeout in seconds
+    _max_package_timeout: float = 3.0  # upper bound of the RTT based package timeout in seconds
 
     def __init__(
         self,
@@ -398,17 +180,64 @@ class Connection:
         self.local_sequence = Sqn(0)
         self.remote_sequence = Sqn(0)
         self.ack_bitfield = "0" * 32
-        self.latency = 0.0
+        self.rtt = RttEstimator(
+            Package._timeout,  # pylint: disable=protected-access
+            self._min_package_timeout,
+            self._max_package_timeout,
+        )
         self.status = ConnectionStatus.DISCONNECTED
         self.quality = "good"  # this is used for congestion avoidance
         self._package_interval = self._package_intervals["good"]
-        self._outgoing_event_queue = aio.UniversalQueue()
-        self._incoming_event_queue = aio.UniversalQueue()
+        self.send_jitter = JitterStats()
+        self.coalescing_keys: dict[str, int | str | None] = {}
+        self._outgoing_event_queue = aio.UniversalQueue(
+            overflow_key=lambda item: item[0].type, on_drop=self._handle_dropped_outgoing_event
+        )
+        self._incoming_event_queue = aio.UniversalQueue(overflow_key=lambda event: event.type)
         self._pending_acks: dict = {}
         self._event_callback_sequence = Sqn(0)
         self._events_with_callbacks: dict = {}
         self._event_callbacks: dict = {}
         self._last_recv = time.time()
+        self._reliable_channel = ReliableEventChannel()
+
+    def set_queue_limit(self, queue: str, maxsize: int, policy: str = "drop_oldest") -> None:
+        """Bound the number of pending items in one of the connection's queues.
+
+        # Arguments
+        queue (str): `'outgoing_events'` or `'incoming_events'` (or `'commands'` for client connections)
+        maxsize (int): maximum number of pending items, `0` for no limit
+        policy (str): `'drop_oldest'`, `'drop_newest'`, `'coalesce'` (keep the latest event of each type)
+            or `'block'`, see #pygase.aio.UniversalQueue
+
+        # Raises
+        KeyError: if `queue` is unknown
+        ValueError: if `policy` is unknown, or `'block'` for the outgoing event queue, as events are dispatched
+            synchronously
+
+        ---
+        Reliable events that overflow the outgoing event queue are resent like lost events instead of being dropped.
+        The callbacks of other dropped events are never invoked.
+
+        """
+        if queue == "outgoing_events" and policy == "block":
+            raise ValueError("Dispatching events can't block, choose a policy that drops or coalesces events.")
+        self._get_queues()[queue].set_limit(maxsize, policy)
+
+    def get_queue_overflows(self) -> dict[str, int]:
+        """Return how many items have been put into each of the connection's queues while it was full."""
+        return {name: queue.overflow_count for name, queue in self._get_queues().items()}
+
+    def _get_queues(self) -> dict[str, aio.UniversalQueue]:
+        return {"outgoing_events": self._outgoing_event_queue, "incoming_events": self._incoming_event_queue}
+
+    def _handle_dropped_outgoing_event(self, item: tuple) -> None:
+        """Clean up after an event has been dropped from the full outgoing event queue."""
+        event, callback_sequence, _ = item
+        logger.debug(f"Outgoing event queue for {self.remote_address} overflowed with event of type {event.type}.")
+        if event.reliable_id:
+            self._reliable_channel.schedule_resend(Sqn(event.reliable_id))
+        self._event_callbacks.pop(callback_sequence, None)
 
     def _update_remote_info(self, received_sequence: Sqn) -> None:
         """Update `self.remote_sequence` and `self.ack_bitfield`."""
@@ -450,48 +279,57 @@ class Connection:
             sequence_diff = ack - pending_sequence
             if sequence_diff == 0 or (0 < sequence_diff < 32 and ack_bitfield[sequence_diff - 1] == "1"):
                 await self._handle_ack(pending_sequence)
-            elif (
-                time.time() - self._pending_acks[pending_sequence]
-                > Package._timeout  # pylint: disable=protected-access
-            ):
+            elif time.time() - self._pending_acks[pending_sequence] > self.rtt.rto:
                 await self._handle_timeout(pending_sequence)
+            elif sequence_diff >= self._loss_inference_distance:
+                self._reliable_channel.handle_loss(pending_sequence)
         for event in package.events:
-            await self._incoming_event_queue.put(event)
-            logger.debug(f"Received event of type {event.type} from {self.remote_address}.")
-            if self.event_wire is not None:
-                logger.debug("Pushing event to event wire.")
-                await self.event_wire._push_event(event)  # pylint: disable=protected-access
+            received_events = self._reliable_channel.receive(event) if event.reliable_id else [event]
+            for received_event in received_events:
+                if not self._accept_event(received_event):
+                    continue
+                await self._incoming_event_queue.put(received_event)
+                logger.debug(f"Received event of type {received_event.type} from {self.remote_address}.")
+                if self.event_wire is not None:
+                    logger.debug("Pushing event to event wire.")
+                    await self.event_wire._push_event(received_event)  # pylint: disable=protected-access
+
+    def _accept_event(self, event: Event) -> bool:
+        """Return whether a received event is to be handled, which subclasses can override to drop events."""
+        del event
+        return True
 
     async def _handle_ack(self, acked_sequence: Sqn) -> None:
         self._update_latency(time.time() - self._pending_acks[acked_sequence])
-        if acked_sequence in self._events_with_callbacks:
-            for event_sequence in self._events_with_callbacks[acked_sequence]:
-                if self._event_callbacks[event_sequence]["ack"] is not None:
-                    if iscoroutinefunction(self._event_callbacks[event_sequence]["ack"]):
-                        await self._event_callbacks[event_sequence]["ack"]()
-                    else:
-                        self._event_callbacks[event_sequence]["ack"]()
-                    del self._event_callbacks[event_sequence]
-            del self._events_with_callbacks[acked_sequence]
+        for event_sequence in self._events_with_callbacks.pop(acked_sequence, []):
+            await self._run_event_callback(event_sequence, "ack")
+        for event_sequence in self._reliable_channel.acknowledge(acked_sequence):
+            await self._run_event_callback(event_sequence, "ack")
         del self._pending_acks[acked_sequence]
 
     async def _handle_timeout(self, timed_out_sequence: Sqn) -> None:
-        if timed_out_sequence in self._events_with_callbacks:
-            for event_sequence in self._events_with_callbacks[timed_out_sequence]:
-                if self._event_callbacks[event_sequence]["timeout"] is not None:
-                    if iscoroutinefunction(self._event_callbacks[event_sequence]["timeout"]):
-                        await self._event_callbacks[event_sequence]["timeout"]()
-                    else:
-                        self._event_callbacks[event_sequence]["timeout"]()
-                    del self._event_callbacks[event_sequence]
-            del self._events_with_callbacks[timed_out_sequence]
+        for event_sequence in self._events_with_callbacks.pop(timed_out_sequence, []):
+            await self._run_event_callback(event_sequence, "timeout")
+        self._reliable_channel.handle_loss(timed_out_sequence)
         del self._pending_acks[timed_out_sequence]
 
+    async def _run_event_callback(self, event_sequence: int, callback_type: str) -> None:
+        """Invoke the ack or timeout callback of a dispatched event, if there is one."""
+        callbacks = self._event_callbacks.pop(event_sequence, None)
+        if callbacks is None or callbacks[callback_type] is None:
+            return
+        if iscoroutinefunction(callbacks[callback_type]):
+            await callbacks[callback_type]()
+        else:
+            callbacks[callback_type]()
+
     def dispatch_event(
         self,
         event: Event,
         ack_callback: Callable[[], object] | None = None,
         timeout_callback: Callable[[], object] | None = None,
+        delivery: str = "unreliable",
+        bytepack: bytes | None = None,
     ) -> None:
         """Send an event to the connection partner.
 
@@ -499,19 +337,53 @@ class Connection:
         event (pygase.event.Event): the event to dispatch
         ack_callback (callable, coroutine): will be executed after the event was received
         timeout_callback (callable, coroutine): will be executed if the event was not received
+        delivery (str): `'unreliable'` to send the event once, `'reliable'` to resend it until it is received,
+            or `'ordered'` to also handle it only after all reliable events dispatched before it
+        bytepack (bytes): `event.to_bytes()`, so an event that is dispatched via several connections
+            is only serialized once (ignored for reliable events, which get a message ID per connection)
+
+        # Raises
+        ValueError: if `delivery` is unknown or a `timeout_callback` is given for a reliable event,
+            which never times out
 
         ---
         Using long-running blocking operations in any of the callback functions can disturb the connection.
 
+        An unreliable event without callbacks whose type is in `coalescing_keys` replaces a pending event of the
+        same type (and the same value of the coalescing argument) in the outgoing queue.
+
         """
+        if delivery not in ("unreliable", "reliable", "ordered"):
+            raise ValueError(f"Unknown event delivery '{delivery}'.")
+        reliable = delivery != "unreliable"
+        if reliable and timeout_callback is not None:
+            raise ValueError("Reliable events are resent until they are received and don't time out.")
         callback_sequence = 0
         if ack_callback is not None or timeout_callback is not None:
             self._event_callback_sequence += 1
             callback_sequence = self._event_callback_sequence
             self._event_callbacks[self._event_callback_sequence] = {"ack": ack_callback, "timeout": timeout_callback}
-        self._outgoing_event_queue.put((event, callback_sequence))
+        if reliable:
+            event = self._reliable_channel.track(event, callback_sequence, ordered=delivery == "ordered")
+            callback_sequence = 0
+            bytepack = None
+        coalescing_key = None
+        if not reliable and callback_sequence == 0:
+            coalescing_key = self._get_coalescing_key(event)
+        self._outgoing_event_queue.put((event, callback_sequence, bytepack), key=coalescing_key)
         logger.debug(f"Dispatched event of type {event.type} to be sent to {self.remote_address}.")
 
+    def _get_coalescing_key(self, event: Event) -> tuple | None:
+        """Return the key under which `event` replaces pending events in the outgoing queue, if it has one."""
+        if event.type not in self.coalescing_keys:
+            return None
+        argument = self.coalescing_keys[event.type]
+        if isinstance(argument, int):
+            value = event.handler_args[argument] if argument < len(event.handler_args) else None
+        else:
+            value = None if argument is None else event.handler_kwargs.get(argument)
+        return (event.type, value)
+
     async def _handle_next_event(self) -> None:
         """Handle an event from the incoming event queue.
 
@@ -543,12 +415,20 @@ class Connection:
         This coroutine, once spawned, will keep sending packages to the remote_address until it is explicitly
         cancelled or the connection times out.
 
+        If `precise_timing` is set, packages are sent on absolute deadlines via #pygase.aio.sleep_until().
+        Otherwise, the next deadline is one package interval after the previous one or, if the package was sent
+        late, after the package was sent.
+
         # Arguments
         sock (aio.io.Socket): socket via which to send the packages
 
         """
         logger.debug(f"Starting to send packages to {self.remote_address} every {self._package_interval} seconds.")
         congestion_avoidance_task = asyncio.create_task(self._congestion_avoidance_monitor())
+        # Absolute deadlines are measured with the high-resolution clock, relative sleeps with the wall clock.
+        clock = time.perf_counter if self.precise_timing else time.time
+        next_send = None
+        last_send = None
         while True:
             try:
                 t0 = time.time()
@@ -556,8 +436,18 @@ class Connection:
                     logger.warning(f"Connection to {self.remote_address} timed out after {self._timeout} seconds.")
                     self._set_status(ConnectionStatus.DISCONNECTED)
                     break
-                await self._send_next_package(sock)
-                await aio.sleep(max([self._package_interval - time.time() + t0, 0]))
+                send_start = clock()
+                if next_send is not None:
+                    self.send_jitter.record(send_start - next_send)
+                if last_send is None or not self._is_idle() or send_start - last_send >= self._idle_interval:
+                    await self._send_next_package(sock)
+                    last_send = send_start
+                # Packages sent ahead of schedule (tick-aligned or flushed) don't move the schedule forward,
+                # so the average send rate never exceeds one package per package interval.
+                if next_send is None or not self.precise_timing and send_start > next_send:
+                    next_send = send_start
+                next_send = max(next_send + self._package_interval, clock())
+                await self._sleep_until_next_send(next_send, clock)
             except asyncio.CancelledError:
                 break
         logger.debug(f"Stopped sending packages to {self.remote_address}.")
@@ -565,6 +455,13 @@ class Connection:
         with suppress(asyncio.CancelledError):
             await congestion_avoidance_task
 
+    async def _sleep_until_next_send(self, next_send: float, clock: Callable[[], float]) -> None:
+        """Sleep until `clock()` reaches `next_send`, when the next package is due."""
+        if self.precise_timing:
+            await aio.sleep_until(next_send, self._spin_time)
+        else:
+            await aio.sleep(max([next_send - clock(), 0]))
+
     def _create_next_package(self) -> Package:
         """Create a package with the correct header to send next."""
         return Package(Header(self.local_sequence, self.remote_sequence, self.ack_bitfield))
@@ -572,6 +469,7 @@ class Connection:
     async def _send_next_package(self, sock: aio.AsyncSocket) -> None:
         """Send a package with up to 5 events.
 
+        Reliable events that have to be resent take precedence over newly dispatched events.
         This coroutine returns once the package is sent.
 
         # Arguments
@@ -580,8 +478,10 @@ class Connection:
         """
         self.local_sequence += 1
         package = self._create_next_package()
-        while len(package.events) < 5 and not self._outgoing_event_queue.empty():
-            event, callback_sequence = await self._outgoing_event_queue.get()
+        for event in self._reliable_channel.pop_resends(self._max_events_per_package):
+            package.add_event(event)
+        while len(package.events) < self._max_events_per_package and not self._outgoing_event_queue.empty():
+            event, callback_sequence, bytepack = await self._outgoing_event_queue.get()
             if callback_sequence != 0:
                 if self.local_sequence not in self._events_with_callbacks:
                     self._events_with_callbacks[self.local_sequence] = [callback_sequence]
@@ -593,24 +493,49 @@ class Connection:
                     f"event data: handler_args = {event.handler_args}, handler_kwargs = {event.handler_kwargs}"
                 )
             )
-            package.add_event(event)
+            package.add_event(event, bytepack)
             await self._outgoing_event_queue.task_done()
+        self._reliable_channel.record_sent(package.header.sequence, package.events)
         await sock.sendto(package.to_datagram(), self.remote_address)
         logger.debug(f"Sent package with sequence number {package.header.sequence} to {self.remote_address}.")
-        self._pending_acks[package.header.sequence] = time.time()
+        # Keepalive packages carry nothing to acknowledge, and their acks are delayed by the idle partner.
+        if package.events or not self._is_idle():
+            self._pending_acks[package.header.sequence] = time.time()
+
+    def _is_idle(self) -> bool:
+        """Return whether both sides have nothing to send, so only keepalive packages are needed.
+
+        A bare #Connection never idles, as it can't tell whether its partner has something to send.
+
+        """
+        return False
+
+    def _has_events_to_send(self) -> bool:
+        """Return whether there are dispatched events or unacked reliable events."""
+        return not (self._outgoing_event_queue.empty() and self._reliable_channel.is_settled())
 
     def _set_status(self, status: ConnectionStatus) -> None:
         """Set `self.status` to a new #ConnectionStatus value."""
         self.status = status
         logger.info(f"Status of connection to {self.remote_address} set to '{status.name}'.")
 
+    @property
+    def latency(self) -> float:
+        """Get the smoothed round trip time in seconds."""
+        return self.rtt.srtt
+
+    @latency.setter
+    def latency(self, value: float) -> None:
+        """Override the smoothed round trip time, e.g. to simulate network conditions."""
+        self.rtt.srtt = value
+
     def _update_latency(self, rtt: float) -> None:
-        """Update `self.latency` according to a measured rount trip time.
+        """Update `self.rtt` according to a measured round trip time.
 
-        Network jitter is filtered through a moving exponential average.
+        Network jitter is filtered through the smoothed RTT and RTT variation of RFC 6298.
 
         """
-        self.latency += 0.1 * (rtt - self.latency)
+        self.rtt.record(rtt)
 
     async def _congestion_avoidance_monitor(self) -> None:
         """Continously monitor connection quality and throttle if needed.
@@ -679,14 +604,75 @@ class ClientConnection(Connection):
 
     # Attributes
     game_state_context (pygase.utils.LockedResource): provides thread-safe access to a #pygase.GameState
+    state_subscriptions (pygase.gamestate.StateSubscriptions): callbacks for key paths touched by received updates
+    interpolation_buffer (pygase.gamestate.InterpolationBuffer): optional buffer that receives a time-stamped
+        snapshot of the game state after each applied update
+    predictor (pygase.client.StatePredictor): optional predictor that is reconciled with the game state
+        after each applied update
+    flush_event_types (set): types of events that are sent immediately when dispatched, see #ClientConnection.flush()
+    server_clock (pygase.utils.ClockSync): estimates the server's clock from the timestamps that client and
+        server packages carry
 
     """
 
+    _min_flush_interval: float = 0.005  # minimum time in seconds between a flushed package and the previous one
+
     def __init__(self, remote_address: tuple[str, int], event_handler: EventHandlerProtocol) -> None:
         super().__init__(remote_address, event_handler)
         self._command_queue = aio.UniversalQueue()
         self.game_state_context = LockedResource(GameState())
+        self.state_subscriptions = StateSubscriptions()
+        self.interpolation_buffer: InterpolationBuffer | None = None
+        self.predictor: StatePredictorProtocol | None = None
         self._game_state_update_lock = asyncio.Lock()
+        self.flush_event_types: set[str] = set()
+        self._flush_requested = False
+        self._flush_notifier = aio.Notifier()
+        self._server_idle = False
+        self.server_clock = ClockSync()
+
+    def _get_queues(self) -> dict[str, aio.UniversalQueue]:
+        return {**super()._get_queues(), "commands": self._command_queue}
+
+    def dispatch_event(
+        self,
+        event: Event,
+        ack_callback: Callable[[], object] | None = None,
+        timeout_callback: Callable[[], object] | None = None,
+        delivery: str = "unreliable",
+        bytepack: bytes | None = None,
+    ) -> None:
+        """Extend #Connection.dispatch_event to flush events whose type is in `flush_event_types`."""
+        super().dispatch_event(event, ack_callback, timeout_callback, delivery, bytepack)
+        if event.type in self.flush_event_types:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send the next package with the pending events as soon as possible, instead of at the next send interval.
+
+        The package is sent no sooner than `_min_flush_interval` seconds after the previous one. While the
+        connection is throttled due to bad quality, flushing has no effect, so it doesn't add to the congestion.
+        This method is thread-safe.
+
+        """
+        self._flush_requested = True
+        self._flush_notifier.notify()
+
+    async def _sleep_until_next_send(self, next_send: float, clock: Callable[[], float]) -> None:
+        """Extend #Connection._sleep_until_next_send to wake up early when the connection is flushed."""
+        if self.quality != "good":
+            await super()._sleep_until_next_send(next_send, clock)
+            return
+        sent_at = clock()
+        sleep_task = asyncio.create_task(super()._sleep_until_next_send(next_send, clock))
+        flush_task = asyncio.create_task(self._flush_notifier.wait_for(lambda: self._flush_requested))
+        try:
+            done, _ = await asyncio.wait((sleep_task, flush_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sleep_task.cancel()
+            flush_task.cancel()
+        if sleep_task not in done:
+            await super()._sleep_until_next_send(sent_at + self._min_flush_interval, clock)
 
     def shutdown(self, shutdown_server: bool = False) -> None:
         """Shut down the client connection.
@@ -714,10 +700,17 @@ class ClientConnection(Connection):
             )
         )
 
+    def _is_idle(self) -> bool:
+        """Override #Connection._is_idle to idle while there are no events and the server sends no updates."""
+        return self._server_idle and not self._has_events_to_send()
+
     def _create_next_package(self) -> ClientPackage:
-        """Override #Connection._create_next_package to send a #ClientPackage."""
+        """Override #Connection._create_next_package to send a #pygase.packages.ClientPackage."""
+        self._flush_requested = False
         time_order = self.game_state_context.resource.time_order
-        return ClientPackage(Header(self.local_sequence, self.remote_sequence, self.ack_bitfield), time_order)
+        return ClientPackage(
+            Header(self.local_sequence, self.remote_sequence, self.ack_bitfield), time_order, timestamp=time.time()
+        )
 
     def loop(self) -> None:
         """Continuously operate the connection.
@@ -756,17 +749,49 @@ class ClientConnection(Connection):
     async def _recv(self, package: Package) -> None:
         """Extend #Connection._recv to update the game state."""
         await super()._recv(package)
+        if not isinstance(package, ServerPackage):
+            return
+        sent, echoed, held = package.timestamps
+        if echoed:
+            self.server_clock.record_exchange(echoed, sent - held, sent, time.time())
+        update_is_new = await self._apply_update(package)
+        self._server_idle = not package.events and not (update_is_new and package.game_state_update.data)
+        if update_is_new:
+            await self._dispatch_state_subscriptions(package.game_state_update)
+
+    async def _apply_update(self, package: ServerPackage) -> bool:
+        """Apply the game state update of a received package and return whether it was new.
+
+        Subclasses can override this method to keep the game state somewhere else.
+
+        """
         async with self._game_state_update_lock:
             with self.game_state_context:
-                if isinstance(package, ServerPackage):
-                    logger.debug(
-                        (
-                            f"Updating game state from time order "
-                            f"{self.game_state_context.resource.time_order} to "
-                            f"{package.game_state_update.time_order}."
-                        )
+                logger.debug(
+                    (
+                        f"Updating game state from time order "
+                        f"{self.game_state_context.resource.time_order} to "
+                        f"{package.game_state_update.time_order}."
                     )
-                    self.game_state_context.resource += package.game_state_update
+                )
+                update_is_new = package.game_state_update > self.game_state_context.resource
+                self.game_state_context.resource += package.game_state_update
+            # Snapshots are copied outside of the game state context, so they don't block readers.
+            # Holding the asyncio lock is enough, since the game state is only written in this event loop.
+            if update_is_new and self.interpolation_buffer is not None:
+                self.interpolation_buffer.push(self.game_state_context.resource, time.time())
+            if update_is_new and self.predictor is not None:
+                self.predictor.reconcile(self.game_state_context.resource, package.input_ack)
+        return update_is_new
+
+    async def _dispatch_state_subscriptions(self, update: GameStateUpdate) -> None:
+        """Invoke the callbacks subscribed to key paths contained in an applied update."""
+        for callback, path, value in self.state_subscriptions.match(update):
+            logger.debug(f"Dispatching state change of key path {path} to subscribed callback.")
+            if iscoroutinefunction(callback):
+                await callback(path, value)
+            else:
+                callback(path, value)
 
     async def _client_recv_loop(self, sock: aio.AsyncSocket) -> None:
         """Continuously handle packages received from the server.
@@ -786,137 +811,8 @@ class ClientConnection(Connection):
                 data = await sock.recv(ServerPackage._max_size)  # pylint: disable=protected-access
                 package = ServerPackage.from_datagram(data)
                 await self._recv(package)
+            except ProtocolIDMismatchError:
+                logger.warning(f"Received unknown package from {self.remote_address}.")
             except asyncio.CancelledError:
                 break
         logger.debug(f"Stopped receiving packages from {self.remote_address}.")
-
-
-class ServerConnection(Connection):
-    """Subclass of #Connection that describes the server side of a PyGaSe connection.
-
-    # Arguments
-    game_state_store (pygase.GameStateStore): object that serves as an interface to the game state repository
-        (has to provide the methods `get_gamestate`, `get_update_cache` and `push_update`)
-    last_client_time_order (pygase.utils.Sqn): the last time order number known to the client
-
-    # Attributes
-    game_state_store (pygase.GameStateStore): see corresponding constructor argument
-    last_client_time_order (pygase.utils.Sqn): see corresponding constructor argument
-
-    """
-
-    def __init__(
-        self,
-        remote_address: tuple[str, int],
-        event_handler: EventHandlerProtocol,
-        game_state_store: GameStateStoreProtocol,
-        last_client_time_order: Sqn,
-        event_wire: EventWire | None = None,
-    ):
-        super().__init__(remote_address, event_handler, event_wire)
-        self.game_state_store = game_state_store
-        self.last_client_time_order = last_client_time_order
-
-    def _create_next_package(self) -> ServerPackage:
-        """Override #Connection._create_next_package to include game state updates."""
-        update_cache = self.game_state_store.get_update_cache()
-        # Respond by sending the sum of all updates since the client's time-order point.
-        # Or the whole game state if the client doesn't have it yet.
-        if self.last_client_time_order == 0:
-            logger.debug(f"Sending full game state to client {self.remote_address}.")
-            game_state = self.game_state_store.get_game_state()
-            update = GameStateUpdate(**game_state.__dict__)
-        else:
-            update_base = GameStateUpdate(self.last_client_time_order)
-            update = sum((upd for upd in update_cache if upd > update_base), update_base)
-            logger.debug(
-                (
-                    f"Sending update from time order {self.last_client_time_order} "
-                    f"to {update.time_order} to client {self.remote_address}."
-                )
-            )
-        return ServerPackage(Header(self.local_sequence, self.remote_sequence, self.ack_bitfield), update)
-
-    async def _recv(self, package: Package) -> None:
-        """Extend #Connection._recv to update `self.last_client_time_order`."""
-        await super()._recv(package)
-        if isinstance(package, ClientPackage):
-            self.last_client_time_order = package.time_order
-
-    @classmethod
-    async def loop(cls, hostname: str, port: int, server: object, event_wire: EventWire | None) -> None:
-        """Continously orchestrate and operate connections to clients.
-
-        This coroutine will keep listening for client packages, create new #ServerConnection objects
-        when necessary and make sure all packages are handled by and sent via the right connection.
-
-        It will return as soon as the server receives a shutdown message.
-
-        # Arguments
-        hostname (str): the hostname or IPv4 address to which to bind the server socket
-        port (int): the port number to which to bind the server socket
-        server (pygase.Server): the server for which this loop is run
-        event_wire (pygase.GameStateMachine): object to which events are to be repeated
-           (has to implement a `_push_event` method)
-
-        """
-        logger.info(f"Trying to run server on {(hostname, port)} ...")
-        server_state = cast(ServerProtocol, server)
-        async with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.bind((hostname, port))
-            server_state._hostname, server_state._port = sock.getsockname()  # pylint: disable=protected-access
-            async with asyncio.TaskGroup() as connection_tasks:
-                connection_loop_tasks = []
-                logger.info(
-                    f"Server successfully started and listening to packages from clients on {(hostname, port)}."
-                )
-                while True:
-                    data, client_address = await sock.recvfrom(Package._max_size)  # pylint: disable=protected-access
-                    try:
-                        package = ClientPackage.from_datagram(data)
-                        # Create new connection if client is unknown.
-                        if client_address not in server_state.connections:
-                            logger.info(f"New client connection from {client_address}.")
-                            new_connection = cls(
-                                client_address,
-                                server_state._universal_event_handler,  # pylint: disable=protected-access
-                                server_state.game_state_store,
-                                package.time_order,
-                                event_wire,
-                            )
-                            connection_loop_tasks.append(
-                                connection_tasks.create_task(new_connection._send_loop(sock))
-                            )  # pylint: disable=protected-access
-                            connection_loop_tasks.append(
-                                connection_tasks.create_task(new_connection._event_loop())
-                            )  # pylint: disable=protected-access
-                            # For now, the first client connection becomes host.
-                            if server_state.host_client is None:
-                                logger.info(f"Setting {client_address} as client with host permissions.")
-                                server_state.host_client = client_address
-                            server_state.connections[client_address] = new_connection
-                        elif server_state.connections[client_address].status == ConnectionStatus.DISCONNECTED:
-                            # Start sending packages again, which will also set status to "Connected".
-                            logger.info(f"Client reconnecting from {client_address}.")
-                            connection_loop_tasks.append(
-                                connection_tasks.create_task(server_state.connections[client_address]._send_loop(sock))
-                            )  # pylint: disable=protected-access
-                        for event in package.events:
-                            event.handler_kwargs["client_address"] = client_address
-                        await server_state.connections[client_address]._recv(
-                            package
-                        )  # pylint: disable=protected-access
-                    except ProtocolIDMismatchError:
-                        # ignore all non-PyGaSe packages
-                        try:
-                            if data.decode("utf-8") == "shutdown" and client_address == server_state.host_client:
-                                logger.info(f"Received shutdown command from host client {client_address}.")
-                                break
-                            if data.decode("utf-8") == "shut_me_down":
-                                break
-                            logger.warning("Received unknown package.")
-                        except UnicodeDecodeError:
-                            logger.warning("Received unknown package.")
-                logger.info(f"Shutting down server on {(hostname, port)}.")
-                for task in connection_loop_tasks:
-                    task.cancel()
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""Store many entities of a game state in columnar tables.
+
+Entity tables require [NumPy](https://numpy.org/), which is an optional dependency of PyGaSe
+(`pip install pygase[entities]`).
+
+### Contents
+- #EntityTable: class for game state attributes that store entity components as NumPy arrays
+- #EntityTableUpdate: class for the changed rows of an #EntityTable, which can be part of a *GameStateUpdate*
+- #encode_entity_tables: function that packs entity tables and their updates into serializable dicts
+- #decode_entity_tables: function that restores entity table updates from packed dicts
+
+"""
+
+import copy
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is an optional dependency
+    np = None
+
+# key that marks packed entity table updates in serialized game state updates
+ENTITY_TABLE_KEY: str = "__entity_table__"
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("Entity tables require numpy, install it via 'pip install pygase[entities]'.")
+
+
+class EntityTableUpdate:
+    """Express changes to the rows of an #EntityTable.
+
+    Updates contain new component values only for the entities that changed, separately for each component,
+    as well as the IDs of removed entities. Setting a component of an entity that doesn't exist yet adds the
+    entity, with all of its other components set to zero. Use #EntityTable.diff() to create updates from the
+    results of vectorized calculations.
+
+    # Arguments
+    columns (dict): maps component names to `(entity_ids, values)` tuples of arrays of the same length
+    removed (list): IDs of entities to remove, removals are applied before the new component values
+    replace (bool): whether the update contains a complete table that replaces the existing one
+
+    # Attributes
+    columns (dict): see corresponding constructor argument
+    removed (numpy.ndarray): see corresponding constructor argument
+    replace (bool): see corresponding constructor argument
+
+    """
+
+    def __init__(
+        self,
+        columns: Mapping[str, tuple[Iterable[int], Iterable[Any]]] | None = None,
+        removed: Iterable[int] = (),
+        replace: bool = False,
+    ):
+        _require_numpy()
+        self.columns: dict[str, tuple[Any, Any]] = {}
+        for name, (entity_ids, values) in (columns or {}).items():
+            entity_ids, values = np.asarray(entity_ids, dtype=np.int64), np.asarray(values)
+            if len(entity_ids) != len(values):
+                raise ValueError(f"Number of entity IDs and values of component '{name}' don't match.")
+            self.columns[name] = (entity_ids, values)
+        self.removed = np.asarray(list(removed), dtype=np.int64)
+        self.replace = replace
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, EntityTableUpdate):
+            return False
+        return (
+            self.replace == other.replace
+            and np.array_equal(self.removed, other.removed)
+            and self.columns.keys() == other.columns.keys()
+            and all(
+                np.array_equal(entity_ids, other.columns[name][0]) and np.array_equal(values, other.columns[name][1])
+                for name, (entity_ids, values) in self.columns.items()
+            )
+        )
+
+    def __bool__(self) -> bool:
+        return self.replace or bool(len(self.removed)) or any(len(ids) for ids, _ in self.columns.values())
+
+    def combine(self, other: "EntityTableUpdate") -> "EntityTableUpdate":
+        """Return a new update with the effect of this update followed by `other`.
+
+        Neither update is changed, so updates can be combined while being shared by multiple consumers.
+
+        """
+        if other.replace:
+            return other
+        columns = {}
+        for name, (entity_ids, values) in self.columns.items():
+            keep = ~np.isin(entity_ids, other.removed)
+            columns[name] = (entity_ids[keep], values[keep])
+        for name, (entity_ids, values) in other.columns.items():
+            if name not in columns:
+                columns[name] = (entity_ids, values)
+                continue
+            all_ids = np.concatenate((columns[name][0], entity_ids))
+            all_values = np.concatenate((columns[name][1], values))
+            # Keep the last occurrence of each entity ID, i.e. the value from `other`.
+            _, reversed_index = np.unique(all_ids[::-1], return_index=True)
+            last_index = np.sort(len(all_ids) - 1 - reversed_index)
+            columns[name] = (all_ids[last_index], all_values[last_index])
+        removed = np.union1d(self.removed, other.removed)
+        return EntityTableUpdate(columns, removed, self.replace)
+
+    def to_dict(self) -> dict:
+        """Return a serializable representation in which all arrays are packed into bytestrings."""
+        return {
+            ENTITY_TABLE_KEY: 1,
+            "replace": self.replace,
+            "removed": self.removed.astype("<i8").tobytes(),
+            "columns": {
+                name: [values.dtype.str, list(values.shape[1:]), entity_ids.astype("<i8").tobytes(), values.tobytes()]
+                for name, (entity_ids, values) in self.columns.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "EntityTableUpdate":
+        """Restore an update from the representation created by #EntityTableUpdate.to_dict()."""
+        _require_numpy()
+        columns = {}
+        for name, (dtype, shape, id_bytes, value_bytes) in data["columns"].items():
+            entity_ids = np.frombuffer(id_bytes, dtype="<i8").astype(np.int64)
+            values = np.frombuffer(value_bytes, dtype=dtype).reshape((len(entity_ids), *shape)).copy()
+            columns[name] = (entity_ids, values)
+        removed = np.frombuffer(data["removed"], dtype="<i8").astype(np.int64)
+        return cls(columns, removed, bool(data["replace"]))
+
+
+class EntityTable:
+    """Store components of many entities in NumPy arrays, one row per entity.
+
+    Rows of removed entities are reused for new ones, so arrays only grow when more entities exist
+    at the same time than ever before. Component arrays span all rows including unused ones,
+    which allows vectorized calculations over all entities at once. Use `active` to mask out unused rows.
+
+    An #EntityTable can be used as a game state attribute. Like all game state attributes, it should not
+    be mutated in `time_step` or event handlers. Return an #EntityTableUpdate instead, usually via #EntityTable.diff().
+
+    # Arguments
+    components (dict): maps component names to NumPy dtypes or `(dtype, shape)` tuples for components that
+        consist of several values per entity, e.g. `{"position": ("f4", 2), "health": "i2"}`
+    capacity (int): number of rows to allocate initially
+
+    # Example
+    ```python
+    units = EntityTable({"position": ("f4", 2), "velocity": ("f4", 2)})
+    for _ in range(1000):
+        units.insert(velocity=(1.0, 0.5))
+    # in time_step(game_state, dt)
+    units = game_state.units
+    update = {"units": units.diff(position=units["position"] + units["velocity"] * dt)}
+    ```
+
+    """
+
+    def __init__(self, components: Mapping[str, Any], capacity: int = 16):
+        _require_numpy()
+        self._components: dict[str, tuple[Any, tuple[int, ...]]] = {}
+        for name, spec in components.items():
+            dtype, shape = spec if isinstance(spec, tuple) else (spec, ())
+            self._components[name] = (np.dtype(dtype), (shape,) if isinstance(shape, int) else tuple(shape))
+        capacity = max(capacity, 1)
+        self._columns = {
+            name: np.zeros((capacity, *shape), dtype=dtype) for name, (dtype, shape) in self._components.items()
+        }
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        # IDs of all entities in ascending order and their rows, for vectorized lookups via np.searchsorted()
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._free_rows: list[int] = list(range(capacity - 1, -1, -1))
+        self._next_id = 0
+        # arrays that are shared with other tables and have to be copied before they are changed
+        self._shared: set[str] = set()  # names of shared component arrays
+        self._ids_shared = False
+
+    def __len__(self) -> int:
+        return len(self._sorted_ids)
+
+    def __contains__(self, entity_id: int) -> bool:
+        return bool(self._find(np.array([entity_id], dtype=np.int64))[1][0])
+
+    def __getitem__(self, component: str) -> Any:
+        """Return the array of a component for all rows."""
+        return self._columns[component]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, EntityTable) or self._components != other._components:
+            return False
+        if not np.array_equal(self._sorted_ids, other._sorted_ids):
+            return False
+        rows, other_rows = self._sorted_rows, other._sorted_rows
+        return all(
+            np.array_equal(column[rows], other._columns[name][other_rows]) for name, column in self._columns.items()
+        )
+
+    @property
+    def ids(self) -> Any:
+        """Get an array of the IDs of all entities, in the order of their rows."""
+        return self._ids[self._ids >= 0]
+
+    @property
+    def active(self) -> Any:
+        """Get a boolean array that marks the rows in use."""
+        return self._ids >= 0
+
+    def row(self, entity_id: int) -> int:
+        """Return the row of an entity.
+
+        # Raises
+        KeyError: if there is no entity with ID `entity_id`
+
+        """
+        return int(self.rows([entity_id])[0])
+
+    def rows(self, entity_ids: Iterable[int]) -> Any:
+        """Return an array with the rows of the given entities.
+
+        # Raises
+        KeyError: if there is no entity with one of the IDs
+
+        """
+        entity_ids = np.asarray(entity_ids if isinstance(entity_ids, np.ndarray) else list(entity_ids), dtype=np.int64)
+        positions, found = self._find(entity_ids)
+        if not found.all():
+            raise KeyError(int(entity_ids[~found][0]))
+        return self._sorted_rows[positions]
+
+    def get(self, entity_id: int) -> dict[str, Any]:
+        """Return a dict with the component values of an entity."""
+        row = self.row(entity_id)
+        return {name: column[row].copy() for name, column in self._columns.items()}
+
+    def insert(self, entity_id: int | None = None, **components: Any) -> int:
+        """Add an entity and return its ID.
+
+        # Arguments
+        entity_id (int): ID of the new entity, defaults to one higher than the highest ID ever used
+
+        Component values are passed as keyword arguments, missing components are zero.
+
+        # Raises
+        KeyError: if an entity with ID `entity_id` already exists
+
+        """
+        if entity_id is None:
+            entity_id = self._next_id
+        entity_id = int(entity_id)
+        if entity_id in self:
+            raise KeyError(f"Entity {entity_id} already exists.")
+        (row,) = self._add(np.array([entity_id], dtype=np.int64))
+        for name, value in components.items():
+            self._writable(name)[row] = value
+        return entity_id
+
+    def remove(self, entity_id: int) -> None:
+        """Remove an entity and free its row for reuse.
+
+        # Raises
+        KeyError: if there is no entity with ID `entity_id`
+
+        """
+        self._remove(np.array([self.row(entity_id)], dtype=np.int64))
+
+    def diff(self, **columns: Any) -> EntityTableUpdate:
+        """Return an update that contains only the rows in which new component values differ from the current ones.
+
+        # Arguments
+        Component arrays that span all rows of the table, such as the results of vectorized calculations
+        on `table[component]`, are passed as keyword arguments. Unused rows are ignored.
+
+        """
+        active = self.active
+        update_columns = {}
+        for name, values in columns.items():
+            current = self._columns[name]
+            values = np.asarray(values, dtype=current.dtype)
+            changed = values != current
+            if changed.ndim > 1:
+                changed = changed.reshape(len(changed), -1).any(axis=1)
+            dirty_rows = np.flatnonzero(changed & active)
+            update_columns[name] = (self._ids[dirty_rows], values[dirty_rows])
+        return EntityTableUpdate(update_columns)
+
+    def apply(self, update: EntityTableUpdate) -> None:
+        """Apply an #EntityTableUpdate to this table in place."""
+        if update.replace:
+            self.__dict__.update(EntityTable.from_update(update).__dict__)
+            return
+        if len(update.removed):
+            positions, found = self._find(update.removed)
+            self._remove(np.unique(self._sorted_rows[positions[found]]))
+        for name, (entity_ids, values) in update.columns.items():
+            positions, found = self._find(entity_ids)
+            if not found.all():
+                self._add(np.unique(entity_ids[~found]))
+                positions, _ = self._find(entity_ids)
+            self._writable(name)[self._sorted_rows[positions]] = values
+
+    def copy(self) -> "EntityTable":
+        """Return a copy of this table that shares no arrays with it."""
+        table = copy.deepcopy(self)
+        table._shared, table._ids_shared = set(), False
+        return table
+
+    def updated(self, update: EntityTableUpdate) -> "EntityTable":
+        """Return a copy of this table with an #EntityTableUpdate applied, leaving this table unchanged.
+
+        The copy shares the arrays of all components the update doesn't change with this table,
+        so updating a few components of a large table doesn't copy the others.
+
+        """
+        # Both tables copy a shared array before they change it.
+        self._shared.update(self._columns)
+        self._ids_shared = True
+        table = copy.copy(self)
+        table._columns = dict(self._columns)  # pylint: disable=protected-access
+        table._free_rows = list(self._free_rows)  # pylint: disable=protected-access
+        table._shared = set(self._shared)  # pylint: disable=protected-access
+        table.apply(update)
+        return table
+
+    def to_update(self) -> EntityTableUpdate:
+        """Return an update that replaces any table with a copy of this one."""
+        rows = np.flatnonzero(self.active)
+        columns = {name: (self._ids[rows], column[rows]) for name, column in self._columns.items()}
+        return EntityTableUpdate(columns, replace=True)
+
+    @classmethod
+    def from_update(cls, update: EntityTableUpdate) -> "EntityTable":
+        """Create a table from an update, with one component for each of its columns."""
+        components = {name: (values.dtype, values.shape[1:]) for name, (_, values) in update.columns.items()}
+        table = cls(components, capacity=max((len(ids) for ids, _ in update.columns.values()), default=1))
+        table.apply(EntityTableUpdate(update.columns, update.removed))
+        return table
+
+    def _find(self, entity_ids: Any) -> tuple[Any, Any]:
+        """Return the positions of entity IDs in the sorted index and a mask of the IDs that exist."""
+        positions = np.searchsorted(self._sorted_ids, entity_ids)
+        found = positions < len(self._sorted_ids)
+        found[found] = self._sorted_ids[positions[found]] == entity_ids[found]
+        return positions, found
+
+    def _writable(self, name: str) -> Any:
+        """Return the array of a component, after copying it if it is shared with another table."""
+        if name in self._shared:
+            self._columns[name] = self._columns[name].copy()
+            self._shared.discard(name)
+        return self._columns[name]
+
+    def _writable_ids(self) -> Any:
+        if self._ids_shared:
+            self._ids = self._ids.copy()
+            self._ids_shared = False
+        return self._ids
+
+    def _add(self, entity_ids: Any) -> Any:
+        """Add entities with new, unique IDs in free rows, with all components zero, and return their rows."""
+        if len(entity_ids) > len(self._free_rows):
+            self._grow(len(entity_ids))
+        rows = np.array(self._free_rows[-len(entity_ids) :][::-1], dtype=np.int64)
+        del self._free_rows[-len(entity_ids) :]
+        self._writable_ids()[rows] = entity_ids
+        for name in self._columns:
+            self._writable(name)[rows] = 0
+        order = np.argsort(entity_ids)
+        positions = np.searchsorted(self._sorted_ids, entity_ids[order])
+        self._sorted_ids = np.insert(self._sorted_ids, positions, entity_ids[order])
+        self._sorted_rows = np.insert(self._sorted_rows, positions, rows[order])
+        self._next_id = max(self._next_id, int(entity_ids.max()) + 1)
+        return rows
+
+    def _remove(self, rows: Any) -> None:
+        """Remove the entities in the given rows, which must be unique, and free the rows for reuse."""
+        positions, _ = self._find(self._ids[rows])
+        self._writable_ids()[rows] = -1
+        self._free_rows.extend(rows.tolist())
+        self._sorted_ids = np.delete(self._sorted_ids, positions)
+        self._sorted_rows = np.delete(self._sorted_rows, positions)
+
+    def _grow(self, min_free_rows: int = 1) -> None:
+        capacity = len(self._ids)
+        added = max(capacity, min_free_rows - len(self._free_rows))
+        self._columns = {
+            name: np.concatenate((column, np.zeros((added, *column.shape[1:]), dtype=column.dtype)))
+            for name, column in self._columns.items()
+        }
+        self._ids = np.concatenate((self._ids, np.full(added, -1, dtype=np.int64)))
+        # The arrays are new, so they aren't shared anymore.
+        self._shared, self._ids_shared = set(), False
+        self._free_rows = list(range(capacity + added - 1, capacity - 1, -1)) + self._free_rows
+
+
+def encode_entity_tables(value: Any) -> Any:
+    """Replace entity tables and their updates in nested dicts with serializable dicts.
+
+    Entity tables are encoded as updates that replace the whole table. Dicts that don't contain
+    any entity tables are returned as they are.
+
+    """
+    if isinstance(value, EntityTable):
+        return value.to_update().to_dict()
+    if isinstance(value, EntityTableUpdate):
+        return value.to_dict()
+    if isinstance(value, dict):
+        encoded = {key: encode_entity_tables(item) for key, item in value.items()}
+        if all(encoded[key] is item for key, item in value.items()):
+            return value
+        return encoded
+    return value
+
+
+def decode_entity_tables(value: Any, as_tables: bool = False) -> Any:
+    """Restore the entity table updates encoded by #encode_entity_tables() in nested dicts.
+
+    If `as_tables` is `True`, complete tables are restored as #EntityTable objects instead of updates.
+
+    """
+    if isinstance(value, dict):
+        if ENTITY_TABLE_KEY in value:
+            update = EntityTableUpdate.from_dict(value)
+            return EntityTable.from_update(update) if as_tables and update.replace else update
+        decoded = {key: decode_entity_tables(item, as_tables) for key, item in value.items()}
+        if all(decoded[key] is item for key, item in value.items()):
+            return value
+        return decoded
+    return value
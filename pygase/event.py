@@ -9,9 +9,9 @@ Contains the basic components of the PyGaSe event framework.
 
 """
 
-from pygase.aio import iscoroutinefunction
 from typing import Awaitable, Callable, TypeAlias, cast
 
+from pygase.aio import iscoroutinefunction
 from pygase.utils import Sendable, logger
 
 EventHandler: TypeAlias = Callable[..., object | Awaitable[object]]
@@ -31,9 +31,22 @@ class Event(Sendable):
     type (str):
     handler_args (list):
     handler_kwargs (dict):
+    input_sequence (int): sequence number of a client input event that takes part in client-side prediction,
+        `0` for all other events (only set on instances, so that it is not sent along with regular events)
+    reliable_id (int): message ID of an event that is resent until it is received, `0` for unreliable events
+        (only set on instances, like `input_sequence`)
+    ordered (bool): whether a reliable event is only handled after all reliable events sent before it
+    view_time_order (int): time order of the game state the sending client saw when it sent the event,
+        `0` if unknown (only set on instances, by clients that render interpolated game states
+        or by the receiving #pygase.server.ServerConnection)
 
     """
 
+    input_sequence: int = 0
+    reliable_id: int = 0
+    ordered: bool = False
+    view_time_order: int = 0
+
     def __init__(self, event_type: str, *args: object, **kwargs: object) -> None:
         self.type: str = event_type
         self.handler_args: list[object] = list(args)
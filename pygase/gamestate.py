@@ -6,15 +6,30 @@
 - #GameStatus: enum for the status of the game simulation
 - #GameState: class for serializable custom state data objects
 - #GameStateUpdate: class for serializable objects that express changes to a *GameState* object
+- #StateSubscriptions: class that dispatches the key paths touched by updates to subscribed callbacks
+- #InterpolationBuffer: class that keeps time-stamped game states and interpolates between them
+- #InterestFilter: class that restricts the entities of a game state collection to those relevant to a client
+- #PriorityAccumulator: class that selects the most important changes of an update that fit a byte budget
+- #combine_changes: function that combines two successive changes to the same game state entry
+- #merge_update_dicts: function that deeply merges update dicts without mutating shared nested dicts
+
+Columnar entity tables for game states are provided by #pygase.entities.
 
 """
 
+import copy
+import math
+import threading
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass, field
 from enum import IntEnum
+from itertools import product
 from typing import Any
-from collections.abc import Mapping
 
-from pygase.utils import Sendable, Sqn
+from pygase.entities import EntityTable, EntityTableUpdate, decode_entity_tables, encode_entity_tables
+from pygase.utils import Sendable, Sqn, umsgpack
 
 _RESERVED_GAME_STATE_FIELDS = {"time_order", "game_status", "data"}
 _RESERVED_UPDATE_FIELDS = {"time_order", "data"}
@@ -42,7 +57,7 @@ class GameState(Sendable):
     Contains game state information that will be synchronized between the server and the clients.
     Via `pygase.utils.Sendable` its instances will be serialized using the msgpack protocol
     and must only contain attributes of type `str`, `bytes`, `Sqn`, `int`, `float`, `bool`
-    as well as `list`s or `tuple`s of such.
+    as well as `list`s or `tuple`s of such, or #pygase.entities.EntityTable objects.
 
     # Arguments
     time_order (int): current time order number of the game state, higher means more recent
@@ -68,8 +83,10 @@ class GameState(Sendable):
         self.data = dict(kwargs)
 
     def __getattr__(self, name: str) -> Any:
-        if name in self.data:
-            return self.data[name]
+        # Look up `data` via `__dict__`, because it doesn't exist yet while instances are copied or unpickled.
+        data = self.__dict__.get("data", {})
+        if name in data:
+            return data[name]
         raise AttributeError
 
     def __setattr__(self, name: str, value: Any) -> None:
@@ -86,13 +103,17 @@ class GameState(Sendable):
 
     def to_dict(self) -> dict:
         """Return a serializable dictionary representation of this game state."""
-        custom_data = {key: value for key, value in self.data.items() if key not in _RESERVED_GAME_STATE_FIELDS}
+        custom_data = {
+            key: encode_entity_tables(value)
+            for key, value in self.data.items()
+            if key not in _RESERVED_GAME_STATE_FIELDS
+        }
         return {**custom_data, "time_order": int(self.time_order), "game_status": int(self.game_status)}
 
     @classmethod
     def from_dict(cls, data: Mapping[str, Any]) -> "GameState":
         """Create a `GameState` from a dictionary representation."""
-        state_data = {key: value for key, value in data.items() if key not in {"data"}}
+        state_data = {key: decode_entity_tables(value, as_tables=True) for key, value in data.items() if key != "data"}
         time_order = state_data.pop("time_order", 0)
         game_status = state_data.pop("game_status", GameStatus.PAUSED)
         return cls(time_order=time_order, game_status=GameStatus(game_status), **state_data)
@@ -118,9 +139,13 @@ class GameStateUpdate(Sendable):
 
     Attributes of a `GameStateUpdate` object represent new values of `GameState` attributes.
     To remove game state attributes just assign `TO_DELETE` to it in the update.
+    Changes to #pygase.entities.EntityTable attributes are expressed as #pygase.entities.EntityTableUpdate objects,
+    which only contain the changed rows and are serialized as packed arrays.
 
     Use the `+` operator to add updates to one another and combine them or to add them to a
-    game state in order to update it.
+    game state in order to update it. Combining updates creates a new update that shares unchanged nested
+    dicts with its operands instead of copying or mutating them, so updates can be combined while they
+    are shared with caches or other clients. Treat the `data` of updates as immutable.
 
     # Arguments
     time_order (int): the time order up to which the update reaches
@@ -142,8 +167,10 @@ class GameStateUpdate(Sendable):
         self.data = dict(kwargs)
 
     def __getattr__(self, name: str) -> Any:
-        if name in self.data:
-            return self.data[name]
+        # Look up `data` via `__dict__`, because it doesn't exist yet while instances are copied or unpickled.
+        data = self.__dict__.get("data", {})
+        if name in data:
+            return data[name]
         raise AttributeError
 
     def __setattr__(self, name: str, value: Any) -> None:
@@ -160,25 +187,25 @@ class GameStateUpdate(Sendable):
 
     def to_dict(self) -> dict:
         """Return a serializable dictionary representation of this update."""
-        custom_data = {key: value for key, value in self.data.items() if key not in _RESERVED_UPDATE_FIELDS}
+        custom_data = {
+            key: encode_entity_tables(value) for key, value in self.data.items() if key not in _RESERVED_UPDATE_FIELDS
+        }
         return {**custom_data, "time_order": int(self.time_order)}
 
     @classmethod
     def from_dict(cls, data: Mapping[str, Any]) -> "GameStateUpdate":
         """Create a `GameStateUpdate` from a dictionary representation."""
-        update_data = {key: value for key, value in data.items() if key not in {"data"}}
+        update_data = {key: decode_entity_tables(value) for key, value in data.items() if key != "data"}
         time_order = update_data.pop("time_order")
         return cls(time_order=time_order, **update_data)
 
     def __add__(self, other: "GameStateUpdate") -> "GameStateUpdate":
-        """Combine two updates."""
-        if other > self:
-            _recursive_update(self.data, other.data)
-            self.time_order = other.time_order
-            return self
-        _recursive_update(other.data, self.data)
-        other.time_order = self.time_order
-        return other
+        """Combine two updates into a new one without changing them."""
+        older, newer = (self, other) if other > self else (other, self)
+        combined = GameStateUpdate(newer.time_order)
+        combined.data = dict(older.data)
+        merge_update_dicts(combined.data, newer.data)
+        return combined
 
     def __radd__(self, other):
         """Update a `GameState`."""
@@ -189,7 +216,9 @@ class GameStateUpdate(Sendable):
             return self
         if self > other:
             payload = {key: value for key, value in self.data.items() if key != "game_status"}
-            _recursive_update(other.data, payload, delete=True)
+            # Changed entity tables and nested dicts are replaced by updated copies, so a game state that
+            # is read by another thread (e.g. a server connection serializing it) never changes under it.
+            merge_update_dicts(other.data, payload, delete=True)
             other.time_order = self.time_order
             if "game_status" in self.data and self.data["game_status"] != TO_DELETE:
                 other.game_status = GameStatus(self.data["game_status"])
@@ -203,12 +232,550 @@ class GameStateUpdate(Sendable):
         return self.time_order > other.time_order
 
 
-def _recursive_update(my_dict: dict, update_dict: dict, delete: bool = False) -> None:
-    """Update nested dicts deeply via recursion."""
+class _PathNode:
+    """Node of the prefix tree that stores #StateSubscriptions."""
+
+    __slots__ = ("children", "callbacks")
+
+    def __init__(self) -> None:
+        self.children: dict[str, "_PathNode"] = {}
+        self.callbacks: list[Callable] = []
+
+
+class StateSubscriptions:
+    """Match the key paths touched by a #GameStateUpdate against subscribed key path patterns.
+
+    Key path patterns are dot-separated game state keys, such as `'players.*.position'`, in which `*` matches
+    any single key. Keys are compared by their string representation, so `'players.0'` matches the integer key `0`.
+
+    Subscriptions are stored in a prefix tree, so matching an update only walks the branches that correspond
+    to keys contained in the update instead of scanning all subscriptions.
+
+    # Example
+    ```python
+    subscriptions = StateSubscriptions()
+    subscriptions.subscribe("players.*.position", lambda path, value: print(path, value))
+    update = GameStateUpdate(2, players={3: {"position": (1.0, 2.0)}})
+    for callback, path, value in subscriptions.match(update):
+        callback(path, value)  # prints ('players', 3, 'position') (1.0, 2.0)
+    ```
+
+    """
+
+    def __init__(self) -> None:
+        self._root = _PathNode()
+
+    def subscribe(self, path_pattern: str, callback: Callable) -> None:
+        """Subscribe a callback to a key path pattern.
+
+        # Arguments
+        path_pattern (str): dot-separated key path, `*` matches any single key
+        callback (callable, coroutine): will be passed the matching key path as a tuple and the updated value
+
+        # Raises
+        TypeError: if `callback` is not callable
+
+        """
+        if not callable(callback):
+            raise TypeError(f"'{callback.__class__.__name__}' object is not callable.")
+        node = self._root
+        for segment in path_pattern.split("."):
+            node = node.children.setdefault(segment, _PathNode())
+        node.callbacks.append(callback)
+
+    def unsubscribe(self, path_pattern: str, callback: Callable) -> None:
+        """Remove a callback from a key path pattern.
+
+        # Raises
+        ValueError: if `callback` is not subscribed to `path_pattern`
+
+        """
+        node = self._root
+        branch = []
+        for segment in path_pattern.split("."):
+            if segment not in node.children:
+                raise ValueError(f"No subscription for key path '{path_pattern}'.")
+            branch.append((node, segment))
+            node = node.children[segment]
+        node.callbacks.remove(callback)
+        # Prune nodes that no longer lead to any callbacks, so matching doesn't walk dead branches.
+        for parent, segment in reversed(branch):
+            child = parent.children[segment]
+            if child.callbacks or child.children:
+                break
+            del parent.children[segment]
+
+    def match(self, update: GameStateUpdate) -> list[tuple[Callable, tuple, Any]]:
+        """Return `(callback, path, value)` tuples for all subscribed key paths contained in `update`.
+
+        `value` is the value the update carries at `path`, which is #TO_DELETE for removed entries
+        and only contains the changed entries for nested dicts.
+
+        """
+        matches: list[tuple[Callable, tuple, Any]] = []
+        if self._root.children:
+            _match_path_node(self._root, update.data, (), matches)
+        return matches
+
+
+def _match_path_node(node: _PathNode, data: dict, path: tuple, matches: list) -> None:
+    """Collect subscriptions in the subtree of `node` that match the keys in `data`."""
+    wildcard = node.children.get("*")
+    for key, value in data.items():
+        named_child = node.children.get(str(key))
+        for child in (named_child, wildcard if wildcard is not named_child else None):
+            if child is None:
+                continue
+            child_path = path + (key,)
+            for callback in child.callbacks:
+                matches.append((callback, child_path, value))
+            if child.children and isinstance(value, dict):
+                _match_path_node(child, value, child_path, matches)
+
+
+class InterpolationBuffer:
+    """Keep the most recent time-stamped game states and interpolate between them.
+
+    Rendering an interpolated state slightly in the past, instead of the most recent state, hides
+    irregular update arrival and allows smooth rendering at frame rates much higher than the update rate.
+
+    # Arguments
+    size (int): maximum number of game state snapshots to keep
+    delay (float): time in seconds by which the default render time lags behind the current time
+    path_patterns (list): key path patterns as for #StateSubscriptions, such as `'players.*.position'`,
+        that restrict interpolation to the values below them, defaults to interpolating all values
+
+    # Attributes
+    delay (float): see corresponding constructor argument
+
+    ---
+    Pairs of numbers of which at least one is a `float` (including those in lists, tuples and dicts) are
+    interpolated linearly. All other values, such as integer IDs or counters, and the set of dict keys are taken
+    from the older of the two snapshots surrounding the render time. Render times outside the buffered time span
+    yield the oldest or the most recent snapshot respectively.
+
+    """
+
+    def __init__(self, size: int = 32, delay: float = 0.1, path_patterns: list[str] | None = None):
+        if size < 2:
+            raise ValueError("InterpolationBuffer needs a size of at least 2.")
+        self.delay = delay
+        self._path_patterns = (
+            None if path_patterns is None else [tuple(pattern.split(".")) for pattern in path_patterns]
+        )
+        self._snapshots: deque[tuple[float, GameState]] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def push(self, game_state: GameState, timestamp: float) -> None:
+        """Store a copy of `game_state` as the state at `timestamp`.
+
+        Snapshots with a timestamp older than the most recent one are ignored.
+
+        """
+        snapshot = copy.deepcopy(game_state)
+        with self._lock:
+            if self._snapshots and timestamp < self._snapshots[-1][0]:
+                return
+            self._snapshots.append((timestamp, snapshot))
+
+    def interpolate(self, render_time: float) -> GameState:
+        """Return the game state interpolated to `render_time`.
+
+        # Raises
+        LookupError: if the buffer does not contain any snapshots yet
+
+        """
+        with self._lock:
+            snapshots = list(self._snapshots)
+        if not snapshots:
+            raise LookupError("InterpolationBuffer does not contain any game states yet.")
+        index = bisect_right([timestamp for timestamp, _ in snapshots], render_time)
+        if index == 0:
+            return copy.deepcopy(snapshots[0][1])
+        if index == len(snapshots):
+            return copy.deepcopy(snapshots[-1][1])
+        (t0, older), (t1, newer) = snapshots[index - 1], snapshots[index]
+        alpha = (render_time - t0) / (t1 - t0) if t1 > t0 else 1.0
+        return GameState(
+            time_order=older.time_order,
+            game_status=older.game_status,
+            **self._interpolate(older.data, newer.data, alpha, ()),
+        )
+
+    def time_order_at(self, render_time: float) -> int:
+        """Return the time order of the game state that is interpolated from at `render_time`.
+
+        This is the time order of the state returned by #InterpolationBuffer.interpolate(), or `0` if the buffer
+        does not contain any snapshots yet.
+
+        """
+        with self._lock:
+            snapshots = list(self._snapshots)
+        if not snapshots:
+            return 0
+        index = bisect_right([timestamp for timestamp, _ in snapshots], render_time)
+        return int(snapshots[max(index - 1, 0)][1].time_order)
+
+    def _interpolate(self, older: Any, newer: Any, alpha: float, path: tuple) -> Any:
+        """Interpolate linearly between float values in nested structures."""
+        if isinstance(older, dict) and isinstance(newer, dict):
+            return {
+                key: (
+                    self._interpolate(value, newer[key], alpha, path + (key,))
+                    if key in newer
+                    else copy.deepcopy(value)
+                )
+                for key, value in older.items()
+            }
+        if isinstance(older, (list, tuple)) and isinstance(newer, (list, tuple)) and len(older) == len(newer):
+            return type(older)(self._interpolate(old, new, alpha, path) for old, new in zip(older, newer))
+        if _is_interpolatable(older, newer) and self._is_interpolated_path(path):
+            return older + (newer - older) * alpha
+        return copy.deepcopy(older)
+
+    def _is_interpolated_path(self, path: tuple) -> bool:
+        if self._path_patterns is None:
+            return True
+        return any(
+            len(pattern) <= len(path) and all(segment in ("*", str(key)) for segment, key in zip(pattern, path))
+            for pattern in self._path_patterns
+        )
+
+
+def _is_interpolatable(older: Any, newer: Any) -> bool:
+    """Check if two values are numbers of which at least one is a float."""
+    numbers = (int, float)
+    if isinstance(older, bool) or isinstance(newer, bool):
+        return False
+    return (
+        isinstance(older, numbers)
+        and isinstance(newer, numbers)
+        and (isinstance(older, float) or isinstance(newer, float))
+    )
+
+
+class InterestFilter:
+    """Restrict the entries of a game state collection that a client receives to those relevant to it.
+
+    A collection is a game state attribute that maps entity keys to entities, like `players` in
+    `GameState(players={0: {"position": (1.0, 2.0)}})`. Register interest filters via
+    #pygase.Server.register_interest_filter() to send each client only the changes of its relevant entities.
+
+    # Arguments
+    collection (str): name of the game state attribute that holds the entities
+    is_relevant (callable): function `is_relevant(client_address, game_state, key, entity)` that returns
+        whether an entity is relevant to a client
+
+    # Attributes
+    collection (str): see corresponding constructor argument
+    is_relevant (callable): see corresponding constructor argument
+
+    ---
+    When an entity becomes relevant to a client, the client receives the complete entity. When it stops being
+    relevant, the client receives #TO_DELETE for it, as if it was removed from the game state.
+    Clients can observe these enter and leave transitions via #pygase.Client.subscribe().
+
+    """
+
+    def __init__(self, collection: str, is_relevant: Callable[[tuple[str, int], GameState, Any, Any], bool]):
+        self.collection = collection
+        self.is_relevant = is_relevant
+
+    @classmethod
+    def within_radius(
+        cls,
+        collection: str,
+        radius: float,
+        focus: Callable[[tuple[str, int], GameState], Any],
+        position_key: str = "position",
+    ) -> "InterestFilter":
+        """Create a filter for entities whose position is within a radius around the client's point of focus.
+
+        # Arguments
+        collection (str): name of the game state attribute that holds the entities
+        radius (float): maximum distance of relevant entities to the point of focus
+        focus (callable): function `focus(client_address, game_state)` that returns the coordinates of the client's
+            point of focus, e.g. the position of its player, or `None` to make all entities relevant
+        position_key (str): key of the coordinates of an entity in the entity dict
+
+        ---
+        The returned filter sorts the entities into a grid of cells with the size of `radius`, which is rebuilt
+        whenever the collection changes (updates replace it by an updated copy). Looking up the relevant entities
+        of a client then only takes the entities in the cells around its point of focus into account,
+        and `focus` is called only once per lookup.
+
+        """
+        return _RadiusInterestFilter(collection, radius, focus, position_key)
+
+    def relevant_keys(self, client_address: tuple[str, int], game_state: GameState) -> frozenset:
+        """Return the keys of all entities in the collection of `game_state` that are relevant to a client."""
+        entities = game_state.data.get(self.collection)
+        if not isinstance(entities, dict):
+            return frozenset()
+        return frozenset(
+            key for key, entity in entities.items() if self.is_relevant(client_address, game_state, key, entity)
+        )
+
+    def filter_changes(self, changes: Any, game_state: GameState, relevant: frozenset, known: frozenset | None) -> Any:
+        """Return the changes to the collection that a client has to receive.
+
+        # Arguments
+        changes (dict): the collection's value in a #GameStateUpdate, or the collection itself for a full state
+        game_state (GameState): current game state, from which entering entities are taken
+        relevant (frozenset): keys of the entities that are relevant to the client
+        known (frozenset): keys of the entities the client already has, `None` if `changes` is a full state
+
+        """
+        entities = game_state.data.get(self.collection)
+        if not isinstance(entities, dict):
+            entities = {}
+        if known is None:
+            return {key: entities[key] for key in relevant if key in entities}
+        if changes is not None and not isinstance(changes, dict):
+            return changes
+        filtered = {key: entities[key] for key in relevant - known if key in entities}
+        filtered.update((key, TO_DELETE) for key in known - relevant)
+        if changes is not None:
+            filtered.update((key, value) for key, value in changes.items() if key in known and key in relevant)
+        return filtered
+
+
+class _RadiusInterestFilter(InterestFilter):
+    """Interest filter created by #InterestFilter.within_radius() that looks up entities in a grid of cells."""
+
+    def __init__(
+        self,
+        collection: str,
+        radius: float,
+        focus: Callable[[tuple[str, int], GameState], Any],
+        position_key: str,
+    ):
+        super().__init__(collection, self._is_relevant)
+        self._radius_squared = radius * radius
+        self._focus = focus
+        self._position_key = position_key
+        self._cell_size = radius if radius > 0 else 1.0
+        # the collection the grid was built from, and the keys of its entities by cell
+        self._grid: tuple[Any, dict[tuple[int, ...], list[Any]]] = (None, {})
+
+    def relevant_keys(self, client_address: tuple[str, int], game_state: GameState) -> frozenset:
+        """Return the keys of all entities in the collection of `game_state` that are relevant to a client."""
+        entities = game_state.data.get(self.collection)
+        if not isinstance(entities, dict):
+            return frozenset()
+        center = self._focus(client_address, game_state)
+        if center is None:
+            return frozenset(entities)
+        return frozenset(key for key in self._nearby_keys(entities, center) if self._is_near(entities[key], center))
+
+    def _is_relevant(self, client_address: tuple[str, int], game_state: GameState, key: Any, entity: Any) -> bool:
+        del key
+        center = self._focus(client_address, game_state)
+        return center is None or self._is_near(entity, center)
+
+    def _is_near(self, entity: Any, center: Any) -> bool:
+        position = self._position(entity)
+        if position is None:
+            return False
+        return sum((p - c) * (p - c) for p, c in zip(position, center)) <= self._radius_squared
+
+    def _position(self, entity: Any) -> Any:
+        return entity.get(self._position_key) if isinstance(entity, dict) else None
+
+    def _cell(self, position: Any) -> tuple[int, ...]:
+        return tuple(math.floor(coordinate / self._cell_size) for coordinate in position)
+
+    def _nearby_keys(self, entities: dict, center: Any) -> list:
+        """Return the keys of the entities in the cell of `center` and its neighbouring cells."""
+        collection, grid = self._grid
+        if collection is not entities:
+            grid = {}
+            for key, entity in entities.items():
+                position = self._position(entity)
+                if position is not None:
+                    grid.setdefault(self._cell(position), []).append(key)
+            self._grid = (entities, grid)
+        center_cell = self._cell(center)
+        nearby_keys: list[Any] = []
+        for offset in product((-1, 0, 1), repeat=len(center_cell)):
+            nearby_keys.extend(grid.get(tuple(c + o for c, o in zip(center_cell, offset)), ()))
+        return nearby_keys
+
+
+class PriorityAccumulator:
+    """Select the changes of game state updates that are sent to a client with a limited bandwidth.
+
+    The entries of game state collections (attributes whose values are dicts, like `players` in
+    `GameState(players={0: {"position": (1.0, 2.0)}})`) are prioritized individually. Each time an entry has
+    unsent changes, its priority is added to its accumulated priority. The entries with the highest accumulated
+    priority are sent first, and an entry's accumulated priority is reset once it is sent. This way, important
+    entries are sent more often, while the changes of unimportant entries are deferred but never starve.
+
+    # Arguments
+    priorities (dict): maps names of game state collections to functions
+        `priority(client_address, game_state, key, entity)` that return the priority of an entity for a client
+
+    # Attributes
+    priorities (dict): see corresponding constructor argument, entries of other collections have priority 1
+    accumulated (dict): maps `(collection, key)` of entries with unsent changes to their accumulated priority
+
+    """
+
+    def __init__(self, priorities: dict[str, Callable[[tuple[str, int], GameState, Any, Any], float]] | None = None):
+        self.priorities = {} if priorities is None else priorities
+        self.accumulated: dict[tuple[str, Any], float] = {}
+
+    def select(
+        self,
+        update_data: dict,
+        deferred_changes: dict,
+        byte_budget: float,
+        client_address: tuple[str, int],
+        game_state: GameState,
+    ) -> tuple[dict, dict]:
+        """Split the data of an update into the changes to send now and the changes to defer.
+
+        Attributes that are not collections are always sent. The entry with the highest accumulated priority
+        is always sent as well, even if it alone exceeds the byte budget.
+
+        # Arguments
+        update_data (dict): `data` of the #GameStateUpdate to send
+        deferred_changes (dict): maps `(collection, key)` to changes of older updates that have not been sent yet
+        byte_budget (float): approximate number of bytes that the selected changes may take up
+        client_address (tuple): address of the client the changes are sent to
+        game_state (GameState): current game state, which is passed to the priority functions
+
+        # Returns
+        tuple: the update data to send and the changes to defer, in the format of `deferred_changes`
+
+        """
+        selected, changes = self._split_changes(update_data, deferred_changes)
+        self.accumulated = {
+            entry: self.accumulated.get(entry, 0.0) + self._priority(entry, client_address, game_state)
+            for entry in changes
+        }
+        bytes_left = byte_budget - _packed_size(selected)
+        deferred = {}
+        for rank, entry in enumerate(sorted(changes, key=self.accumulated.__getitem__, reverse=True)):
+            size = _packed_size({entry[1]: changes[entry]})
+            if size <= bytes_left or rank == 0:
+                selected.setdefault(entry[0], {})[entry[1]] = changes[entry]
+                bytes_left -= size
+                del self.accumulated[entry]
+            else:
+                deferred[entry] = changes[entry]
+        return selected, deferred
+
+    @staticmethod
+    def _split_changes(update_data: dict, deferred_changes: dict) -> tuple[dict, dict]:
+        """Split update data into the attributes that are always sent and the changes of collection entries."""
+        selected = {}
+        changes = {
+            entry: change
+            for entry, change in deferred_changes.items()
+            if isinstance(update_data.get(entry[0], {}), dict)
+        }
+        for name, value in update_data.items():
+            if not isinstance(value, dict):
+                selected[name] = value
+                continue
+            if not value:
+                selected[name] = {}
+            for key, change in value.items():
+                changes[(name, key)] = combine_changes(changes.get((name, key)), change)
+        return selected, changes
+
+    def _priority(self, entry: tuple[str, Any], client_address: tuple[str, int], game_state: GameState) -> float:
+        """Return the priority of an entry of a game state collection for a client."""
+        name, key = entry
+        priority = self.priorities.get(name)
+        if priority is None:
+            return 1.0
+        entities = game_state.data.get(name)
+        entity = entities.get(key) if isinstance(entities, dict) else None
+        return priority(client_address, game_state, key, entity)
+
+
+def combine_changes(older: Any, newer: Any) -> Any:
+    """Return the combination of two successive changes to the same game state entry.
+
+    Changes to nested dicts are merged like the data of successive #GameStateUpdate objects, all other changes are
+    replaced by the newer one. `None` for `older` means that there is no older change.
+
+    """
+    if isinstance(older, Mapping) and isinstance(newer, Mapping):
+        combined = dict(older)
+        merge_update_dicts(combined, newer)
+        return combined
+    return newer
+
+
+def _packed_size(value: Any) -> int:
+    """Return the number of bytes of a value in a serialized update."""
+    return len(umsgpack.packb(encode_entity_tables(value), force_float_precision="single"))
+
+
+def merge_update_dicts(
+    target: dict,
+    update_dict: Mapping,
+    delete: bool = False,
+    copy_tables: bool = True,
+    copied_tables: list[EntityTable] | None = None,
+) -> None:
+    """Deeply merge an update dict into `target`.
+
+    Nested dicts of `target` are copied before they are changed (copy-on-write), so nested dicts that `target`
+    shares with other objects, like a game state or previous updates, are never mutated. Nested dicts of
+    `update_dict` end up shared with `target`, which is safe as long as both are only changed via this function.
+
+    # Arguments
+    target (dict): dict to merge the update into, e.g. the `data` of a #GameState or another update dict
+    update_dict (dict): game state attributes to update
+    delete (bool): whether to remove entries marked with #TO_DELETE instead of keeping the marker
+    copy_tables (bool): whether to copy entity tables of `target` before changing them, like nested dicts
+    copied_tables (list): tables copied by earlier merges into the same `target`, which are changed in place
+        instead of being copied again, new copies are appended to it
+
+    ---
+    Pass the same `copied_tables` list to all merges into a working copy of a game state, so that each of its
+    entity tables is copied at most once, no matter how many updates change it.
+
+    """
     for key, value in update_dict.items():
-        if value == TO_DELETE and delete and key in my_dict.keys():
-            del my_dict[key]
-        elif isinstance(value, dict) and key in my_dict.keys() and isinstance(my_dict[key], dict):
-            _recursive_update(my_dict[key], value, delete=delete)
+        if delete and value == TO_DELETE:
+            target.pop(key, None)
+        elif isinstance(value, EntityTableUpdate):
+            target[key] = _merge_entity_table_update(target.get(key), value, copy_tables, delete, copied_tables)
+        elif isinstance(value, Mapping) and isinstance(target.get(key), dict):
+            merged = dict(target[key])
+            merge_update_dicts(merged, value, delete, copy_tables, copied_tables)
+            target[key] = merged
         else:
-            my_dict[key] = value
+            target[key] = value
+
+
+def _merge_entity_table_update(
+    current: Any, update: EntityTableUpdate, copy_table: bool, delete: bool, copied_tables: list[EntityTable] | None
+) -> EntityTable | EntityTableUpdate:
+    """Return the result of an entity table update applied to a table, or combined with a previous update."""
+    if isinstance(current, EntityTableUpdate):
+        return current.combine(update)
+    if isinstance(current, EntityTable) and not update.replace:
+        if copy_table and not any(copied is current for copied in copied_tables or ()):
+            # Only the components the update changes are copied, the others stay shared with `current`.
+            table = current.updated(update)
+            if copied_tables is not None:
+                copied_tables.append(table)
+            return table
+        current.apply(update)
+        return current
+    if not delete:
+        # Only game states hold tables, for updates a complete table is kept as an update that replaces it.
+        return update
+    table = EntityTable.from_update(update)
+    if copied_tables is not None:
+        copied_tables.append(table)
+    return table
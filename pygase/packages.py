@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""Provide the PyGaSe package protocol.
+
+This module is not supposed to be required by users of this library.
+
+# Contents
+- #PROTOCOL_ID: 4 byte identifier for the PyGaSe package protocol
+- #ProtocolIDMismatchError: exception for receiving non-PyGaSe packages
+- #DuplicateSequenceError: exception for duplicate packages
+- #Header: class for PyGaSe package headers
+- #Package: class for PyGaSe UDP packages
+- #ClientPackage: subclass of #Package for packages sent by clients
+- #SyncTimestamps: named tuple of the timestamps servers send for clock synchronization
+- #ServerPackage: subclass of #Package for packages sent by servers
+- #ReliableEventChannel: class that keeps track of reliable events sent and received via a connection
+
+"""
+
+import copy
+import struct
+from collections import deque
+from typing import NamedTuple, cast
+
+from pygase.utils import Sqn, Comparable, logger
+from pygase.event import Event
+from pygase.gamestate import GameStateUpdate
+
+PROTOCOL_ID: bytes = bytes.fromhex("ffd0fab9")  # unique 4 byte identifier for pygase packages
+
+
+class ProtocolIDMismatchError(ValueError):
+    """Bytestring could not be identified as a valid PyGaSe package."""
+
+
+class DuplicateSequenceError(ConnectionError):
+    """Received a package with a sequence number that was already received before."""
+
+
+class Header(Comparable):
+    """Create a PyGaSe package header.
+
+    # Arguments
+    sequence (int): package sequence number
+    ack (int): sequence number of the last received package
+    ack_bitfield (str): A 32 character string representing the 32 sequence numbers prior to the last one received,
+        with the first character corresponding the package directly preceding it and so forth.
+        '1' means that package has been received, '0' means it hasn't.
+
+    # Attributes
+    sequence (int): see corresponding constructor argument
+    ack (int): see corresponding constructor argument
+    ack_bitfield (str): see corresponding constructor argument
+
+    ---
+    Sequence numbers: A sequence of 0 means no packages have been sent or received.
+    After 65535 sequence numbers wrap around to 1, so they can be stored in 2 bytes.
+
+    """
+
+    def __init__(self, sequence: int, ack: int, ack_bitfield: str):
+        self.sequence = Sqn(sequence)
+        self.ack = Sqn(ack)
+        self.ack_bitfield = ack_bitfield
+
+    def to_bytearray(self) -> bytearray:
+        """Return 12 bytes representing the header."""
+        result = bytearray(PROTOCOL_ID)
+        result.extend(self.sequence.to_sqn_bytes())
+        result.extend(self.ack.to_sqn_bytes())
+        result.extend(int(self.ack_bitfield, 2).to_bytes(4, "big"))
+        return result
+
+    def destructure(self) -> tuple:
+        """Return the tuple `(sequence, ack, ack_bitfield)`."""
+        return (self.sequence, self.ack, self.ack_bitfield)
+
+    @classmethod
+    def deconstruct_datagram(cls, datagram: bytes) -> tuple:
+        """Return a tuple containing the header and the rest of the datagram.
+
+        # Arguments
+        datagram (bytes): serialized PyGaSe package to deconstruct
+
+        # Returns
+        tuple: `(header, payload)` with `payload` being a bytestring of the rest of the datagram
+
+        """
+        if datagram[:4] != PROTOCOL_ID:
+            raise ProtocolIDMismatchError
+        sequence = Sqn.from_sqn_bytes(datagram[4:6])
+        ack = Sqn.from_sqn_bytes(datagram[6:8])
+        ack_bitfield = bin(int.from_bytes(datagram[8:12], "big"))[2:].zfill(32)
+        payload = datagram[12:]
+        return (cls(sequence, ack, ack_bitfield), payload)
+
+
+class Package(Comparable):
+    """Create a UDP package implementing the PyGaSe protocol.
+
+    # Arguments
+    header (Header): package header
+
+    # Arguments
+    events (pygase.event.Event): list events to attach to this package
+
+    # Attributes
+    header (Header):
+
+    # Members
+    events (pygase.event.Event): see corresponding constructor argument
+
+    ---
+    PyGaSe servers and clients use the subclasses #ServerPackage and #ClientPackage respectively.
+    The #Package class would also work on its own (it's not an 'abstract' class), in which case you would have
+    all features of PyGaSe except for a synchronized game state.
+
+    """
+
+    _timeout: float = 1.0  # package timeout in seconds until the round trip time has been measured
+    _max_size: int = 2048  # the maximum size of PyGaSe package in bytes
+
+    def __init__(self, header: Header, events: list = None):
+        self.header = header
+        self._events = events if events is not None else []
+        # serialized events that were known before they were added to the package
+        self._event_bytepacks: list[bytes | None] = [None] * len(self._events)
+        self._datagram: bytes = None
+
+    @property
+    def events(self) -> list:
+        """Get a list of the events in the package."""
+        return self._events.copy()
+
+    def add_event(self, event: Event, bytepack: bytes | None = None) -> None:
+        """Add a PyGaSe event to the package.
+
+        # Arguments
+        event (pygase.event.Event): the event to be attached to this package
+        bytepack (bytes): `event.to_bytes()`, if it is already known
+
+        # Raises
+        OverflowError: if the package has previously been converted to a datagram and
+           and its size with the added event would exceed #Package._max_size (2048 bytex)
+
+        """
+        if self._datagram is not None:
+            if bytepack is None:
+                bytepack = event.to_bytes()
+            if len(self._datagram) + len(bytepack) + 2 > self._max_size:
+                raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
+            self._datagram += len(bytepack).to_bytes(2, "big") + bytepack
+        self._events.append(event)
+        self._event_bytepacks.append(bytepack)
+
+    def get_bytesize(self) -> int:
+        """Return the size in bytes the package has as a datagram."""
+        if self._datagram is None:
+            self._datagram = self.to_datagram()
+        return len(self._datagram)
+
+    def to_datagram(self) -> bytes:
+        """Return package compactly serialized to `bytes`.
+
+        # Raises
+        OverflowError: if the resulting datagram would exceed #Package._max_size
+
+        """
+        if self._datagram is not None:
+            return self._datagram
+        datagram = self.header.to_bytearray()
+        # The header makes up the first 12 bytes of the package
+        datagram.extend(self._create_event_block())
+        if len(datagram) > self._max_size:
+            raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
+        self._datagram = bytes(datagram)
+        return self._datagram
+
+    def _create_event_block(self) -> bytearray:
+        event_block = bytearray()
+        for event, bytepack in zip(self._events, self._event_bytepacks):
+            if bytepack is None:
+                bytepack = event.to_bytes()
+            event_block.extend(len(bytepack).to_bytes(2, "big"))
+            event_block.extend(bytepack)
+        return event_block
+
+    @classmethod
+    def from_datagram(cls, datagram: bytes) -> "Package":
+        """Deserialize datagram to #Package.
+
+        # Arguments
+        datagram (bytes): bytestring to deserialize, typically received via network
+
+        # Returns
+        Package: the deserialized package
+
+        # Raises
+        ProtocolIDMismatchError: if the first four bytes don't match the PyGaSe protocol ID, or if the datagram
+            is too short for the fixed fields of the package type
+
+        """
+        header, payload = Header.deconstruct_datagram(datagram)
+        events = cls._read_out_event_block(payload)
+        result = cls(header, events)
+        result._datagram = datagram  # pylint: disable=protected-access
+        return result
+
+    @staticmethod
+    def _read_out_event_block(event_block: bytes) -> list:
+        events = []
+        while event_block:
+            bytesize = int.from_bytes(event_block[:2], "big")
+            events.append(Event.from_bytes(event_block[2 : bytesize + 2]))
+            event_block = event_block[bytesize + 2 :]
+        return events
+
+
+class ClientPackage(Package):
+    """Subclass of #Package for packages sent by PyGaSe clients.
+
+    # Arguments
+    time_order (int): the clients last known time order of the game state
+    timestamp (float): `time.time()` of the client when the package was created, for clock synchronization
+
+    # Attributes
+    time_order (int): see corresponding constructor argument
+    timestamp (float): see corresponding constructor argument
+
+    """
+
+    def __init__(self, header: Header, time_order: int, events: list = None, timestamp: float = 0.0):
+        super().__init__(header, events)
+        self.time_order = Sqn(time_order)
+        self.timestamp = timestamp
+
+    def to_datagram(self) -> bytes:
+        """Override `Package.to_datagram` to include `time_order` and `timestamp`."""
+        if self._datagram is not None:
+            return self._datagram
+        datagram = self.header.to_bytearray()
+        # The header makes up the first 12 bytes of the package
+        datagram.extend(self.time_order.to_sqn_bytes())
+        datagram.extend(struct.pack("!d", self.timestamp))
+        datagram.extend(self._create_event_block())
+        if len(datagram) > self._max_size:
+            raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
+        self._datagram = bytes(datagram)
+        return self._datagram
+
+    @classmethod
+    def from_datagram(cls, datagram: bytes) -> "ClientPackage":
+        """Override #Package.from_datagram to include `time_order` and `timestamp`."""
+        header, payload = Header.deconstruct_datagram(datagram)
+        if len(payload) < 10:
+            raise ProtocolIDMismatchError("Datagram is too short for a client package.")
+        time_order = Sqn.from_sqn_bytes(payload[:2])
+        (timestamp,) = struct.unpack("!d", payload[2:10])
+        payload = payload[10:]
+        events = cls._read_out_event_block(payload)
+        result = cls(header, time_order, events, timestamp)
+        result._datagram = datagram  # pylint: disable=protected-access
+        return result
+
+
+class SyncTimestamps(NamedTuple):
+    """Timestamps that a #ServerPackage carries, so the client can synchronize its clock with the server's.
+
+    # Attributes
+    sent (float): `time.time()` of the server when the package was created
+    echoed (float): timestamp of the last #ClientPackage the server received, `0.0` if there is none
+    held (float): time in seconds between receiving the echoed timestamp and creating the package
+
+    """
+
+    sent: float = 0.0
+    echoed: float = 0.0
+    held: float = 0.0
+
+
+class ServerPackage(Package):
+    """Subclass of #Package for packages sent by PyGaSe servers.
+
+    # Arguments
+    game_state_update (pygase.gamestate.GameStateUpdate): the servers most recent minimal update for the client
+    input_ack (int): input sequence number of the last predicted client event that has been applied to the
+        game state (see #pygase.Client.register_prediction_handler())
+    timestamps (SyncTimestamps): timestamps for clock synchronization
+
+    # Attributes
+    game_state_update (pygase.gamestate.GameStateUpdate): see corresponding constructor argument
+    input_ack (pygase.utils.Sqn): see corresponding constructor argument
+    timestamps (SyncTimestamps): see corresponding constructor argument
+
+    """
+
+    def __init__(
+        self,
+        header: Header,
+        game_state_update: GameStateUpdate,
+        events: list = None,
+        input_ack: int = 0,
+        timestamps: SyncTimestamps = SyncTimestamps(),
+    ):
+        super().__init__(header, events)
+        self.game_state_update = game_state_update
+        self.input_ack = Sqn(input_ack)
+        self.timestamps = timestamps
+
+    def to_datagram(self) -> bytes:
+        """Override #Package.to_datagram to include `game_state_update`, `input_ack` and `timestamps`."""
+        if self._datagram is not None:
+            return self._datagram
+        datagram = self.header.to_bytearray()
+        # The header makes up the first 12 bytes of the package
+        datagram.extend(self.input_ack.to_sqn_bytes())
+        datagram.extend(struct.pack("!ddf", *self.timestamps))
+        state_update_bytepack = self.game_state_update.to_bytes()
+        datagram.extend(len(state_update_bytepack).to_bytes(2, "big"))
+        datagram.extend(state_update_bytepack)
+        datagram.extend(self._create_event_block())
+        if len(datagram) > self._max_size:
+            raise OverflowError("package exceeds the maximum size of " + str(self._max_size) + " bytes")
+        self._datagram = bytes(datagram)
+        return self._datagram
+
+    @classmethod
+    def from_datagram(cls, datagram: bytes) -> "ServerPackage":
+        """Override #Package.from_datagram to include `game_state_update`, `input_ack` and `timestamps`."""
+        header, payload = Header.deconstruct_datagram(datagram)
+        if len(payload) < 22:
+            raise ProtocolIDMismatchError("Datagram is too short for a server package.")
+        input_ack = Sqn.from_sqn_bytes(payload[:2])
+        timestamps = SyncTimestamps(*struct.unpack("!ddf", payload[2:22]))
+        payload = payload[22:]
+        state_update_bytesize = int.from_bytes(payload[:2], "big")
+        game_state_update = cast(GameStateUpdate, GameStateUpdate.from_bytes(payload[2 : state_update_bytesize + 2]))
+        payload = payload[state_update_bytesize + 2 :]
+        events = cls._read_out_event_block(payload)
+        result = cls(header, game_state_update, events, input_ack, timestamps)
+        result._datagram = datagram  # pylint: disable=protected-access
+        return result
+
+
+class ReliableEventChannel:
+    """Keep track of the reliable events sent and received via a #pygase.connection.Connection.
+
+    Reliable events are numbered with message IDs and remembered until a package that carries them is acked.
+    If a package that carries reliable events is lost, they are resent with the next packages. The receiving
+    side drops duplicates and holds back ordered events until all reliable events before them have arrived.
+
+    """
+
+    def __init__(self) -> None:
+        self._message_id = Sqn(0)
+        # maps message IDs of unacked reliable events to the events and their callback sequence numbers
+        self._unacked_events: dict[Sqn, tuple[Event, int]] = {}
+        self._events_in_flight: dict[Sqn, list[Sqn]] = {}
+        self._resends: deque[Sqn] = deque()
+        self._next_expected_id = Sqn(1)  # all reliable events with lower message IDs have been received
+        self._received_ids: set[Sqn] = set()
+        self._ordered_backlog: dict[Sqn, Event] = {}
+
+    def track(self, event: Event, callback_sequence: int, ordered: bool = False) -> Event:
+        """Return a copy of `event` with the next message ID that is resent until it is acked.
+
+        The event is copied, so the same event can be dispatched via several connections.
+
+        """
+        self._message_id += 1
+        reliable_event = copy.copy(event)
+        reliable_event.reliable_id = self._message_id
+        reliable_event.ordered = ordered
+        self._unacked_events[self._message_id] = (reliable_event, callback_sequence)
+        return reliable_event
+
+    def is_settled(self) -> bool:
+        """Return whether all sent reliable events have been acked."""
+        return not self._unacked_events
+
+    def pop_resends(self, max_count: int) -> list[Event]:
+        """Return up to `max_count` unacked reliable events whose packages have been lost."""
+        events: list[Event] = []
+        while len(events) < max_count and self._resends:
+            message_id = self._resends.popleft()
+            if message_id in self._unacked_events:
+                events.append(self._unacked_events[message_id][0])
+        return events
+
+    def record_sent(self, sequence: Sqn, events: list[Event]) -> None:
+        """Remember which reliable events have been sent with the package of sequence number `sequence`."""
+        message_ids = [Sqn(event.reliable_id) for event in events if event.reliable_id]
+        if message_ids:
+            self._events_in_flight[sequence] = message_ids
+
+    def acknowledge(self, sequence: Sqn) -> list[int]:
+        """Forget the reliable events of an acked package and return their callback sequence numbers."""
+        callback_sequences = []
+        for message_id in self._events_in_flight.pop(sequence, []):
+            if message_id in self._unacked_events:
+                callback_sequences.append(self._unacked_events.pop(message_id)[1])
+        return callback_sequences
+
+    def handle_loss(self, sequence: Sqn) -> None:
+        """Schedule the unacked reliable events of a lost package to be resent."""
+        for message_id in self._events_in_flight.pop(sequence, []):
+            self.schedule_resend(message_id)
+
+    def schedule_resend(self, message_id: Sqn) -> None:
+        """Schedule an unacked reliable event to be resent."""
+        if message_id in self._unacked_events:
+            logger.debug(f"Resending reliable event with message ID {message_id}.")
+            self._resends.append(message_id)
+
+    def receive(self, event: Event) -> list[Event]:
+        """Return the received events that are ready to be handled, in order, after receiving a reliable event."""
+        message_id = Sqn(event.reliable_id)
+        if message_id < self._next_expected_id or message_id in self._received_ids:
+            logger.debug(f"Dropping duplicate of reliable event with message ID {message_id}.")
+            return []
+        self._received_ids.add(message_id)
+        while self._next_expected_id in self._received_ids:
+            self._received_ids.remove(self._next_expected_id)
+            self._next_expected_id += 1
+        received_events = []
+        if event.ordered:
+            self._ordered_backlog[message_id] = event
+        else:
+            received_events.append(event)
+        for backlog_id in sorted(self._ordered_backlog):
+            if not backlog_id < self._next_expected_id:
+                break
+            received_events.append(self._ordered_backlog.pop(backlog_id))
+        return received_events
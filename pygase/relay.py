@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Relay the game state of an upstream server to more clients.
+
+# Contents
+- #RelayConnection: subclass of #pygase.connection.ClientConnection that mirrors the upstream game state
+- #Relay: main API class for relays that serve the game state of an upstream server to more clients
+
+"""
+
+from typing import Any, cast
+
+from pygase import aio
+from pygase.aio import awaitable
+
+from pygase.backend import GameStateStore
+from pygase.server import Server
+from pygase.connection import (
+    RELAY_HANDSHAKE,
+    ClientConnection,
+    EventHandlerProtocol,
+    GameStateStoreProtocol,
+)
+from pygase.packages import ClientPackage, ServerPackage
+from pygase.event import Event
+from pygase.utils import Sqn, logger
+
+
+class RelayConnection(ClientConnection):
+    """Subclass of #pygase.connection.ClientConnection for relays that mirror the game state of an upstream server.
+
+    Instead of keeping a game state of its own, the connection pushes the received updates to a
+    #pygase.GameStateStore, from which a #pygase.Server serves downstream clients. It identifies itself as a relay
+    with the first event it sends, to which the upstream server replies with a #pygase.connection.RELAY_HANDSHAKE
+    event whose `accepted` argument tells whether it accepts the relay. Only after an accepting reply, the
+    connection mirrors the game state and forwards events, so updates filtered for regular clients never end up
+    in the store.
+
+    # Arguments
+    relay_key (str): key with which the upstream server accepts relays
+    game_state_store (pygase.GameStateStore): store that mirrors the upstream game state
+
+    # Attributes
+    game_state_store (pygase.GameStateStore): see corresponding constructor argument
+    accepted (bool): whether the upstream server has accepted the connection as a relay
+
+    """
+
+    def __init__(
+        self,
+        remote_address: tuple[str, int],
+        event_handler: EventHandlerProtocol,
+        relay_key: str,
+        game_state_store: GameStateStoreProtocol,
+    ) -> None:
+        super().__init__(remote_address, event_handler)
+        self.game_state_store = game_state_store
+        self.accepted = False
+        self._held_events: list[tuple[Event, str]] = []
+        self.dispatch_event(Event(RELAY_HANDSHAKE, key=relay_key), delivery="reliable")
+
+    def _accept_event(self, event: Event) -> bool:
+        """Override #pygase.connection.Connection._accept_event to consume the reply to the relay handshake."""
+        if event.type != RELAY_HANDSHAKE:
+            return True
+        if event.handler_kwargs.get("accepted") is True:
+            self._accept()
+        else:
+            logger.warning(f"Relay has been rejected by the server at {self.remote_address}.")
+        return False
+
+    def _accept(self) -> None:
+        """Start mirroring and forward the held events once the upstream server has accepted the relay."""
+        if self.accepted:
+            return
+        logger.info(f"Relay has been accepted by the server at {self.remote_address}.")
+        self.accepted = True
+        for event, delivery in self._held_events:
+            self.dispatch_event(event, delivery=delivery)
+        self._held_events = []
+
+    def forward_event(self, event: Event) -> None:
+        """Forward an event from a downstream client to the upstream server.
+
+        The event keeps its data, including the `client_address` of the downstream client, and is forwarded with
+        the same delivery it was received with. Events are held back until the upstream server has accepted the relay.
+
+        """
+        forwarded_event = Event(event.type, *event.handler_args, **event.handler_kwargs)
+        # Only set on instances, so events that don't take part in prediction or lag compensation stay compact.
+        if event.input_sequence:
+            forwarded_event.input_sequence = event.input_sequence
+        if event.view_time_order:
+            forwarded_event.view_time_order = event.view_time_order
+        delivery = ("ordered" if event.ordered else "reliable") if event.reliable_id else "unreliable"
+        if self.accepted:
+            self.dispatch_event(forwarded_event, delivery=delivery)
+        else:
+            self._held_events.append((forwarded_event, delivery))
+
+    def _create_next_package(self) -> ClientPackage:
+        """Override #pygase.connection.ClientConnection._create_next_package to report the mirrored time order."""
+        package = super()._create_next_package()
+        # Until the relay is accepted, nothing is mirrored, so the first update after that is the whole game state.
+        package.time_order = self.game_state_store.get_game_state().time_order if self.accepted else Sqn(0)
+        return package
+
+    async def _apply_update(self, package: ServerPackage) -> bool:
+        """Override #pygase.connection.ClientConnection._apply_update to push updates to the game state store."""
+        if not self.accepted or not package.game_state_update > self.game_state_store.get_game_state():
+            return False
+        self.game_state_store.push_update(package.game_state_update)
+        return True
+
+
+class Relay:
+    """Serve the game state of an upstream server to more clients, to spread them across several nodes.
+
+    A relay connects to the authoritative #pygase.Server like a client and identifies itself with the key the server
+    accepts relays with (see #pygase.Server.allow_relays()). It mirrors the upstream game state into its own
+    #pygase.GameStateStore, from which its own #pygase.Server serves downstream clients with the usual protocol.
+    Events from downstream clients are forwarded upstream, events from the upstream server are broadcast
+    to all downstream clients.
+
+    # Arguments
+    relay_key (str): key with which the upstream server accepts relays
+
+    # Attributes
+    game_state_store (GameStateStore): mirror of the upstream game state
+    server (Server): serves the downstream clients and can be configured like any other #pygase.Server
+    connection (RelayConnection): connection to the upstream server, `None` until the relay runs
+
+    # Example
+    ```python
+    # On the node of the authoritative backend:
+    backend.server.allow_relays("secret")
+    # On each relay node:
+    Relay("secret").run(upstream_port=8080, upstream_hostname="10.0.0.1", port=8080, hostname="0.0.0.0")
+    ```
+
+    ---
+    The upstream server can't dispatch events to individual downstream clients, and the input acks of
+    downstream clients aren't relayed, so they can't reconcile predicted game states.
+
+    """
+
+    def __init__(self, relay_key: str) -> None:
+        logger.debug("Creating Relay instance.")
+        self.game_state_store = GameStateStore()
+        self.server = Server(self.game_state_store)
+        self.connection: RelayConnection | None = None
+        self._relay_key = relay_key
+
+    def _create_connection(self, upstream_port: int, upstream_hostname: str) -> RelayConnection:
+        self.connection = RelayConnection(
+            (upstream_hostname, upstream_port), _Rebroadcast(self.server), self._relay_key, self.game_state_store
+        )
+        return self.connection
+
+    def run(
+        self, upstream_port: int, upstream_hostname: str = "localhost", port: int = 0, hostname: str = "localhost"
+    ) -> None:
+        """Connect to the upstream server and serve downstream clients under a specified address.
+
+        This is a blocking function but can also be spawned as a coroutine. It returns after the relay's
+        server has been shut down via #Relay.shutdown().
+
+        # Arguments
+        upstream_port (int): port number of the upstream server
+        upstream_hostname (str): hostname or IPv4 address of the upstream server
+        port (int): port number the relay's server will be bound to, see #pygase.Server.run()
+        hostname (str): hostname or IP address the relay's server will be bound to
+
+        """
+        aio.run(self.run, upstream_port, upstream_hostname, port, hostname)
+
+    @awaitable(run)
+    async def run(  # pylint: disable=function-redefined
+        self, upstream_port: int, upstream_hostname: str = "localhost", port: int = 0, hostname: str = "localhost"
+    ) -> None:
+        # pylint: disable=missing-docstring
+        connection = self._create_connection(upstream_port, upstream_hostname)
+        upstream_loop = await aio.spawn(connection.loop)
+        try:
+            server_loop = await aio.spawn(self.server.run, port, hostname, self)
+            await server_loop.join()
+        finally:
+            await (await aio.spawn(connection.shutdown)).join()
+            await upstream_loop.join()
+        logger.info("Relay successfully shut down.")
+
+    async def _push_event(self, event: Event) -> None:
+        """Forward an event from a downstream client to the upstream server, as the event wire of the server."""
+        if self.connection is not None:
+            self.connection.forward_event(event)
+
+    def shutdown(self) -> None:
+        """Shut down the relay's server and its connection to the upstream server.
+
+        This method can also be spawned as a coroutine.
+
+        """
+        aio.run(self.shutdown)
+
+    @awaitable(shutdown)
+    async def shutdown(self) -> None:  # pylint: disable=function-redefined
+        # pylint: disable=missing-docstring
+        await (await aio.spawn(self.server.shutdown)).join()
+
+
+class _Rebroadcast:
+    """Event handler for the upstream connection of a #Relay that broadcasts all events to its clients."""
+
+    def __init__(self, server: Server) -> None:
+        self._server = server
+
+    def has_event_type(self, event_type: str) -> bool:
+        """Accept events of all types."""
+        del event_type
+        return True
+
+    async def handle(self, event: Event, **kwargs: object) -> None:
+        """Dispatch an event to all downstream clients with the delivery it was received with."""
+        del kwargs
+        delivery = ("ordered" if event.ordered else "reliable") if event.reliable_id else "unreliable"
+        self._server.dispatch_event(
+            event.type, *event.handler_args, delivery=delivery, **cast(dict[str, Any], event.handler_kwargs)
+        )
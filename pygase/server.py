@@ -0,0 +1,816 @@
+# -*- coding: utf-8 -*-
+"""Serve PyGaSe clients.
+
+Provides the `Server` class and the server side of client-server connections.
+
+# Contents
+- #Server: main API class for PyGaSe servers
+- #ServerConnection: subclass of #pygase.connection.Connection for the server side
+
+"""
+
+import hmac
+import time
+import asyncio
+import threading
+from contextlib import suppress
+from collections.abc import Callable
+from typing import Any, Protocol, cast
+
+from pygase import aio
+from pygase.aio import socket, awaitable
+
+from pygase.utils import Sqn, TokenBucket, logger
+from pygase.event import UniversalEventHandler, Event, EventHandler
+from pygase.gamestate import GameState, GameStateUpdate, InterestFilter, PriorityAccumulator, combine_changes
+from pygase.packages import (
+    ProtocolIDMismatchError,
+    Header,
+    Package,
+    ClientPackage,
+    SyncTimestamps,
+    ServerPackage,
+)
+from pygase.connection import (
+    RELAY_HANDSHAKE,
+    ConnectionStatus,
+    Connection,
+    EventHandlerProtocol,
+    EventWire,
+    GameStateStoreProtocol,
+)
+
+
+class ServerProtocol(Protocol):
+    """Protocol for server state accessed in the server connection loop."""
+
+    _hostname: str | None
+    _port: int | None
+    _universal_event_handler: EventHandlerProtocol
+    game_state_store: GameStateStoreProtocol
+    connections: dict[tuple[str, int], "ServerConnection"]
+    host_client: tuple[str, int] | None
+    groups: dict[str, set[tuple[str, int]]]
+    interest_filters: list[InterestFilter]
+    coalescing_keys: dict[str, int | str | None]
+    rate_limits: dict[str | None, tuple[float, float | None]]
+    queue_limits: dict[str, tuple[int, str]]
+    bandwidth_budget: float | None
+    priorities: dict[str, Callable[[tuple[str, int], GameState, Any, Any], float]]
+    tick_aligned: bool
+    precise_timing: bool
+    relay_key: str | None
+
+
+class Server:
+    """Listen to clients and orchestrate the flow of events and state updates.
+
+    The #Server instance does not contain game logic or state, it is only responsible for connections
+    to clients. The state is provided by a #GameStateStore and game logic by a #pygase.GameStateMachine.
+
+    # Arguments
+    game_state_store (pygase.GameStateStore): part of the backend that provides an interface to the #pygase.GameState
+
+    # Attributes
+    connections (dict): contains each clients address as a key leading to the
+        corresponding #ServerConnection instance
+    host_client (tuple): address of the host client (who has permission to shutdown the server), if there is any
+    game_state_store (pygase.GameStateStore): game state repository
+    groups (dict): maps names of client groups to the sets of addresses of their members
+    coalescing_keys (dict): maps types of events of which only the latest pending one is sent to each client
+        to the event argument that distinguishes them, see #Server.register_coalescing_event()
+    rate_limits (dict): maps event types (or `None` for all events) to `(events_per_second, burst)` limits
+        for the events received from each client, see #Server.set_rate_limit()
+    queue_limits (dict): maps names of client connection queues to `(maxsize, policy)`,
+        see #Server.set_queue_limit()
+    interest_filters (list): #pygase.gamestate.InterestFilter objects that apply to all client connections
+    bandwidth_budget (float): maximum number of bytes per second for the game state updates sent to each client,
+        or `None` for no limit
+    priorities (dict): maps names of game state collections to functions that prioritize their entities
+        if a client's bandwidth budget is exceeded, see #Server.register_priority()
+    tick_aligned (bool): whether client connections send packages right after each update pushed to the
+        game state store instead of on their own timers, see #ServerConnection
+    precise_timing (bool): whether client connections send packages on absolute deadlines with
+        #pygase.aio.sleep_until(), which keeps a fixed send phase at the cost of some CPU time
+    relay_key (str): key with which #pygase.Relay instances are accepted, `None` if relays are not allowed,
+        see #Server.allow_relays()
+
+    # Members
+    hostname (str): read-only access to the servers hostname
+    port (int): read-only access to the servers port number
+
+    """
+
+    def __init__(self, game_state_store: GameStateStoreProtocol):
+        logger.debug("Creating Server instance.")
+        self.connections: dict = {}
+        self.host_client: tuple = None
+        self.game_state_store = game_state_store
+        self.groups: dict[str, set[tuple[str, int]]] = {}
+        self.coalescing_keys: dict[str, int | str | None] = {}
+        self.rate_limits: dict[str | None, tuple[float, float | None]] = {}
+        self.queue_limits: dict[str, tuple[int, str]] = {}
+        self.interest_filters: list[InterestFilter] = []
+        self.bandwidth_budget: float | None = None
+        self.priorities: dict[str, Callable[[tuple[str, int], GameState, Any, Any], float]] = {}
+        self.tick_aligned: bool = False
+        self.precise_timing: bool = False
+        self.relay_key: str | None = None
+        self._universal_event_handler: UniversalEventHandler = UniversalEventHandler()
+        self._hostname: str = None
+        self._port: int = None
+
+    def run(self, port: int = 0, hostname: str = "localhost", event_wire: EventWire | None = None) -> None:
+        """Start the server under a specified address.
+
+        This is a blocking function but can also be spawned as a coroutine or in a thread
+        via #Server.run_in_thread().
+
+        # Arguments
+        port (int): port number the server will be bound to, default will be an available
+           port chosen by the computers network controller
+        hostname (str): hostname or IP address the server will be bound to.
+           Defaults to `'localhost'`.
+        event_wire (GameStateMachine): object to which events are to be repeated
+           (has to implement a `_push_event(event)` method and is typically a #pygase.GameStateMachine)
+
+        """
+        aio.run(self.run, port, hostname, event_wire)
+
+    @awaitable(run)
+    async def run(  # pylint: disable=function-redefined
+        self, port: int = 0, hostname: str = "localhost", event_wire: EventWire | None = None
+    ) -> None:
+        # pylint: disable=missing-docstring
+        await ServerConnection.loop(hostname, port, self, event_wire)
+
+    def run_in_thread(
+        self, port: int = 0, hostname: str = "localhost", event_wire: EventWire | None = None, daemon: bool = True
+    ) -> threading.Thread:
+        """Start the server in a seperate thread.
+
+        See #Server.run().
+
+        # Returns
+        threading.Thread: the thread the server loop runs in
+
+        """
+        thread = threading.Thread(target=self.run, args=(port, hostname, event_wire), daemon=daemon)
+        thread.start()
+        return thread
+
+    @property
+    def hostname(self) -> str:
+        """Get the hostname or IP address on which the server listens.
+
+        Returns `None` when the server is not running.
+
+        """
+        return "localhost" if self._hostname == "127.0.0.1" else self._hostname
+
+    @property
+    def port(self) -> int:
+        """Get the port number on which the server listens.
+
+        Returns `None` when the server is not running.
+
+        """
+        return self._port
+
+    def shutdown(self) -> None:
+        """Shut down the server.
+
+        The server can be restarted via #Server.run() in which case it will remember previous connections.
+        This method can also be spawned as a coroutine.
+
+        """
+        aio.run(self.shutdown)
+
+    @awaitable(shutdown)
+    async def shutdown(self) -> None:  # pylint: disable=function-redefined
+        # pylint: disable=missing-docstring
+        async with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            await sock.sendto("shut_me_down".encode("utf-8"), (self._hostname, self._port))
+
+    # advanced type checking for target client and callback would be helpful
+    def dispatch_event(
+        self,
+        event_type: str,
+        *args: object,
+        target_client: tuple[str, int] | str = "all",
+        retries: int = 0,
+        ack_callback: EventHandler | None = None,
+        delivery: str = "unreliable",
+        **kwargs: object,
+    ) -> None:
+        """Send an event to one or all clients.
+
+        # Arguments
+        event_type (str): identifies the event and links it to a handler
+        target_client (tuple, str): either `'all'` for an event broadcast, the name of a client group
+            (see #Server.add_to_group()), or a clients address as a tuple
+        retries (int): number of times the event is to be resent in case it times out
+        ack_callback (callable, coroutine): will be executed after the event was received
+            and be passed a reference to the corresponding #ServerConnection instance
+        delivery (str): `'unreliable'`, `'reliable'` or `'ordered'`, see #pygase.connection.Connection.dispatch_event()
+
+        Additional positional and keyword arguments will be sent as event data and passed to the clients
+        handler function.
+
+        # Raises
+        KeyError: if `target_client` is neither `'all'`, nor a known group or client address
+
+        ---
+        Reliable events are resent as soon as their loss is detected, which makes `retries` unnecessary for them.
+        Timed out events of a broadcast are only resent to the clients that did not receive them.
+
+        """
+        event = Event(event_type, *args, **kwargs)
+
+        def get_ack_callback(connection: object) -> Callable[[], object] | None:
+            if ack_callback is not None:
+                return lambda: ack_callback(connection)
+            return None
+
+        def get_timeout_callback(client_address: tuple[str, int]) -> Callable[[], object] | None:
+            if retries <= 0 or delivery != "unreliable":
+                return None
+
+            def timeout_callback() -> None:
+                self.dispatch_event(
+                    event_type,
+                    *args,
+                    target_client=client_address,
+                    retries=retries - 1,
+                    ack_callback=ack_callback,
+                    delivery=delivery,
+                    **kwargs,
+                )
+                logger.warning(f"Event of type {event_type} timed out. Retrying to send event to {client_address}.")
+
+            return timeout_callback
+
+        if isinstance(target_client, tuple):
+            target_clients = [target_client]
+        elif target_client == "all":
+            target_clients = list(self.connections)
+        else:
+            target_clients = [address for address in self.groups[target_client] if address in self.connections]
+        # Broadcast events are serialized once and the bytes are shared by the connections of all target clients.
+        bytepack = event.to_bytes() if len(target_clients) > 1 and delivery == "unreliable" else None
+        for client_address in target_clients:
+            connection = self.connections[client_address]
+            connection.dispatch_event(
+                event, get_ack_callback(connection), get_timeout_callback(client_address), delivery, bytepack=bytepack
+            )
+
+    def register_coalescing_event(self, event_type: str, key: int | str | None = None) -> None:
+        """Only send the latest pending event of a type to each client, like positions that supersede each other.
+
+        Events that are reliable or have an `ack_callback` are never replaced.
+
+        # Arguments
+        event_type (str): type of the events to coalesce
+        key (int, str): position or keyword of the event argument that distinguishes events which don't
+            replace each other, e.g. an entity id, or `None` to keep only one pending event of the type
+
+        """
+        logger.info(f"Registering coalescing event type {event_type}.")
+        self.coalescing_keys[event_type] = key
+
+    def set_rate_limit(
+        self, events_per_second: float, burst: float | None = None, event_type: str | None = None
+    ) -> None:
+        """Limit the rate of events that each client can send, to protect the server from floods of events.
+
+        Events that exceed a limit are dropped before they are handled or passed on to the game state machine.
+        The numbers of dropped events are counted in the `dropped_events` attribute of each client's connection.
+
+        # Arguments
+        events_per_second (float): average number of events per second that a client can send
+        burst (float): number of events a client can send at once, defaults to `events_per_second`
+        event_type (str): type of the events to limit, or `None` to limit all events of a client together
+
+        # Example
+        ```python
+        # Allow each client 60 events per second in total, but only 2 chat messages per second.
+        server.set_rate_limit(60)
+        server.set_rate_limit(2, burst=5, event_type="CHAT")
+        ```
+
+        """
+        logger.info(f"Limiting events of type {event_type} to {events_per_second} per second for each client.")
+        self.rate_limits[event_type] = (events_per_second, burst)
+
+    def set_queue_limit(self, queue: str, maxsize: int, policy: str = "drop_oldest") -> None:
+        """Bound the number of pending items in a queue of each client connection.
+
+        The limit applies to the connections of clients that connect afterwards.
+
+        # Arguments
+        queue (str): `'outgoing_events'` or `'incoming_events'`
+        maxsize (int): maximum number of pending items, `0` for no limit
+        policy (str): `'drop_oldest'`, `'drop_newest'`, `'coalesce'` (keep the latest event of each type)
+            or `'block'`, see #pygase.connection.Connection.set_queue_limit()
+
+        # Raises
+        KeyError: if `queue` is unknown
+        ValueError: if `policy` is unknown or `'block'` for the outgoing event queue
+
+        """
+        if queue not in ("outgoing_events", "incoming_events"):
+            raise KeyError(queue)
+        if policy not in aio.QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {aio.QUEUE_POLICIES}.")
+        if queue == "outgoing_events" and policy == "block":
+            raise ValueError("Dispatching events can't block, choose a policy that drops or coalesces events.")
+        logger.info(f"Limiting {queue} queues of client connections to {maxsize} items with policy {policy}.")
+        self.queue_limits[queue] = (maxsize, policy)
+
+    def allow_relays(self, relay_key: str) -> None:
+        """Accept #pygase.Relay instances that connect with a secret key, to serve more clients across several nodes.
+
+        A relay receives the whole game state, regardless of interest filters and bandwidth budget, and serves it
+        to its own clients. The events it forwards from them are handled with the `client_address` of the client
+        that sent them, and are not subject to rate limits, which the relay applies to its clients itself.
+        Relays that connected before are only accepted after they reconnect.
+
+        # Arguments
+        relay_key (str): key that relays have to present, see #pygase.Relay
+
+        """
+        logger.info("Allowing relays to connect to the server.")
+        self.relay_key = relay_key
+
+    def add_to_group(self, group: str, client_address: tuple[str, int]) -> None:
+        """Add a client to a named group of clients, like a team, a room or the spectators.
+
+        Events can be sent to all clients of a group via `dispatch_event(..., target_client=group)`.
+        A client can be a member of several groups. Clients whose connection times out are removed from all groups,
+        they have to be added again if they reconnect.
+
+        # Arguments
+        group (str): name of the group, which is created if it doesn't exist yet
+        client_address (tuple): address of the client
+
+        # Raises
+        ValueError: if `group` is `'all'`, which is reserved for broadcasts to all clients
+
+        """
+        if group == "all":
+            raise ValueError("The group name 'all' is reserved for broadcasts to all clients.")
+        logger.debug(f"Adding client {client_address} to group {group}.")
+        self.groups.setdefault(group, set()).add(client_address)
+
+    def remove_from_group(self, group: str, client_address: tuple[str, int]) -> None:
+        """Remove a client from a named group of clients, if it is a member of the group.
+
+        # Arguments
+        group (str): name of the group
+        client_address (tuple): address of the client
+
+        """
+        logger.debug(f"Removing client {client_address} from group {group}.")
+        self.groups.get(group, set()).discard(client_address)
+
+    # add advanced type checking for handler functions
+    def register_event_handler(self, event_type: str, event_handler_function: EventHandler) -> None:
+        """Register an event handler for a specific event type.
+
+        # Arguments
+        event_type (str): event type to link the handler function to
+        event_handler_function (callable, coroutine): will be called for received events of the given type
+
+        """
+        self._universal_event_handler.register_event_handler(event_type, event_handler_function)
+
+    def register_interest_filter(self, interest_filter: InterestFilter) -> None:
+        """Send each client only the entities of a game state collection that are relevant to it.
+
+        # Arguments
+        interest_filter (pygase.gamestate.InterestFilter): decides which entities are relevant to which client
+
+        # Example
+        ```python
+        # Only send players within 200 units of the client's own player.
+        server.register_interest_filter(
+            InterestFilter.within_radius(
+                "players", 200.0, lambda client_address, game_state: player_positions.get(client_address)
+            )
+        )
+        ```
+
+        """
+        logger.info(f"Registering interest filter for game state collection {interest_filter.collection}.")
+        self.interest_filters.append(interest_filter)
+
+    def register_priority(
+        self, collection: str, priority: Callable[[tuple[str, int], GameState, Any, Any], float]
+    ) -> None:
+        """Prioritize the entities of a game state collection for clients that exceed their bandwidth budget.
+
+        Changed entities whose updates don't fit into a client's `bandwidth_budget` are deferred until their
+        accumulated priority is high enough. Entities of collections without priority function have priority 1.
+
+        # Arguments
+        collection (str): name of the game state attribute that holds the entities
+        priority (callable): function `priority(client_address, game_state, key, entity)` that returns a
+            positive number, higher means the entity is sent more often
+
+        # Example
+        ```python
+        # Send at most 8 kB/s to each client and keep players close to the client's own player fresh.
+        server.bandwidth_budget = 8000
+        server.register_priority(
+            "players",
+            lambda client_address, game_state, key, player: 1 / (1 + distance(player, own_player(client_address))),
+        )
+        ```
+
+        """
+        logger.info(f"Registering priority function for game state collection {collection}.")
+        self.priorities[collection] = priority
+
+
+class ServerConnection(Connection):
+    """Subclass of #pygase.connection.Connection that describes the server side of a PyGaSe connection.
+
+    # Arguments
+    game_state_store (pygase.GameStateStore): object that serves as an interface to the game state repository
+        (has to provide the methods `get_game_state`, `get_update_since`, `get_input_ack` and `get_time_order_at`)
+    last_client_time_order (pygase.utils.Sqn): the last time order number known to the client
+
+    # Attributes
+    game_state_store (pygase.GameStateStore): see corresponding constructor argument
+    last_client_time_order (pygase.utils.Sqn): see corresponding constructor argument
+    interest_filters (list): #pygase.gamestate.InterestFilter objects that restrict the entities of
+        game state collections that are sent to the client
+    bandwidth_budget (float): maximum number of bytes per second for game state updates sent to the client,
+        or `None` for no limit
+    priority_accumulator (pygase.gamestate.PriorityAccumulator): decides which changes are sent first
+        if the bandwidth budget is exceeded
+    rate_limits (dict): maps event types to `(events_per_second, burst)` limits for events received from the client,
+        `None` as event type limits the events of all types together
+    dropped_events (dict): maps event types to the number of received events dropped due to rate limits
+    tick_aligned (bool): whether packages are sent right after the game state store receives an update,
+        instead of on the connection's own timer
+    relay_key (str): key with which the client can identify itself as a relay, `None` if relays are not allowed
+    is_relay (bool): whether the client is a relay, see #RelayConnection
+
+    ---
+    With a bandwidth budget, each package carries the game state changes with the highest accumulated priority
+    that fit into the budget. The other changes are deferred and sent with one of the following updates.
+
+    A tick-aligned connection sends its next package as soon as a new update has been pushed, but no sooner than
+    half the package interval after the previous one, so its send rate stays limited. Without new updates,
+    e.g. while the game is paused, it still sends a package every package interval.
+
+    Once a client has identified itself as a relay, it receives the whole game state without interest filters
+    or bandwidth budget, its events are not rate-limited and keep the client addresses of the downstream clients
+    they were forwarded for.
+
+    """
+
+    _max_sent_update_records: int = 256  # maximum number of sent time orders to remember the client's state for
+
+    def __init__(
+        self,
+        remote_address: tuple[str, int],
+        event_handler: EventHandlerProtocol,
+        game_state_store: GameStateStoreProtocol,
+        last_client_time_order: Sqn,
+        event_wire: EventWire | None = None,
+    ):
+        super().__init__(remote_address, event_handler, event_wire)
+        self.game_state_store = game_state_store
+        self.last_client_time_order = last_client_time_order
+        self.interest_filters: list[InterestFilter] = []
+        # maps the time orders of sent updates to the keys of the entities the client has at that time order
+        self._known_entities: dict[int, dict[str, frozenset]] = {}
+        self.bandwidth_budget: float | None = None
+        self.priority_accumulator = PriorityAccumulator()
+        # maps the time orders of sent updates to the changes the client is still missing at that time order
+        self._deferred_changes: dict[int, dict] = {}
+        self.rate_limits: dict[str | None, tuple[float, float | None]] = {}
+        self.dropped_events: dict[str, int] = {}
+        self._token_buckets: dict[str | None, TokenBucket] = {}
+        self.tick_aligned: bool = False
+        self._client_idle = False
+        # timestamp of the last client package and when it was received, echoed for clock synchronization
+        self._client_timestamp = (0.0, 0.0)
+        self.relay_key: str | None = None
+        self.is_relay = False
+
+    async def _sleep_until_next_send(self, next_send: float, clock: Callable[[], float]) -> None:
+        """Extend #pygase.connection.Connection._sleep_until_next_send to wake up after updates if tick-aligned."""
+        if not self.tick_aligned:
+            await super()._sleep_until_next_send(next_send, clock)
+            return
+        sent_time_order = self.game_state_store.get_game_state().time_order
+        await super()._sleep_until_next_send(next_send - self._package_interval / 2, clock)
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.game_state_store.wait_for_update(sent_time_order), max(next_send - clock(), 0))
+
+    def _create_next_package(self) -> ServerPackage:
+        """Override #pygase.connection.Connection._create_next_package to include game state updates."""
+        # The input ack is read before the update cache, because the state machine acknowledges inputs
+        # only after pushing the update that contains their effects.
+        input_ack = self.game_state_store.get_input_ack(self.remote_address)
+        known_entities = self._known_entities.get(int(self.last_client_time_order))
+        deferred_changes = self._deferred_changes.get(int(self.last_client_time_order))
+        # Respond by sending the sum of all updates since the client's time-order point. Or the whole game state
+        # if the client doesn't have it yet, or the entities it knows or the changes it misses are unclear.
+        if (
+            self.last_client_time_order == 0
+            or (self.interest_filters and known_entities is None)
+            or (self.bandwidth_budget is not None and deferred_changes is None)
+        ):
+            logger.debug(f"Sending full game state to client {self.remote_address}.")
+            game_state = self.game_state_store.get_game_state()
+            update = GameStateUpdate(game_state.time_order, game_status=game_state.game_status, **game_state.data)
+            known_entities = None
+            deferred_changes = None
+        else:
+            update = self.game_state_store.get_update_since(self.last_client_time_order)
+            logger.debug(
+                (
+                    f"Sending update from time order {self.last_client_time_order} "
+                    f"to {update.time_order} to client {self.remote_address}."
+                )
+            )
+        if self.interest_filters:
+            update = self._filter_interest(update, known_entities)
+        if self.bandwidth_budget is not None:
+            update = self._apply_bandwidth_budget(update, deferred_changes)
+        echoed, received = self._client_timestamp
+        now = time.time()
+        return ServerPackage(
+            Header(self.local_sequence, self.remote_sequence, self.ack_bitfield),
+            update,
+            input_ack=input_ack,
+            timestamps=SyncTimestamps(now, echoed, now - received if echoed else 0.0),
+        )
+
+    def _filter_interest(
+        self, update: GameStateUpdate, known_entities: dict[str, frozenset] | None
+    ) -> GameStateUpdate:
+        """Restrict the collections in `update` to the entities that are relevant to the client.
+
+        The relevant entities are remembered as known to the client at the time order of `update`, so that
+        the next update can contain the entities that enter or leave the client's interest. Clients ignore
+        updates with a time order they already have, so all packages with the same time order must contain
+        the same entities.
+
+        """
+        game_state = self.game_state_store.get_game_state()
+        filtered_update = GameStateUpdate(update.time_order)
+        filtered_update.data = dict(update.data)
+        relevant_entities = dict(self._known_entities.get(int(update.time_order), {}))
+        for interest_filter in self.interest_filters:
+            collection = interest_filter.collection
+            if collection not in relevant_entities:
+                relevant_entities[collection] = interest_filter.relevant_keys(self.remote_address, game_state)
+            relevant = relevant_entities[collection]
+            known = None if known_entities is None else known_entities.get(collection, frozenset())
+            changes = interest_filter.filter_changes(filtered_update.data.get(collection), game_state, relevant, known)
+            if changes or collection in filtered_update.data:
+                filtered_update.data[collection] = changes
+        # The client reports the time order of the last update it applied, so it knows the entities sent with it.
+        self._known_entities[int(update.time_order)] = relevant_entities
+        while len(self._known_entities) > self._max_sent_update_records:
+            del self._known_entities[next(iter(self._known_entities))]
+        return filtered_update
+
+    def _apply_bandwidth_budget(self, update: GameStateUpdate, deferred_changes: dict | None) -> GameStateUpdate:
+        """Restrict `update` to the changes with the highest priority that fit into the bandwidth budget.
+
+        The changes that are left out are remembered as missing for the client at the time order of `update`,
+        so that they are sent with one of the next updates. If another package with the same time order has
+        been sent before, the client misses the changes left out of either of them.
+
+        """
+        budgeted_update = GameStateUpdate(update.time_order)
+        budgeted_update.data, deferred = self.priority_accumulator.select(
+            update.data,
+            {} if deferred_changes is None else deferred_changes,
+            self.bandwidth_budget * self._package_interval,
+            self.remote_address,
+            self.game_state_store.get_game_state(),
+        )
+        time_order = int(update.time_order)
+        for entry, change in self._deferred_changes.get(time_order, {}).items():
+            deferred[entry] = combine_changes(change, deferred[entry]) if entry in deferred else change
+        self._deferred_changes[time_order] = deferred
+        while len(self._deferred_changes) > self._max_sent_update_records:
+            del self._deferred_changes[next(iter(self._deferred_changes))]
+        return budgeted_update
+
+    def _accept_event(self, event: Event) -> bool:
+        """Override #pygase.connection.Connection._accept_event to drop events that exceed the client's rate limits.
+
+        Accepted events get the client's address as `client_address` keyword argument. Relay handshakes are
+        consumed here. Events forwarded by a relay keep the address of the downstream client that sent them
+        and are never dropped, since relays apply the rate limits to their downstream clients themselves.
+
+        """
+        if event.type == RELAY_HANDSHAKE:
+            self._accept_relay(event)
+            return False
+        relayed_address = event.handler_kwargs.get("client_address")
+        if self.is_relay and isinstance(relayed_address, (list, tuple)):
+            # msgpack turns tuples into lists, but addresses are used as dict keys.
+            event.handler_kwargs["client_address"] = tuple(relayed_address)
+            return True
+        event.handler_kwargs["client_address"] = self.remote_address
+        buckets = [self._get_token_bucket(event_type) for event_type in (None, event.type)]
+        buckets = [bucket for bucket in buckets if bucket is not None]
+        # Tokens are only consumed if all limits allow the event, so dropped events don't count against any limit.
+        if all(bucket.refill() >= 1 for bucket in buckets):
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return True
+        self.dropped_events[event.type] = self.dropped_events.get(event.type, 0) + 1
+        logger.debug(f"Dropped event of type {event.type} from {self.remote_address} due to rate limits.")
+        return False
+
+    def _accept_relay(self, handshake: Event) -> None:
+        """Treat the client as a relay if its handshake carries the relay key, and reply whether it is accepted."""
+        accepted = self._is_relay_key(handshake.handler_kwargs.get("key"))
+        self.dispatch_event(Event(RELAY_HANDSHAKE, accepted=accepted), delivery="reliable")
+        if not accepted:
+            logger.warning(f"Rejected relay handshake from {self.remote_address}.")
+            return
+        if not self.is_relay:
+            logger.info(f"Accepted {self.remote_address} as relay.")
+        self.is_relay = True
+        # Relays mirror the whole game state for their downstream clients.
+        self.interest_filters = []
+        self.bandwidth_budget = None
+
+    def _is_relay_key(self, key: object) -> bool:
+        """Compare a key sent by a client with the relay key in constant time, anything but a match rejects it."""
+        if self.relay_key is None or not isinstance(key, str):
+            return False
+        try:
+            return hmac.compare_digest(key.encode("utf-8"), self.relay_key.encode("utf-8"))
+        except UnicodeEncodeError:
+            return False
+
+    def _get_token_bucket(self, event_type: str | None) -> TokenBucket | None:
+        """Return the token bucket for the rate limit of an event type, if there is one."""
+        if event_type not in self.rate_limits:
+            return None
+        rate, burst = self.rate_limits[event_type]
+        bucket = self._token_buckets.get(event_type)
+        if bucket is None or (bucket.rate, bucket.burst) != (rate, rate if burst is None else burst):
+            bucket = self._token_buckets[event_type] = TokenBucket(rate, burst)
+        return bucket
+
+    async def _recv(self, package: Package) -> None:
+        """Extend #pygase.connection.Connection._recv to update `self.last_client_time_order`.
+
+        Received events are labeled with the time order of the game state the client had when it sent them
+        (see `view_time_order` of #pygase.event.Event), for lag compensation. If the client has no game state
+        yet, the time order of the state that was current a round trip time ago is used instead.
+        Clients that render interpolated states label their events with the older time order of the rendered state,
+        which is kept as long as it isn't newer than the client's state. Events forwarded by a relay keep the view
+        of the downstream client that sent them.
+
+        """
+        if isinstance(package, ClientPackage) and package.events:
+            view_time_order = package.time_order
+            if view_time_order == 0:
+                view_time_order = self.game_state_store.get_time_order_at(time.time() - self.latency)
+            for event in package.events:
+                if not event.view_time_order or not self.is_relay and Sqn(event.view_time_order) > view_time_order:
+                    event.view_time_order = view_time_order
+        await super()._recv(package)
+        if isinstance(package, ClientPackage):
+            self.last_client_time_order = package.time_order
+            self._client_idle = not package.events
+            self._client_timestamp = (package.timestamp, time.time())
+
+    def _is_idle(self) -> bool:
+        """Override #pygase.connection.Connection._is_idle to idle without events while the client is up to date.
+
+        The client counts as up to date if the updates since its time order don't change any game state
+        attributes, so a game loop that progresses the time order without changing the state doesn't
+        keep the connection busy.
+
+        """
+        return (
+            self._client_idle
+            and not self._has_events_to_send()
+            and self.last_client_time_order != 0
+            and not self._deferred_changes.get(int(self.last_client_time_order))
+            and not self.game_state_store.get_update_since(self.last_client_time_order).data
+        )
+
+    def _apply_server_settings(self, server_state: ServerProtocol) -> None:
+        """Adopt the server's per-client settings for this connection."""
+        self.interest_filters = server_state.interest_filters
+        self.coalescing_keys = server_state.coalescing_keys
+        self.rate_limits = server_state.rate_limits
+        for queue, (maxsize, policy) in server_state.queue_limits.items():
+            self.set_queue_limit(queue, maxsize, policy)
+        self.bandwidth_budget = server_state.bandwidth_budget
+        self.priority_accumulator.priorities = server_state.priorities
+        self.tick_aligned = server_state.tick_aligned
+        self.precise_timing = server_state.precise_timing
+        self.relay_key = server_state.relay_key
+
+    @classmethod
+    async def loop(cls, hostname: str, port: int, server: object, event_wire: EventWire | None) -> None:
+        """Continously orchestrate and operate connections to clients.
+
+        This coroutine will keep listening for client packages, create new #ServerConnection objects
+        when necessary and make sure all packages are handled by and sent via the right connection.
+
+        It will return as soon as the server receives a shutdown message.
+
+        # Arguments
+        hostname (str): the hostname or IPv4 address to which to bind the server socket
+        port (int): the port number to which to bind the server socket
+        server (pygase.Server): the server for which this loop is run
+        event_wire (pygase.GameStateMachine): object to which events are to be repeated
+           (has to implement a `_push_event` method)
+
+        """
+        logger.info(f"Trying to run server on {(hostname, port)} ...")
+        server_state = cast(ServerProtocol, server)
+        async with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind((hostname, port))
+            server_state._hostname, server_state._port = sock.getsockname()  # pylint: disable=protected-access
+            async with asyncio.TaskGroup() as connection_tasks:
+                connection_loop_tasks = []
+                logger.info(
+                    f"Server successfully started and listening to packages from clients on {(hostname, port)}."
+                )
+                while True:
+                    data, client_address = await sock.recvfrom(Package._max_size)  # pylint: disable=protected-access
+                    try:
+                        package = ClientPackage.from_datagram(data)
+                        # Create new connection if client is unknown.
+                        if client_address not in server_state.connections:
+                            logger.info(f"New client connection from {client_address}.")
+                            new_connection = cls(
+                                client_address,
+                                server_state._universal_event_handler,  # pylint: disable=protected-access
+                                server_state.game_state_store,
+                                package.time_order,
+                                event_wire,
+                            )
+                            new_connection._apply_server_settings(server_state)  # pylint: disable=protected-access
+                            connection_loop_tasks.append(
+                                _create_send_loop_task(connection_tasks, new_connection, sock, server_state)
+                            )
+                            connection_loop_tasks.append(
+                                connection_tasks.create_task(
+                                    new_connection._event_loop()
+                                )  # pylint: disable=protected-access
+                            )
+                            # For now, the first client connection becomes host.
+                            if server_state.host_client is None:
+                                logger.info(f"Setting {client_address} as client with host permissions.")
+                                server_state.host_client = client_address
+                            server_state.connections[client_address] = new_connection
+                        elif server_state.connections[client_address].status == ConnectionStatus.DISCONNECTED:
+                            # Start sending packages again, which will also set status to "Connected".
+                            logger.info(f"Client reconnecting from {client_address}.")
+                            connection_loop_tasks.append(
+                                _create_send_loop_task(
+                                    connection_tasks, server_state.connections[client_address], sock, server_state
+                                )
+                            )
+                        await server_state.connections[client_address]._recv(  # pylint: disable=protected-access
+                            package
+                        )
+                    except ProtocolIDMismatchError:
+                        # ignore all non-PyGaSe packages
+                        try:
+                            if data.decode("utf-8") == "shutdown" and client_address == server_state.host_client:
+                                logger.info(f"Received shutdown command from host client {client_address}.")
+                                break
+                            if data.decode("utf-8") == "shut_me_down":
+                                break
+                            logger.warning("Received unknown package.")
+                        except UnicodeDecodeError:
+                            logger.warning("Received unknown package.")
+                logger.info(f"Shutting down server on {(hostname, port)}.")
+                for task in connection_loop_tasks:
+                    task.cancel()
+
+
+def _create_send_loop_task(
+    task_group: asyncio.TaskGroup, connection: ServerConnection, sock: aio.AsyncSocket, server_state: ServerProtocol
+) -> asyncio.Task:
+    """Start sending packages to a client and drop the client from all groups once the connection is lost."""
+    client_address = connection.remote_address
+
+    def leave_groups(_: asyncio.Task) -> None:
+        for members in server_state.groups.values():
+            members.discard(client_address)
+
+    task = task_group.create_task(connection._send_loop(sock))  # pylint: disable=protected-access
+    task.add_done_callback(leave_groups)
+    return task
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Run the time steps and event handlers of game simulations.
+
+This module is not supposed to be required by users of this library.
+
+# Contents
+- #SimulationWorker: class that runs time steps and event handlers in a worker process
+- #run_time_steps: function that runs consecutive time steps of fixed duration
+- #WorkingState: class that applies consecutive update dicts to a lazily created working copy
+- #working_copy: function that returns a shallow copy of a game state
+- #merge_event_update: function that merges the result of an event handler into an update dict
+- #record_input_ack: function that remembers the input sequence numbers of handled client input events
+- #apply_update_dict: function that applies an update dict to a working copy
+
+"""
+
+import pickle
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Callable, Coroutine, Mapping
+from typing import cast
+
+from pygase.aio import iscoroutinefunction
+
+from pygase.connection import GameStateStoreProtocol
+from pygase.gamestate import GameState, GameStatus, merge_update_dicts
+from pygase.entities import EntityTable
+from pygase.event import Event, EventHandler
+from pygase.utils import Sqn, logger
+
+
+class SimulationWorker:
+    """Run time steps and event handlers in a worker process on a mirror of the game state."""
+
+    def __init__(
+        self,
+        time_step: Callable[[GameState, float], Mapping[str, object]],
+        event_handlers: Mapping[str, EventHandler],
+        game_state: GameState,
+    ) -> None:
+        # Pickle everything right away, so unpicklable functions fail here and not in the worker process.
+        worker_setup = pickle.dumps((time_step, dict(event_handlers), game_state))
+        self._synced_time_order = game_state.time_order
+        self._executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker_process,
+            initargs=(worker_setup,),
+        )
+        logger.info("Started worker process for the game simulation.")
+
+    async def step(
+        self,
+        game_state_store: GameStateStoreProtocol,
+        dt: float,
+        steps: int,
+        fixed_dt: float | None,
+        events: list[Event],
+    ) -> dict[str, object]:
+        """Sync the mirrored game state and return the update dict of a time step and the given events."""
+        game_state = game_state_store.get_game_state()
+        updates = [
+            update for update in game_state_store.get_update_cache() if update.time_order > self._synced_time_order
+        ]
+        if not updates or updates[0].time_order == self._synced_time_order + 1:
+            # Only the updates since the last sync are sent, they are pickled now because they are shared.
+            sync = pickle.dumps(updates)
+            if updates:
+                self._synced_time_order = updates[-1].time_order
+        else:
+            logger.debug("Update cache doesn't reach back to the worker's game state, sending full game state.")
+            sync = pickle.dumps(game_state)
+            self._synced_time_order = game_state.time_order
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, _worker_process_step, sync, dt, steps, fixed_dt, pickle.dumps(events)
+        )
+
+    def shutdown(self) -> None:
+        """Stop the worker process."""
+        self._executor.shutdown()
+        logger.info("Stopped worker process for the game simulation.")
+
+
+# simulation context of a worker process, set up by _init_worker_process
+_worker_context: dict[str, object] = {}
+
+
+def _init_worker_process(worker_setup: bytes) -> None:
+    """Unpickle the time step function, event handlers and initial game state in a worker process."""
+    time_step, event_handlers, game_state = pickle.loads(worker_setup)
+    _worker_context.update(time_step=time_step, event_handlers=event_handlers, game_state=game_state)
+
+
+def _worker_process_step(
+    sync: bytes, dt: float, steps: int, fixed_dt: float | None, pickled_events: bytes
+) -> dict[str, object]:
+    """Apply a state sync, run the time step and handle events in a worker process."""
+    game_state = cast(GameState, _worker_context["game_state"])
+    state_sync = pickle.loads(sync)
+    if isinstance(state_sync, GameState):
+        game_state = state_sync
+    else:
+        for update in state_sync:
+            game_state += update
+    _worker_context["game_state"] = game_state
+    time_step = cast(Callable[[GameState, float], dict[str, object]], _worker_context["time_step"])
+    if fixed_dt is None:
+        update_dict = dict(time_step(game_state, dt))
+    else:
+        update_dict = run_time_steps(time_step, game_state, steps, fixed_dt)
+    event_handlers = cast(dict[str, EventHandler], _worker_context["event_handlers"])
+    working_state = WorkingState(game_state)
+    for event in pickle.loads(pickled_events):
+        handler = event_handlers[event.type]
+        event_update = handler(
+            *event.handler_args, **dict(event.handler_kwargs, game_state=working_state.game_state, dt=dt)
+        )
+        if iscoroutinefunction(handler):
+            event_update = asyncio.run(cast(Coroutine[object, object, object], event_update))
+        merge_event_update(working_state, update_dict, event_update)
+    return update_dict
+
+
+def run_time_steps(
+    time_step: Callable[[GameState, float], Mapping[str, object]], game_state: GameState, steps: int, fixed_dt: float
+) -> dict[str, object]:
+    """Run `steps` consecutive time steps of duration `fixed_dt` and return their combined update dict."""
+    update_dict: dict[str, object] = {}
+    working_state = WorkingState(game_state)
+    for step in range(steps):
+        step_update = time_step(working_state.game_state, fixed_dt)
+        merge_update_dicts(update_dict, step_update)
+        if step_update.get("game_status", GameStatus.ACTIVE) != GameStatus.ACTIVE:
+            break
+        if step < steps - 1:
+            working_state.apply(step_update)
+    return update_dict
+
+
+class WorkingState:
+    """Apply the update dicts of consecutive time steps or event handlers to a lazily created working copy.
+
+    The working copy is created by the first applied update, before that `game_state` is the original state.
+    Each entity table is copied at most once, later updates change the copy in place.
+
+    """
+
+    def __init__(self, game_state: GameState):
+        self.game_state = game_state
+        self._original = game_state
+        self._copied_tables: list[EntityTable] = []
+
+    def apply(self, update_dict: Mapping[str, object]) -> None:
+        """Apply an update dict without mutating the original game state or values shared with it."""
+        if self.game_state is self._original:
+            self.game_state = working_copy(self._original)
+        apply_update_dict(self.game_state, update_dict, self._copied_tables)
+
+
+def working_copy(game_state: GameState) -> GameState:
+    """Return a shallow copy of a game state to which update dicts can be applied via #apply_update_dict()."""
+    return GameState(game_state.time_order, game_state.game_status, **game_state.data)
+
+
+def merge_event_update(working_state: WorkingState, update_dict: dict[str, object], event_update: object) -> None:
+    """Merge the result of an event handler into `update_dict` and apply it to the working state."""
+    if isinstance(event_update, Mapping):
+        working_state.apply(event_update)
+        merge_update_dicts(update_dict, event_update)
+
+
+def record_input_ack(input_acks: dict[tuple[str, int], Sqn], event: Event) -> None:
+    """Remember the input sequence number of a handled client input event that takes part in prediction."""
+    client_address = cast(tuple[str, int] | None, event.handler_kwargs.get("client_address"))
+    if event.input_sequence != 0 and client_address is not None:
+        input_sequence = Sqn(event.input_sequence)
+        input_acks[client_address] = max(input_acks.get(client_address, input_sequence), input_sequence)
+
+
+def apply_update_dict(
+    working_state: GameState, update_dict: Mapping[str, object], copied_tables: list[EntityTable] | None = None
+) -> None:
+    """Apply an update dict to a working copy without mutating nested values shared with the original.
+
+    Entity tables are copied the first time they change, tables in `copied_tables` are changed in place.
+
+    """
+    state_update = {key: value for key, value in update_dict.items() if key != "game_status"}
+    merge_update_dicts(working_state.data, state_update, delete=True, copied_tables=copied_tables)
+    if "game_status" in update_dict:
+        working_state.game_status = GameStatus(cast(int, update_dict["game_status"]))
@@ -8,13 +8,20 @@ Provides utilities used in PyGaSe code or helpful to users of this library.
 - #Sendable: mixin that allows to serialize objects to small bytestrings
 - #Sqn: subclass of `int` for sequence numbers that always fit in 2 bytes
 - #LockedResource: class that attaches a `threading.Lock` to a resource
+- #JitterStats: class that records timing deviations of periodic loops and reports their percentiles
+- #TokenBucket: class that limits the rate of actions while allowing short bursts
+- #RttEstimator: class that smoothes round trip times and derives retransmission timeouts from them
+- #ClockSync: class that estimates offset and drift of a remote clock from NTP-style timestamp exchanges
 - #get_available_ip_addresses: function that returns a list of local network interfaces
 
 """
 
 import logging
+import math
 import socket
+import time
 import warnings
+from collections import deque
 from collections.abc import Mapping
 from threading import Lock
 from typing import Generic, TypeVar
@@ -313,6 +320,237 @@ class LockedRessource(LockedResource[ResourceT]):
         super().__init__(resource)
 
 
+class JitterStats:
+    """Record how late a periodic loop wakes up compared to its scheduled deadlines.
+
+    # Arguments
+    size (int): number of most recent samples to keep
+
+    # Example
+    ```python
+    jitter = JitterStats()
+    for lateness in (0.001, 0.0005, 0.004):
+        jitter.record(lateness)
+    assert jitter.percentiles(50, 100) == {50: 0.001, 100: 0.004}
+    ```
+
+    """
+
+    def __init__(self, size: int = 1000) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, lateness: float) -> None:
+        """Add a sample of the time in seconds by which a deadline was missed (negative if woken up early)."""
+        self._samples.append(lateness)
+
+    def percentiles(self, *percents: float) -> dict[float, float]:
+        """Return a dict that maps each of `percents` (defaults to 50, 90 and 99) to the sampled lateness.
+
+        Percentiles are determined via the nearest-rank method. Returns an empty dict if there are no samples yet.
+
+        """
+        if not self._samples:
+            return {}
+        samples = sorted(self._samples)
+        result = {}
+        for percent in percents or (50, 90, 99):
+            rank = max(1, math.ceil(percent / 100 * len(samples)))
+            result[percent] = samples[min(rank, len(samples)) - 1]
+        return result
+
+    def mean(self) -> float:
+        """Return the average of the samples, `0.0` if there are no samples yet."""
+        return sum(self._samples) / len(self._samples) if self._samples else 0.0
+
+    def reset(self) -> None:
+        """Remove all samples."""
+        self._samples.clear()
+
+
+class TokenBucket:
+    """Limit the rate of actions, like handling events, while allowing short bursts.
+
+    The bucket holds up to `burst` tokens and is refilled with `rate` tokens per second.
+    Each action consumes one token and is rejected if there is none left.
+
+    # Arguments
+    rate (float): number of tokens added per second
+    burst (float): maximum number of tokens, defaults to `rate`
+
+    # Attributes
+    rate (float): see corresponding constructor argument
+    burst (float): see corresponding constructor argument
+    tokens (float): number of currently available tokens
+
+    # Example
+    ```python
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.consume() and bucket.consume()
+    assert not bucket.consume()
+    ```
+
+    """
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.tokens = self.burst
+        self._last_refill = time.time()
+
+    def refill(self) -> float:
+        """Add the tokens accumulated since the last refill and return the number of available tokens."""
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        return self.tokens
+
+    def consume(self) -> bool:
+        """Take a token from the bucket and return whether there was one."""
+        if self.refill() < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RttEstimator:
+    """Estimate the round trip time of a connection and derive a retransmission timeout from it.
+
+    The smoothed round trip time and its variation are updated with every sample as specified in RFC 6298.
+    The most recent samples are kept in a #JitterStats object, so percentiles of the round trip time
+    are available as well.
+
+    # Arguments
+    initial_rto (float): retransmission timeout in seconds before the first sample
+    min_rto (float): lower bound of the retransmission timeout in seconds
+    max_rto (float): upper bound of the retransmission timeout in seconds
+    size (int): number of most recent samples to keep
+
+    # Attributes
+    srtt (float): smoothed round trip time in seconds, `0.0` before the first sample
+    rttvar (float): round trip time variation in seconds
+    rto (float): retransmission timeout in seconds, after which a sent package counts as lost
+    samples (JitterStats): the most recent round trip time samples
+
+    # Example
+    ```python
+    rtt = RttEstimator(min_rto=0.1)
+    for sample in (0.05, 0.07, 0.06):
+        rtt.record(sample)
+    assert rtt.srtt < rtt.rto < 0.5
+    ```
+
+    """
+
+    _alpha: float = 1 / 8  # gain of the smoothed round trip time
+    _beta: float = 1 / 4  # gain of the round trip time variation
+    _k: float = 4.0  # factor of the variation in the retransmission timeout
+    _granularity: float = 0.001  # clock granularity in seconds
+
+    def __init__(
+        self, initial_rto: float = 1.0, min_rto: float = 0.2, max_rto: float = 60.0, size: int = 1000
+    ) -> None:
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.rto = initial_rto
+        self.samples = JitterStats(size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def record(self, rtt: float) -> None:
+        """Add a round trip time sample in seconds and update the estimates."""
+        if not self.samples:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += self._beta * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self._alpha * (rtt - self.srtt)
+        rto = self.srtt + max(self._granularity, self._k * self.rttvar)
+        self.rto = min(self.max_rto, max(self.min_rto, rto))
+        self.samples.record(rtt)
+
+    def percentiles(self, *percents: float) -> dict[float, float]:
+        """Return a dict that maps each of `percents` to the sampled round trip time, like #JitterStats does."""
+        return self.samples.percentiles(*percents)
+
+    def summary(self) -> dict[str, float]:
+        """Return the minimum, average and 99th percentile of the sampled round trip times.
+
+        Returns an empty dict if there are no samples yet.
+
+        """
+        if not self.samples:
+            return {}
+        return {"min": self.percentiles(0)[0], "avg": self.samples.mean(), "p99": self.percentiles(99)[99]}
+
+    def mean(self) -> float:
+        """Return the average of the sampled round trip times."""
+        return self.samples.mean()
+
+
+class ClockSync:
+    """Estimate the offset and drift of a remote clock from NTP-style timestamp exchanges.
+
+    Each exchange yields a sample of the clock offset and of the round trip delay it was measured with.
+    Samples with a short delay are the most accurate, as an asymmetric delay can only distort the offset by half
+    the round trip delay. So the offset is taken from the lowest-delay sample among the most recent ones,
+    and the drift from the lowest-delay samples of the older and the newer half of all kept samples.
+
+    # Arguments
+    size (int): number of most recent samples to keep
+
+    # Example
+    ```python
+    clock = ClockSync()
+    # local send time, remote receive time, remote send time, local receive time
+    clock.record_exchange(10.0, 110.02, 110.03, 10.05)
+    assert clock.remote_time(10.05) == 110.05
+    ```
+
+    """
+
+    _filter_size: int = 8  # number of recent samples from which the lowest-delay sample determines the offset
+
+    def __init__(self, size: int = 256) -> None:
+        # (local receive time, offset, round trip delay) of each exchange
+        self._samples: deque[tuple[float, float, float]] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record_exchange(
+        self, local_sent: float, remote_received: float, remote_sent: float, local_received: float
+    ) -> None:
+        """Add the four timestamps of an exchange of a request and its response."""
+        offset = ((remote_received - local_sent) + (remote_sent - local_received)) / 2
+        delay = (local_received - local_sent) - (remote_sent - remote_received)
+        self._samples.append((local_received, offset, max(delay, 0.0)))
+
+    def drift(self) -> float:
+        """Return how many seconds the remote clock gains per second of the local clock."""
+        if len(self._samples) < 2 * self._filter_size:
+            return 0.0
+        samples = list(self._samples)
+        half = len(samples) // 2
+        older = min(samples[:half], key=lambda sample: sample[2])
+        newer = min(samples[half:], key=lambda sample: sample[2])
+        span = newer[0] - older[0]
+        return (newer[1] - older[1]) / span if span > 0 else 0.0
+
+    def remote_time(self, local_time: float) -> float:
+        """Return the estimated time of the remote clock at `local_time`, or `local_time` without samples."""
+        if not self._samples:
+            return local_time
+        recent = list(self._samples)[-self._filter_size :]
+        sample_time, offset, _ = min(recent, key=lambda sample: sample[2])
+        return local_time + offset + self.drift() * (local_time - sample_time)
+
+
 def get_available_ip_addresses() -> list[str]:
     """Return a list of all locally available IPv4 addresses."""
     if ifaddr is None:
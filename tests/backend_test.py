@@ -1,16 +1,32 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import pickle
+import threading
+import time
 
 from pygase import aio
 import pytest
 
 from helpers import assert_timeout
 
-from pygase.backend import Server, GameStateStore, GameStateMachine, Backend
-from pygase.gamestate import GameState, GameStateUpdate, GameStatus
-from pygase.connection import ClientPackage
-from pygase.event import UniversalEventHandler
+from pygase.backend import GameStateStore, GameStateMachine, Backend
+from pygase.server import Server
+from pygase.gamestate import GameState, GameStateUpdate, GameStatus, TO_DELETE
+from pygase.packages import ClientPackage
+from pygase.event import UniversalEventHandler, Event
+from pygase.utils import Sqn
+
+
+def count_steps(game_state, dt):
+    update = {"steps": game_state.steps + 1}
+    if update["steps"] >= 3:
+        update["game_status"] = GameStatus.PAUSED
+    return update
+
+
+def add_points(points, game_state, dt, **kwargs):
+    return {"score": {"points": game_state.score["points"] + points}}
 
 
 class TestServer:
@@ -62,6 +78,36 @@ class TestServer:
         assert len(MockConnection.called_with) == 6
         assert MockConnection.called_with[-1][0][2] is None
 
+    def test_dispatch_event_to_group(self):
+        server = Server(GameStateStore())
+
+        class MockConnection:
+            def __init__(self):
+                self.called_with = []
+
+            def dispatch_event(self, *args, **kwargs):
+                self.called_with.append((args, kwargs))
+
+        for address in [("foo", 1), ("bar", 1), ("baz", 1)]:
+            server.connections[address] = MockConnection()
+        server.add_to_group("red", ("foo", 1))
+        server.add_to_group("red", ("bar", 1))
+        server.add_to_group("red", ("qux", 1))
+        server.dispatch_event("CHAT", "hi", target_client="red")
+        foo_dispatch = server.connections[("foo", 1)].called_with[0]
+        bar_dispatch = server.connections[("bar", 1)].called_with[0]
+        assert not server.connections[("baz", 1)].called_with
+        assert foo_dispatch[1]["bytepack"] == foo_dispatch[0][0].to_bytes()
+        assert foo_dispatch[1]["bytepack"] is bar_dispatch[1]["bytepack"]
+        server.remove_from_group("red", ("foo", 1))
+        server.dispatch_event("CHAT", "bye", target_client="red", delivery="reliable")
+        assert len(server.connections[("foo", 1)].called_with) == 1
+        assert server.connections[("bar", 1)].called_with[1][1]["bytepack"] is None
+        with pytest.raises(KeyError):
+            server.dispatch_event("CHAT", target_client="blue")
+        with pytest.raises(ValueError):
+            server.add_to_group("all", ("foo", 1))
+
 
 class TestGameStateStore:
     def test_instantiation(self):
@@ -93,6 +139,27 @@ class TestGameStateStore:
         assert counter == 3
         assert len(store.get_update_cache()) == 2
 
+    def test_get_update_since(self):
+        store = GameStateStore()
+        store.push_update(GameStateUpdate(1, players={0: {"x": 1}}))
+        store.push_update(GameStateUpdate(2, players={0: {"y": 2}}))
+        update = store.get_update_since(0)
+        assert update == GameStateUpdate(2, players={0: {"x": 1, "y": 2}})
+        assert store.get_update_since(0) is update
+        assert store.get_update_since(1) == GameStateUpdate(2, players={0: {"y": 2}})
+        store.push_update(GameStateUpdate(3, players={0: {"x": 3}}))
+        assert store.get_update_since(0) == GameStateUpdate(3, players={0: {"x": 3, "y": 2}})
+        assert update == GameStateUpdate(2, players={0: {"x": 1, "y": 2}})
+        assert store.get_update_cache()[1] == GameStateUpdate(1, players={0: {"x": 1}})
+
+    def test_input_acks(self):
+        store = GameStateStore()
+        assert store.get_input_ack(("foo", 1)) == 0
+        store.push_input_acks({("foo", 1): Sqn(3)})
+        store.push_input_acks({("foo", 1): Sqn(2), ("bar", 1): Sqn(1)})
+        assert store.get_input_ack(("foo", 1)) == 3
+        assert store.get_input_ack(("bar", 1)) == 1
+
     def test_cache_size(self):
         store = GameStateStore()
         for i in range(2 * store._update_cache_size):
@@ -100,6 +167,48 @@ class TestGameStateStore:
             store.push_update(GameStateUpdate(i + 1))
             assert sum(store.get_update_cache()).time_order == i + 1
 
+    def test_game_state_history(self, monkeypatch):
+        monkeypatch.setattr(GameStateStore, "_history_size", 20)
+        monkeypatch.setattr(GameStateStore, "_keyframe_interval", 5)
+        store = GameStateStore(GameState(0, players={0: {"x": 0, "y": 0}}))
+        for i in range(1, 51):
+            store.push_update(GameStateUpdate(i, players={0: {"x": i}}, removed=TO_DELETE if i == 47 else i))
+        assert [keyframe.time_order for keyframe in store._keyframes] == [30, 35, 40, 45, 50]
+        assert store._history[0][1].time_order == 31
+        past_state = store.get_game_state_at(43)
+        assert past_state.time_order == 43
+        assert past_state.players == {0: {"x": 43, "y": 0}}
+        assert past_state.removed == 43
+        assert store.get_game_state_at(43) is past_state
+        assert "removed" not in store.get_game_state_at(47).data
+        assert store.get_game_state_at(30).players == {0: {"x": 30, "y": 0}}
+        assert store.get_game_state_at(60) is store.get_game_state()
+        assert store.get_game_state().players == {0: {"x": 50, "y": 0}}
+        with pytest.raises(KeyError):
+            store.get_game_state_at(29)
+
+    def test_get_time_order_at(self, monkeypatch):
+        store = GameStateStore()
+        assert store.get_time_order_at(time.time()) == 0
+        for i in range(1, 4):
+            monkeypatch.setattr(time, "time", lambda i=i: 100.0 + i)
+            store.push_update(GameStateUpdate(i))
+        assert store.get_time_order_at(50.0) == 0
+        assert store.get_time_order_at(102.5) == 2
+        assert store.get_time_order_at(200.0) == 3
+
+    def test_wait_for_update_from_another_thread(self):
+        store = GameStateStore()
+        pusher = threading.Timer(0.05, store.push_update, (GameStateUpdate(1, x=1),))
+
+        async def wait_for_update():
+            pusher.start()
+            return await asyncio.wait_for(store.wait_for_update(0), 1.0)
+
+        assert aio.run(wait_for_update) == GameStateUpdate(1, x=1)
+        assert aio.run(store.wait_for_update(0)) == GameStateUpdate(1, x=1)
+        pusher.join()
+
 
 class TestGameStateMachine:
     def test_instantiation(self):
@@ -144,6 +253,202 @@ class TestGameStateMachine:
         assert store.get_game_state().step == 3
         assert store.get_game_state().game_status == GameStatus.PAUSED
 
+    def test_fixed_time_step_game_loop(self, monkeypatch):
+        interval = 0.1
+        # The second tick is stalled, the fourth one is stalled beyond the catch-up limit.
+        perf_counter_samples = iter([0.0, 0.01, 0.1, 0.11, 0.35, 0.36, 1.35, 1.36])
+        monkeypatch.setattr("pygase.backend.time.perf_counter", lambda: next(perf_counter_samples))
+
+        async def fake_sleep(duration):
+            pass
+
+        monkeypatch.setattr("pygase.backend.aio.sleep", fake_sleep)
+        dt_calls = []
+
+        def time_step(game_state, dt):
+            dt_calls.append(dt)
+            update = {"steps": game_state.steps + 1}
+            if len(dt_calls) >= 1 + 1 + 2 + 5:
+                update["game_status"] = GameStatus.PAUSED
+            return update
+
+        store = GameStateStore(GameState(0, steps=0))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = time_step
+        aio.run(state_machine.run_game_loop, interval, 0.1)
+        assert dt_calls == [0.1] * 9
+        assert store.get_game_state().steps == 9
+        # Game status update plus one update per network tick
+        assert store.get_game_state().time_order == 5
+        assert state_machine.overruns == 1
+        assert state_machine.game_time == pytest.approx(0.9)
+
+    def test_precise_timing_game_loop(self, monkeypatch):
+        interval = 0.1
+        # The second tick starts 0.01 seconds late, the third one overruns its interval.
+        perf_counter_samples = iter([0.0, 0.02, 0.11, 0.13, 0.2, 0.35, 0.36, 0.37])
+        monkeypatch.setattr("pygase.backend.time.perf_counter", lambda: next(perf_counter_samples))
+        deadlines = []
+
+        async def fake_sleep_until(deadline, spin_time=0.0):
+            deadlines.append(deadline)
+
+        monkeypatch.setattr("pygase.backend.aio.sleep_until", fake_sleep_until)
+
+        def time_step(game_state, dt):
+            update = {"steps": game_state.steps + 1}
+            if update["steps"] >= 4:
+                update["game_status"] = GameStatus.PAUSED
+            return update
+
+        store = GameStateStore(GameState(0, steps=0))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = time_step
+        aio.run(state_machine.run_game_loop, interval, None, True)
+        # Deadlines keep their phase when a tick starts late and are rescheduled after an overrun.
+        assert deadlines == pytest.approx([0.1, 0.2, 0.35, 0.45])
+        assert len(state_machine.tick_jitter) == 3
+        assert state_machine.tick_jitter.percentiles(0, 100) == pytest.approx({0: 0.0, 100: 0.01})
+
+    def test_game_loop_acknowledges_inputs(self):
+        store = GameStateStore(GameState(0, x=0))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = lambda game_state, dt: {"game_status": GameStatus.PAUSED}
+        state_machine.register_event_handler("MOVE", lambda dx, game_state, **kwargs: {"x": game_state.x + dx})
+        # Two inputs of the same client are handled in the same time step.
+        for input_sequence in (1, 2):
+            event = Event("MOVE", 1, client_address=("foo", 1))
+            event.input_sequence = input_sequence
+            state_machine._push_event(event)
+        aio.run(state_machine.run_game_loop, 0.001)
+        assert store.get_game_state().x == 2
+        assert store.get_input_ack(("foo", 1)) == 2
+
+    def test_lag_compensated_event_handler(self):
+        store = GameStateStore(GameState(0, target=0))
+        for i in range(1, 11):
+            store.push_update(GameStateUpdate(i, target=i))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = lambda game_state, dt: {"game_status": GameStatus.PAUSED}
+        hits = []
+
+        def shoot(aim, game_state, client_game_state, **kwargs):
+            hits.append((aim == client_game_state.target, game_state.target))
+
+        state_machine.register_event_handler("SHOOT", shoot, lag_compensated=True)
+        for aim, view_time_order in ((7, 7), (10, 0), (5, 7)):
+            event = Event("SHOOT", aim, client_address=("foo", 1))
+            event.view_time_order = view_time_order
+            state_machine._push_event(event)
+        aio.run(state_machine.run_game_loop, 0.001)
+        assert hits == [(True, 10), (True, 10), (False, 10)]
+        with pytest.raises(ValueError):
+            state_machine.register_event_handler("SHOOT", shoot, in_worker_process=True, lag_compensated=True)
+
+    def test_lag_compensation_is_limited(self, monkeypatch):
+        store = GameStateStore(GameState(0, target=0))
+        for i in range(1, 4):
+            monkeypatch.setattr(time, "time", lambda i=i: 100.0 + i)
+            store.push_update(GameStateUpdate(i, target=i))
+        state_machine = GameStateMachine(store)
+        event = Event("SHOOT")
+        event.view_time_order = 1
+        monkeypatch.setattr(time, "time", lambda: 101.2 + state_machine._max_rewind_time)
+        assert state_machine.get_client_game_state(event).target == 1
+        monkeypatch.setattr(time, "time", lambda: 102.2 + state_machine._max_rewind_time)
+        assert state_machine.get_client_game_state(event).target == 2
+
+    def test_event_updates_are_merged_deeply(self):
+        players = {0: {"x": 0, "y": 0}}
+        store = GameStateStore(GameState(0, players=players))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = lambda game_state, dt: {"game_status": GameStatus.PAUSED}
+        state_machine.register_event_handler("SET", lambda key, value, **kwargs: {"players": {0: {key: value}}})
+        state_machine._push_event(Event("SET", "x", 1))
+        state_machine._push_event(Event("SET", "y", 2))
+        aio.run(state_machine.run_game_loop, 0.001)
+        assert store.get_game_state().players == {0: {"x": 1, "y": 2}}
+
+    def test_batch_event_handler(self):
+        store = GameStateStore(GameState(0, players={0: {"x": 0, "y": 0}, 1: {"x": 0, "y": 0}}))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = lambda game_state, dt: {"game_status": GameStatus.PAUSED}
+        batches = []
+
+        def on_move(events, game_state, dt):
+            batches.append(len(events))
+            players = {}
+            for event in events:
+                player_id, dx = event.handler_args
+                x = players.get(player_id, game_state.players[player_id])["x"]
+                players[player_id] = {"x": x + dx}
+            return {"players": players}
+
+        state_machine.register_batch_event_handler("MOVE", on_move)
+        state_machine.register_event_handler("JUMP", lambda player_id, **kwargs: {"players": {player_id: {"y": 1}}})
+        with pytest.raises(TypeError):
+            state_machine.register_batch_event_handler("MOVE", "Not a function")
+        for input_sequence, (player_id, dx) in enumerate([(0, 1), (1, 2), (0, 3)], 1):
+            event = Event("MOVE", player_id, dx, client_address=("foo", 1))
+            event.input_sequence = input_sequence
+            state_machine._push_event(event)
+        state_machine._push_event(Event("JUMP", 0))
+        aio.run(state_machine.run_game_loop, 0.001)
+        assert batches == [3]
+        assert store.get_game_state().players == {0: {"x": 4, "y": 1}, 1: {"x": 2, "y": 0}}
+        assert store.get_input_ack(("foo", 1)) == 3
+
+    def test_push_event_from_another_thread(self):
+        store = GameStateStore(GameState(0, x=0))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = lambda game_state, dt: {}
+        state_machine.register_event_handler("ADD", lambda dx, game_state, **kwargs: {"x": game_state.x + dx})
+
+        def wait_for_x(x):
+            aio.run(asyncio.wait_for(store._update_notifier.wait_for(lambda: store.get_game_state().x == x), 1.0))
+
+        async def push_events():
+            await assert_timeout(1.0, lambda: state_machine._loop is not None)
+            for dx in (1, 2):
+                await state_machine._push_event(Event("ADD", dx))
+
+        state_machine.run_game_loop_in_thread(0.01)
+        try:
+            aio.run(push_events)
+            wait_for_x(3)
+            state_machine._push_event(Event("ADD", 4))
+            wait_for_x(7)
+        finally:
+            assert state_machine.stop()
+        assert state_machine._loop is None
+
+    def test_worker_process_game_loop(self):
+        store = GameStateStore(GameState(0, steps=0, score={"points": 0, "hits": 0}))
+        state_machine = GameStateMachine(store)
+        state_machine.time_step = count_steps
+        state_machine.register_event_handler("POINTS", add_points, in_worker_process=True)
+        state_machine.register_event_handler("HIT", lambda game_state, **kwargs: {"score": {"hits": 1}})
+        for input_sequence, (event_type, args) in enumerate((("POINTS", (2,)), ("HIT", ()), ("POINTS", (3,))), 1):
+            event = Event(event_type, *args, client_address=("foo", 1))
+            event.input_sequence = input_sequence
+            state_machine._push_event(event)
+        aio.run(state_machine.run_game_loop, 0.001, None, False, True)
+        game_state = store.get_game_state()
+        # The worker mirrors the game state, so its time steps build upon one another.
+        assert game_state.steps == 3
+        assert game_state.score == {"points": 5, "hits": 1}
+        assert game_state.game_status == GameStatus.PAUSED
+        assert store.get_input_ack(("foo", 1)) == 3
+
+    def test_worker_process_requires_picklable_functions(self):
+        state_machine = GameStateMachine(GameStateStore())
+        state_machine.time_step = lambda game_state, dt: {}
+        with pytest.raises((pickle.PicklingError, AttributeError)):
+            aio.run(state_machine.run_game_loop, 0.001, None, False, True)
+        assert not state_machine._game_loop_is_running
+        # The game isn't left active without a game loop.
+        assert state_machine._game_state_store.get_game_state().game_status == GameStatus.PAUSED
+
 
 class TestBackend:
     def test_instantiation(self):
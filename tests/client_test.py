@@ -9,8 +9,10 @@ from freezegun import freeze_time
 
 from pygase.client import Client
 from pygase.event import UniversalEventHandler
+from pygase import aio
 from pygase.connection import ClientConnection
-from pygase.gamestate import GameState
+from pygase.packages import ServerPackage, Header
+from pygase.gamestate import GameState, GameStateUpdate
 
 
 class TestClient:
@@ -96,9 +98,14 @@ class TestClient:
         class MockConnection:
             called_with = []
 
+            flushed = 0
+
             def dispatch_event(self, *args, **kwargs):
                 self.called_with.append((args, kwargs))
 
+            def flush(self):
+                self.flushed += 1
+
         called_callback = []
 
         def ack_callback():
@@ -122,3 +129,95 @@ class TestClient:
         foobar_dispatch[0][2]()
         assert len(MockConnection.called_with) == 5
         assert MockConnection.called_with[-1][0][2] is None
+        assert client.connection.flushed == 0
+        client.dispatch_event("SHOOT", flush=True)
+        assert client.connection.flushed == 1
+        assert "flush" not in MockConnection.called_with[-1][0][0].handler_kwargs
+
+    def test_precise_timing(self):
+        client = Client()
+        assert not client._create_connection(1234, "localhost").precise_timing
+        client.precise_timing = True
+        assert client._create_connection(1234, "localhost").precise_timing
+
+    def test_subscribe(self):
+        client = Client()
+        changes = []
+        client.subscribe("players.*.position", lambda path, value: changes.append((path, value)))
+        client._create_connection(1234, "localhost")
+        update = GameStateUpdate(1, players={"foo": {"position": (1, 2)}, "bar": {"hp": 10}})
+        aio.run(client.connection._recv, ServerPackage(Header(1, 0, "0" * 32), update))
+        assert changes == [(("players", "foo", "position"), (1, 2))]
+        outdated_update = GameStateUpdate(1, players={"bar": {"position": (3, 4)}})
+        aio.run(client.connection._recv, ServerPackage(Header(2, 0, "0" * 32), outdated_update))
+        assert len(changes) == 1
+        with client.access_game_state() as game_state:
+            assert game_state.players["foo"]["position"] == (1, 2)
+
+    def test_interpolated_state(self):
+        client = Client()
+        with pytest.raises(RuntimeError):
+            client.interpolated_state()
+        client.enable_interpolation(delay=0.05)
+        client._create_connection(1234, "localhost")
+        with freeze_time("2012-01-14 12:00:01") as frozen_time:
+            aio.run(client.connection._recv, ServerPackage(Header(1, 0, "0" * 32), GameStateUpdate(1, x=0.0)))
+            frozen_time.tick(0.1)
+            aio.run(client.connection._recv, ServerPackage(Header(2, 0, "0" * 32), GameStateUpdate(2, x=1.0)))
+            assert client.interpolated_state().x == pytest.approx(0.5)
+            frozen_time.tick(0.1)
+            assert client.interpolated_state().x == pytest.approx(1.0)
+
+    def test_events_carry_rendered_time_order(self):
+        client = Client()
+        client.enable_interpolation(delay=0.05)
+        client._create_connection(1234, "localhost")
+        sent_events = []
+        client.connection.dispatch_event = lambda event, *args: sent_events.append(event)
+        client.dispatch_event("SHOOT")
+        with freeze_time("2012-01-14 12:00:01") as frozen_time:
+            aio.run(client.connection._recv, ServerPackage(Header(1, 0, "0" * 32), GameStateUpdate(1, x=0.0)))
+            frozen_time.tick(0.1)
+            aio.run(client.connection._recv, ServerPackage(Header(2, 0, "0" * 32), GameStateUpdate(2, x=1.0)))
+            client.dispatch_event("SHOOT")
+        # The latest state has time order 2, but the rendered state lags behind by the interpolation delay.
+        assert "view_time_order" not in sent_events[0].__dict__
+        assert sent_events[1].view_time_order == 1
+
+    def test_prediction(self):
+        client = Client()
+        client._create_connection(1234, "localhost")
+        sent_events = []
+        client.connection.dispatch_event = lambda event, *args: sent_events.append(event)
+
+        def on_move(dx, game_state, **kwargs):
+            return {"x": game_state.x + dx}
+
+        with pytest.raises(TypeError):
+
+            async def async_on_move(dx, game_state):
+                return {}
+
+            client.register_prediction_handler("MOVE", async_on_move)
+        client.register_prediction_handler("MOVE", on_move)
+        aio.run(client.connection._recv, ServerPackage(Header(1, 0, "0" * 32), GameStateUpdate(1, x=0)))
+        connection, client.connection = client.connection, None
+        with pytest.raises(RuntimeError):
+            client.dispatch_event("MOVE", 5)
+        # Inputs that can't be sent aren't predicted either.
+        client.connection = connection
+        client.dispatch_event("MOVE", 1)
+        client.dispatch_event("MOVE", 2)
+        client.dispatch_event("OTHER")
+        assert [event.input_sequence for event in sent_events] == [1, 2, 0]
+        with client.access_predicted_state() as predicted_state:
+            assert predicted_state.x == 3
+        # The server has applied the first input only.
+        aio.run(client.connection._recv, ServerPackage(Header(2, 0, "0" * 32), GameStateUpdate(2, x=1), input_ack=1))
+        with client.access_predicted_state() as predicted_state:
+            assert predicted_state.x == 3 and predicted_state.time_order == 2
+        with client.access_game_state() as game_state:
+            assert game_state.x == 1
+        aio.run(client.connection._recv, ServerPackage(Header(3, 0, "0" * 32), GameStateUpdate(3, x=2), input_ack=2))
+        with client.access_predicted_state() as predicted_state:
+            assert predicted_state.x == 2
@@ -1,5 +1,6 @@
 import asyncio
 import time
+import threading
 
 import pytest
 from freezegun import freeze_time
@@ -7,19 +8,21 @@ from pygase import aio
 from pygase.aio import socket
 
 from pygase.utils import Sqn
-from pygase.event import Event
-from pygase.gamestate import GameStateUpdate
-from pygase.connection import (
+from pygase.event import Event, UniversalEventHandler
+from pygase.gamestate import GameState, GameStateUpdate, InterestFilter, TO_DELETE
+from pygase.backend import GameStateStore
+from pygase.packages import (
     Header,
     Package,
     ClientPackage,
     ServerPackage,
-    Connection,
-    ClientConnection,
-    ConnectionStatus,
+    SyncTimestamps,
     DuplicateSequenceError,
     ProtocolIDMismatchError,
 )
+from pygase.connection import Connection, ClientConnection, ConnectionStatus, RELAY_HANDSHAKE
+from pygase.server import ServerConnection
+from pygase.relay import RelayConnection
 
 
 class TestPackage:
@@ -53,6 +56,13 @@ class TestPackage:
             package.get_bytesize()
             package.add_event(Event("BIG", bytes(2030)))
 
+    def test_add_serialized_event(self):
+        event = Event("TEST", 1, 2, 3)
+        package = Package(Header(1, 2, "0" * 32))
+        package.add_event(event, event.to_bytes())
+        package.add_event(event)
+        assert Package.from_datagram(package.to_datagram()).events == [event, event]
+
 
 class TestClientPackage:
     def test_bytepacking(self):
@@ -61,6 +71,15 @@ class TestClientPackage:
         unpacked_package = ClientPackage.from_datagram(datagram)
         assert package == unpacked_package
 
+    def test_timestamp(self):
+        package = ClientPackage(Header(4, 5, "10" * 16), 1, timestamp=1350000000.123456)
+        assert ClientPackage.from_datagram(package.to_datagram()).timestamp == 1350000000.123456
+
+    def test_truncated_datagram(self):
+        datagram = ClientPackage(Header(4, 5, "10" * 16), 1).to_datagram()
+        with pytest.raises(ProtocolIDMismatchError):
+            ClientPackage.from_datagram(datagram[:14])
+
 
 class TestServerPackage:
     def test_bytepacking(self):
@@ -69,6 +88,22 @@ class TestServerPackage:
         unpacked_package = ServerPackage.from_datagram(datagram)
         assert package == unpacked_package
 
+    def test_input_ack(self):
+        package = ServerPackage(Header(4, 5, "10" * 16), GameStateUpdate(2), input_ack=7)
+        unpacked_package = ServerPackage.from_datagram(package.to_datagram())
+        assert unpacked_package.input_ack == 7
+        assert package == unpacked_package
+
+    def test_timestamps(self):
+        timestamps = SyncTimestamps(1350000000.5, 1349999999.75, 0.25)
+        package = ServerPackage(Header(4, 5, "10" * 16), GameStateUpdate(2), timestamps=timestamps)
+        assert ServerPackage.from_datagram(package.to_datagram()).timestamps == timestamps
+
+    def test_truncated_datagram(self):
+        datagram = ServerPackage(Header(4, 5, "10" * 16), GameStateUpdate(2)).to_datagram()
+        with pytest.raises(ProtocolIDMismatchError):
+            ServerPackage.from_datagram(datagram[:30])
+
 
 class TestConnection:
     def test_connection_status_enum_values(self):
@@ -255,6 +290,16 @@ class TestConnection:
             aio.run(connection._recv, Package(Header(1, 0, "0" * 32)))
             assert not connection._pending_acks
             assert connection.latency == 0
+            # Once the round trip time is known, packages time out after a time proportional to it.
+            connection._update_latency(0.05)
+            assert connection.rtt.rto == Connection._min_package_timeout
+            aio.run(connection._send_next_package, sock)
+            frozen_time.tick(0.1)
+            aio.run(connection._recv, Package(Header(2, 0, "0" * 32)))
+            assert connection._pending_acks.keys() == {2}
+            frozen_time.tick(0.15)
+            aio.run(connection._recv, Package(Header(3, 0, "0" * 32)))
+            assert not connection._pending_acks
 
     @pytest.mark.integration
     def test_dispatch_event(self):
@@ -378,3 +423,462 @@ class TestConnection:
             frozen_time.tick()
             aio.run(connection._recv, Package(Header(3, 1, "0" * 32)))
             assert callback.count == 1
+
+    def test_reliable_events_are_resent_on_loss(self):
+        sent_packages = []
+
+        async def sendto(self, datagram, address):
+            sent_packages.append(Package.from_datagram(datagram))
+
+        sock = type("socket", (), {"sendto": sendto})()
+        acked = []
+        connection = Connection(("", 0), None)
+        event = Event("BUY", 1)
+        connection.dispatch_event(event, ack_callback=lambda: acked.append(True), delivery="reliable")
+        connection.dispatch_event(Event("MOVE"))
+        for _ in range(4):
+            aio.run(connection._send_next_package, sock)
+        assert [len(package.events) for package in sent_packages] == [2, 0, 0, 0]
+        assert sent_packages[0].events[0].reliable_id == 1
+        # Packages 2 to 4 arrived, so package 1 is lost and its reliable event is resent with the next package.
+        aio.run(connection._recv, Package(Header(1, 4, "11" + "0" * 30)))
+        aio.run(connection._send_next_package, sock)
+        assert sent_packages[-1].events == [sent_packages[0].events[0]]
+        assert not acked
+        aio.run(connection._recv, Package(Header(2, 5, "111" + "0" * 29)))
+        assert acked == [True]
+        aio.run(connection._send_next_package, sock)
+        assert sent_packages[-1].events == []
+        with pytest.raises(ValueError):
+            connection.dispatch_event(event, timeout_callback=print, delivery="reliable")
+
+    def test_reliable_events_are_deduplicated_and_ordered(self):
+        def reliable_event(message_id, ordered=False):
+            event = Event("TEST", message_id)
+            event.reliable_id = message_id
+            event.ordered = ordered
+            return event
+
+        connection = Connection(("", 0), None)
+        events = [reliable_event(2, ordered=True), reliable_event(3), reliable_event(3), reliable_event(1)]
+        aio.run(connection._recv, Package(Header(1, 0, "0" * 32), events))
+        received = []
+        while not connection._incoming_event_queue.empty():
+            received.append(aio.run(connection._incoming_event_queue.get).handler_args[0])
+        assert received == [3, 1, 2]
+        aio.run(connection._recv, Package(Header(2, 0, "0" * 32), [reliable_event(2, ordered=True)]))
+        assert connection._incoming_event_queue.empty()
+
+    def test_coalescing_events(self):
+        sent_packages = []
+
+        async def sendto(self, datagram, address):
+            sent_packages.append(Package.from_datagram(datagram))
+
+        sock = type("socket", (), {"sendto": sendto})()
+        connection = Connection(("", 0), None)
+        connection.coalescing_keys["MOVE"] = "player"
+        connection.coalescing_keys["AIM"] = None
+        connection.dispatch_event(Event("MOVE", player=1, x=0))
+        connection.dispatch_event(Event("AIM", 0))
+        connection.dispatch_event(Event("MOVE", player=2, x=0))
+        connection.dispatch_event(Event("MOVE", player=1, x=1))
+        connection.dispatch_event(Event("AIM", 1))
+        connection.dispatch_event(Event("MOVE", player=1, x=2), delivery="reliable")
+        aio.run(connection._send_next_package, sock)
+        assert [(event.type, event.handler_args, event.handler_kwargs) for event in sent_packages[0].events] == [
+            ("MOVE", [], {"player": 1, "x": 1}),
+            ("AIM", [1], {}),
+            ("MOVE", [], {"player": 2, "x": 0}),
+            ("MOVE", [], {"player": 1, "x": 2}),
+        ]
+        connection.dispatch_event(Event("AIM", 2))
+        aio.run(connection._send_next_package, sock)
+        assert sent_packages[1].events == [Event("AIM", 2)]
+
+    def test_queue_limits(self):
+        sent_packages = []
+
+        async def sendto(self, datagram, address):
+            sent_packages.append(Package.from_datagram(datagram))
+
+        sock = type("socket", (), {"sendto": sendto})()
+        connection = Connection(("", 0), None)
+        connection.set_queue_limit("outgoing_events", 2)
+        acked = []
+        connection.dispatch_event(Event("BUY", 1), ack_callback=lambda: acked.append(True), delivery="reliable")
+        connection.dispatch_event(Event("MOVE", 0))
+        connection.dispatch_event(Event("MOVE", 1))
+        assert connection.get_queue_overflows() == {"outgoing_events": 1, "incoming_events": 0}
+        aio.run(connection._send_next_package, sock)
+        # The reliable event was dropped from the full queue, but is resent with the next package.
+        assert [event.type for event in sent_packages[0].events] == ["BUY", "MOVE", "MOVE"]
+        aio.run(connection._recv, Package(Header(1, 1, "0" * 32)))
+        assert acked == [True]
+        with pytest.raises(ValueError):
+            connection.set_queue_limit("outgoing_events", 2, policy="block")
+        with pytest.raises(KeyError):
+            connection.set_queue_limit("commands", 2)
+
+    def test_queue_policies(self):
+        def queued_items(queue):
+            items = []
+            while not queue.empty():
+                items.append(aio.run(queue.get))
+            return items
+
+        dropped = []
+        queue = aio.UniversalQueue(maxsize=2, policy="drop_newest", on_drop=dropped.append)
+        for item in range(4):
+            queue.put(item)
+        assert queued_items(queue) == [0, 1]
+        assert dropped == [2, 3]
+        queue.set_limit(2, "coalesce")
+        queue.overflow_key = lambda event: event.type
+        for event in (Event("MOVE", 0), Event("AIM", 0), Event("MOVE", 1), Event("JUMP"), Event("AIM", 1)):
+            queue.put(event)
+        assert queued_items(queue) == [Event("MOVE", 1), Event("AIM", 1)]
+        assert queue.overflow_count == 5
+        assert dropped[2:] == [Event("MOVE", 0), Event("JUMP"), Event("AIM", 0)]
+        queue.set_limit(1, "block")
+        queue.put(0)
+        with pytest.raises(asyncio.QueueFull):
+            queue.put(1)
+
+        async def put_and_get():
+            put_task = asyncio.create_task(queue.put(2))
+            await asyncio.sleep(0)
+            assert not put_task.done()
+            first = await queue.get()
+            await put_task
+            return [first, await queue.get()]
+
+        assert aio.run(put_and_get) == [0, 2]
+        with pytest.raises(ValueError):
+            queue.set_limit(1, "drop_everything")
+
+    def test_queue_limit_change_keeps_pending_getters(self):
+        queue = aio.UniversalQueue()
+
+        async def get_across_limit_change():
+            get_task = asyncio.create_task(queue.get())
+            await asyncio.sleep(0)
+            queue.set_limit(1, "drop_oldest")
+            queue.put("foo")
+            return await asyncio.wait_for(get_task, 1)
+
+        assert aio.run(get_across_limit_change) == "foo"
+        assert queue.empty()
+
+    def test_coalescing_put_from_another_thread(self):
+        class SlowLookups(dict):
+            # Widen the window between looking up a pending slot and replacing its item in the producer thread.
+            def get(self, key, default=None):
+                value = super().get(key, default)
+                if threading.current_thread() is producer:
+                    time.sleep(0.05)
+                return value
+
+            def __contains__(self, key):
+                result = super().__contains__(key)
+                if threading.current_thread() is producer:
+                    time.sleep(0.05)
+                return result
+
+        queue = aio.UniversalQueue()
+        queue.put("old", key="MOVE")
+        queue._latest = SlowLookups(queue._latest)
+        errors = []
+
+        def put_newest():
+            try:
+                queue.put("new", key="MOVE")
+            except KeyError as error:
+                errors.append(error)
+
+        producer = threading.Thread(target=put_newest)
+        producer.start()
+        time.sleep(0.01)
+        # The consumer takes the pending item while the producer replaces it, the newest item must not get lost.
+        item = aio.run(queue.get)
+        producer.join()
+        assert not errors
+        assert item == "new" and queue.empty()
+
+    def test_flush(self):
+        connection = ClientConnection(("", 0), None)
+        connection.flush_event_types.add("SHOOT")
+        connection._package_interval = 0.2
+
+        async def measure_sleep(flush_delay=None):
+            if flush_delay is not None:
+                asyncio.get_running_loop().call_later(flush_delay, connection.dispatch_event, Event("SHOOT"))
+            start = time.perf_counter()
+            await connection._sleep_until_next_send(start + 0.2, time.perf_counter)
+            return time.perf_counter() - start
+
+        assert aio.run(measure_sleep) >= 0.2
+        assert 0.03 <= aio.run(measure_sleep, 0.03) < 0.1
+        assert connection._flush_requested
+        connection._create_next_package()
+        assert not connection._flush_requested
+        connection.flush()
+        assert connection._min_flush_interval <= aio.run(measure_sleep) < 0.1
+        connection._create_next_package()
+        connection.quality = "bad"
+        assert aio.run(measure_sleep, 0.03) >= 0.2
+
+    def test_client_connection_idles_with_server(self):
+        connection = ClientConnection(("", 0), None)
+        assert not connection._is_idle()
+        aio.run(connection._recv, ServerPackage(Header(1, 0, "0" * 32), GameStateUpdate(1, x=1)))
+        assert not connection._is_idle()
+        aio.run(connection._recv, ServerPackage(Header(2, 0, "0" * 32), GameStateUpdate(1, x=1)))
+        assert connection._is_idle()
+        # A running game loop progresses the time order every tick, even if nothing changes.
+        aio.run(connection._recv, ServerPackage(Header(3, 0, "0" * 32), GameStateUpdate(2)))
+        assert connection._is_idle()
+        connection.dispatch_event(Event("MOVE"))
+        assert not connection._is_idle()
+
+
+class TestServerConnection:
+    def test_interest_filter(self):
+        store = GameStateStore(GameState(1, players={0: {"x": 0}, 1: {"x": 5}}))
+        connection = ServerConnection(("foo", 1), None, store, Sqn(0))
+        connection.interest_filters.append(
+            InterestFilter("players", lambda address, game_state, key, entity: entity["x"] < 3)
+        )
+        package = connection._create_next_package()
+        assert package.game_state_update.players == {0: {"x": 0}}
+        connection.last_client_time_order = Sqn(1)
+        store.push_update(GameStateUpdate(2, players={0: {"x": 4}, 1: {"x": 2}}))
+        package = connection._create_next_package()
+        assert package.game_state_update == GameStateUpdate(2, players={0: TO_DELETE, 1: {"x": 2}})
+        # A client that missed the update receives the same entities again.
+        store.push_update(GameStateUpdate(3, other=True))
+        package = connection._create_next_package()
+        assert package.game_state_update == GameStateUpdate(3, players={0: TO_DELETE, 1: {"x": 2}}, other=True)
+        connection.last_client_time_order = Sqn(3)
+        store.push_update(GameStateUpdate(4, players={0: {"x": 1}, 1: {"x": 1}}))
+        package = connection._create_next_package()
+        assert package.game_state_update == GameStateUpdate(4, players={0: {"x": 1}, 1: {"x": 1}})
+
+    def test_bandwidth_budget(self):
+        store = GameStateStore(GameState(1, players={0: {"x": 0}, 1: {"x": 0}}))
+        connection = ServerConnection(("foo", 1), None, store, Sqn(0))
+        connection.bandwidth_budget = 1 / connection._package_interval
+        package = connection._create_next_package()
+        assert package.game_state_update.players == {0: {"x": 0}}
+        connection.last_client_time_order = Sqn(1)
+        store.push_update(GameStateUpdate(2, players={0: {"x": 1}}))
+        package = connection._create_next_package()
+        assert package.game_state_update == GameStateUpdate(2, players={1: {"x": 0}})
+        # The package got lost, so the next one has the same time order and contains the other change.
+        package = connection._create_next_package()
+        assert package.game_state_update == GameStateUpdate(2, players={0: {"x": 1}})
+        # Changes left out of either package are sent after the client received one of them.
+        connection.last_client_time_order = Sqn(2)
+        store.push_update(GameStateUpdate(3, round=1))
+        connection.bandwidth_budget = 1000 / connection._package_interval
+        package = connection._create_next_package()
+        assert package.game_state_update == GameStateUpdate(3, players={0: {"x": 1}, 1: {"x": 0}}, round=1)
+
+    def test_rate_limits(self):
+        with freeze_time("2012-01-14 12:00:01") as frozen_time:
+            connection = ServerConnection(("foo", 1), None, GameStateStore(), Sqn(0))
+            connection.rate_limits[None] = (10, 3)
+            connection.rate_limits["CHAT"] = (1, None)
+            events = [Event("CHAT", 1), Event("CHAT", 2), Event("MOVE"), Event("MOVE"), Event("MOVE")]
+            aio.run(connection._recv, ClientPackage(Header(1, 0, "0" * 32), 0, events))
+            assert connection.dropped_events == {"CHAT": 1, "MOVE": 1}
+            received = []
+            while not connection._incoming_event_queue.empty():
+                received.append(aio.run(connection._incoming_event_queue.get))
+            assert received == events[0:1] + events[2:4]
+            frozen_time.tick(0.2)
+            aio.run(connection._recv, ClientPackage(Header(2, 0, "0" * 32), 0, events[1:3]))
+            assert connection.dropped_events == {"CHAT": 2, "MOVE": 1}
+            assert aio.run(connection._incoming_event_queue.get) == events[2]
+
+    def test_events_are_labeled_with_client_view(self):
+        store = GameStateStore()
+        with freeze_time("2012-01-14 12:00:01") as frozen_time:
+            store.push_update(GameStateUpdate(1))
+            frozen_time.tick(1.0)
+            store.push_update(GameStateUpdate(2))
+            connection = ServerConnection(("foo", 1), None, store, Sqn(0))
+            connection.latency = 0.5
+            events = [Event("SHOOT"), Event("SHOOT"), Event("SHOOT"), Event("SHOOT")]
+            aio.run(connection._recv, ClientPackage(Header(1, 0, "0" * 32), 1, events[:1]))
+            # Without a known game state, the client is assumed to see the state from one round trip ago.
+            aio.run(connection._recv, ClientPackage(Header(2, 0, "0" * 32), 0, events[1:2]))
+            # Interpolating clients send the older time order they render, but can't claim a newer one.
+            events[2].view_time_order = 1
+            events[3].view_time_order = 3
+            aio.run(connection._recv, ClientPackage(Header(3, 0, "0" * 32), 2, events[2:]))
+        assert [event.view_time_order for event in events] == [1, 1, 1, 2]
+
+    def test_relay_handshake(self):
+        store = GameStateStore(GameState(1, players={0: {"x": 0}, 1: {"x": 5}}))
+        connection = ServerConnection(("relay", 1), None, store, Sqn(0))
+        connection.relay_key = "secret"
+        connection.interest_filters.append(InterestFilter("players", lambda *args: False))
+        connection.rate_limits[None] = (1, None)
+        events = [Event(RELAY_HANDSHAKE, key="wrong"), Event("MOVE", client_address=["foo", 2])]
+        aio.run(connection._recv, ClientPackage(Header(1, 0, "0" * 32), 0, events))
+        assert not connection.is_relay
+        reply = aio.run(connection._outgoing_event_queue.get)[0]
+        assert (reply.type, reply.handler_kwargs) == (RELAY_HANDSHAKE, {"accepted": False})
+        assert events[1].handler_kwargs["client_address"] == ("relay", 1)
+        assert aio.run(connection._incoming_event_queue.get) is events[1]
+        events = [Event(RELAY_HANDSHAKE, key="secret")] + [Event("MOVE", client_address=["foo", 2]) for _ in range(2)]
+        aio.run(connection._recv, ClientPackage(Header(2, 0, "0" * 32), 0, events))
+        assert connection.is_relay
+        assert aio.run(connection._outgoing_event_queue.get)[0].handler_kwargs == {"accepted": True}
+        # The handshake is not handled and the relayed events are neither rate-limited nor attributed to the relay.
+        received = []
+        while not connection._incoming_event_queue.empty():
+            received.append(aio.run(connection._incoming_event_queue.get))
+        assert received == [events[1], events[2]] and connection.dropped_events == {}
+        assert events[1].handler_kwargs["client_address"] == ("foo", 2)
+        assert connection._create_next_package().game_state_update.players == {0: {"x": 0}, 1: {"x": 5}}
+
+    def test_relay_handshake_rejects_malformed_keys(self):
+        connection = ServerConnection(("relay", 1), None, GameStateStore(), Sqn(0))
+        connection.relay_key = "secret"
+        for sequence, key in enumerate(["schlüssel", "\ud800", 42, None, b"secret"], start=1):
+            handshake = Event(RELAY_HANDSHAKE, key=key)
+            aio.run(connection._recv, ClientPackage(Header(sequence, 0, "0" * 32), 0, [handshake]))
+            assert not connection.is_relay
+            assert aio.run(connection._outgoing_event_queue.get)[0].handler_kwargs == {"accepted": False}
+        connection.relay_key = "schlüssel"
+        aio.run(connection._recv, ClientPackage(Header(6, 0, "0" * 32), 0, [Event(RELAY_HANDSHAKE, key="schlüssel")]))
+        assert connection.is_relay
+
+    def test_relay_connection_mirrors_state_once_accepted(self):
+        store = GameStateStore()
+        connection = RelayConnection(("foo", 1), UniversalEventHandler(), "secret", store)
+        assert connection._outgoing_event_queue.qsize() == 1
+        package = ServerPackage(Header(1, 0, "0" * 32), GameStateUpdate(2, x=1))
+        aio.run(connection._recv, package)
+        assert store.get_game_state().time_order == 0
+        connection.forward_event(Event("MOVE", client_address=("bar", 2)))
+        assert connection._outgoing_event_queue.qsize() == 1
+        # A rejected handshake is acknowledged like any other event, only the reply tells the relay it is accepted.
+        rejection = Event(RELAY_HANDSHAKE, accepted=False)
+        aio.run(connection._recv, ServerPackage(Header(2, 1, "0" * 32), GameStateUpdate(2, x=1), events=[rejection]))
+        assert not connection.accepted and store.get_game_state().time_order == 0
+        assert connection._incoming_event_queue.empty()
+        acceptance = Event(RELAY_HANDSHAKE, accepted=True)
+        aio.run(connection._recv, ServerPackage(Header(3, 1, "0" * 32), GameStateUpdate(2, x=1), events=[acceptance]))
+        assert connection.accepted and connection._outgoing_event_queue.qsize() == 2
+        assert connection._incoming_event_queue.empty()
+        aio.run(connection._recv, ServerPackage(Header(4, 1, "0" * 32), GameStateUpdate(2, x=1)))
+        assert store.get_game_state().x == 1
+        assert connection._create_next_package().time_order == 2
+
+    def test_tick_aligned_sending(self):
+        store = GameStateStore()
+        connection = ServerConnection(("foo", 1), None, store, Sqn(1))
+        connection.tick_aligned = True
+        connection._package_interval = 0.4
+
+        async def measure_sleep(update_delay=None):
+            if update_delay is not None:
+                asyncio.get_running_loop().call_later(
+                    update_delay, store.push_update, GameStateUpdate(store.get_game_state().time_order + 1)
+                )
+            start = time.perf_counter()
+            await connection._sleep_until_next_send(start + 0.4, time.perf_counter)
+            return time.perf_counter() - start
+
+        # Without updates, the next package is sent after the package interval.
+        assert aio.run(measure_sleep) >= 0.4
+        # A new update is sent right away, but not sooner than half the package interval after the last package.
+        assert 0.25 <= aio.run(measure_sleep, 0.25) < 0.35
+        assert 0.2 <= aio.run(measure_sleep, 0.02) < 0.35
+
+    def test_tick_aligned_send_rate(self):
+        sent_packages = []
+
+        async def sendto(self, datagram, address):
+            sent_packages.append(datagram)
+
+        sock = type("socket", (), {"sendto": sendto})()
+        store = GameStateStore()
+        connection = ServerConnection(("foo", 1), None, store, Sqn(1))
+        connection.tick_aligned = True
+        connection._package_interval = 0.05
+
+        async def send_for(duration):
+            send_task = asyncio.create_task(connection._send_loop(sock))
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                store.push_update(GameStateUpdate(store.get_game_state().time_order + 1, x=1))
+                await asyncio.sleep(0.005)
+            send_task.cancel()
+            await send_task
+
+        aio.run(send_for, 0.5)
+        # Updates arrive much faster than the package interval, but sending early doesn't raise the send rate.
+        assert 8 <= len(sent_packages) <= 12
+
+    def test_idle_keepalive(self):
+        sent_packages = []
+
+        async def sendto(self, datagram, address):
+            sent_packages.append(ServerPackage.from_datagram(datagram))
+
+        sock = type("socket", (), {"sendto": sendto})()
+        store = GameStateStore(GameState(time_order=2))
+        connection = ServerConnection(("foo", 1), None, store, Sqn(0))
+        aio.run(connection._recv, ClientPackage(Header(1, 0, "0" * 32), 0))
+        assert not connection._is_idle()
+        aio.run(connection._recv, ClientPackage(Header(2, 0, "0" * 32), 2))
+        assert connection._is_idle()
+        aio.run(connection._send_next_package, sock)
+        # Keepalive packages don't wait for acks, whose delay says nothing about the round trip time.
+        assert not connection._pending_acks
+        # Updates that don't change the game state, like those of a running game loop, keep the connection idle.
+        store.push_update(GameStateUpdate(3))
+        assert connection._is_idle()
+        store.push_update(GameStateUpdate(4, x=1))
+        assert not connection._is_idle()
+        aio.run(connection._recv, ClientPackage(Header(3, 0, "0" * 32), 4))
+        connection.dispatch_event(Event("TEST"))
+        assert not connection._is_idle()
+        aio.run(connection._send_next_package, sock)
+        assert connection._is_idle()
+        aio.run(connection._recv, ClientPackage(Header(4, 0, "0" * 32), 4, [Event("MOVE")]))
+        assert not connection._is_idle()
+
+        aio.run(connection._recv, ClientPackage(Header(5, 0, "0" * 32), 4))
+        connection._package_interval = 0.01
+        connection._idle_interval = 0.1
+
+        async def send_for(duration):
+            send_task = asyncio.create_task(connection._send_loop(sock))
+            await asyncio.sleep(duration)
+            send_task.cancel()
+            await send_task
+
+        sent_packages.clear()
+        aio.run(send_for, 0.25)
+        assert 2 <= len(sent_packages) <= 3
+
+    def test_clock_synchronization(self):
+        server_connection = ServerConnection(("foo", 1), None, GameStateStore(), Sqn(0))
+        client_connection = ClientConnection(("bar", 1), None)
+        with freeze_time("2012-01-14 12:00:00") as frozen_time:
+            client_package = client_connection._create_next_package()
+            frozen_time.tick(0.05)
+            aio.run(server_connection._recv, client_package)
+            frozen_time.tick(0.01)
+            server_package = server_connection._create_next_package()
+            assert server_package.timestamps.held == pytest.approx(0.01)
+            frozen_time.tick(0.05)
+            aio.run(client_connection._recv, server_package)
+        # Both clocks are frozen at the same time, so the offset is measured as 0.
+        assert client_connection.server_clock.remote_time(1000.0) == pytest.approx(1000.0)
+        assert len(client_connection.server_clock) == 1
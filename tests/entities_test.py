@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pygase.entities import EntityTable, EntityTableUpdate
+from pygase.gamestate import GameState, GameStateUpdate, merge_update_dicts
+
+
+def create_units(count=3):
+    units = EntityTable({"position": ("f4", 2), "health": "i2"}, capacity=2)
+    for i in range(count):
+        units.insert(position=(i, 0.0), health=100)
+    return units
+
+
+class TestEntityTable:
+    def test_insert_and_remove_reuse_rows(self):
+        units = create_units()
+        assert len(units) == 3
+        assert list(units.ids) == [0, 1, 2]
+        row = units.row(1)
+        units.remove(1)
+        assert 1 not in units
+        assert units.insert(health=50) == 3
+        assert units.row(3) == row
+        assert units.get(3)["health"] == 50
+        with pytest.raises(KeyError):
+            units.insert(0)
+
+    def test_diff_contains_only_changed_rows(self):
+        units = create_units()
+        units.remove(2)
+        position = units["position"].copy()
+        position[units.row(1)] = (5.0, 5.0)
+        position[~units.active] = (9.0, 9.0)
+        update = units.diff(position=position, health=units["health"])
+        entity_ids, values = update.columns["position"]
+        assert list(entity_ids) == [1]
+        assert values.tolist() == [[5.0, 5.0]]
+        assert len(update.columns["health"][0]) == 0
+        units.apply(update)
+        assert units.get(1)["position"].tolist() == [5.0, 5.0]
+
+    def test_apply_adds_and_removes_entities(self):
+        units = create_units()
+        units.apply(EntityTableUpdate({"health": ([0, 7], [10, 20])}, removed=[1]))
+        assert sorted(units.ids) == [0, 2, 7]
+        assert units.get(0)["health"] == 10
+        assert units.get(7)["position"].tolist() == [0.0, 0.0]
+
+    def test_bulk_apply_and_lookup(self):
+        units = create_units()
+        new_ids = np.arange(10, 1010)
+        units.apply(EntityTableUpdate({"health": (new_ids, np.full(1000, 7))}, removed=[0, 99]))
+        assert len(units) == 1002 and 0 not in units and 10 in units
+        rows = units.rows(new_ids)
+        assert len(set(rows.tolist())) == 1000
+        assert (units["health"][rows] == 7).all()
+        assert (units["position"][rows] == 0).all()
+        with pytest.raises(KeyError):
+            units.rows([1, 0])
+
+    def test_updated_copies_only_changed_components(self):
+        units = create_units()
+        updated = units.updated(EntityTableUpdate({"health": ([0], [1])}))
+        assert updated["position"] is units["position"]
+        assert updated["health"] is not units["health"]
+        assert updated.get(0)["health"] == 1 and units.get(0)["health"] == 100
+        # Tables copy shared arrays before changing them, so neither can change the other.
+        units.apply(EntityTableUpdate({"position": ([0], [(5.0, 5.0)])}))
+        assert updated.get(0)["position"].tolist() == [0.0, 0.0]
+        updated.remove(1)
+        assert 1 in units and list(units.ids) == [0, 1, 2]
+
+    def test_combine_does_not_mutate_operands(self):
+        first = EntityTableUpdate({"health": ([0, 1], [10, 20])})
+        second = EntityTableUpdate({"health": ([1, 2], [30, 40])}, removed=[0])
+        combined = first.combine(second)
+        assert combined.columns["health"][0].tolist() == [1, 2]
+        assert combined.columns["health"][1].tolist() == [30, 40]
+        assert combined.removed.tolist() == [0]
+        assert first == EntityTableUpdate({"health": ([0, 1], [10, 20])})
+
+
+class TestEntityTablesInGameStates:
+    def test_bytepacking(self):
+        units = create_units()
+        game_state = GameState(time_order=2, units=units)
+        assert GameState.from_bytes(game_state.to_bytes()) == game_state
+        update = GameStateUpdate(3, units=EntityTableUpdate({"health": ([1], [5])}))
+        unpacked_update = GameStateUpdate.from_bytes(update.to_bytes())
+        assert unpacked_update == update
+        assert unpacked_update.units.columns["health"][1].dtype == np.int64
+
+    def test_update_arithmetic(self):
+        units = create_units()
+        game_state = GameState(time_order=1, units=units)
+        update = GameStateUpdate(2, units=EntityTableUpdate({"health": ([0], [90])}))
+        update += GameStateUpdate(3, units=EntityTableUpdate({"health": ([1], [80])}, removed=[2]))
+        game_state += update
+        assert game_state.units is not units
+        assert [game_state.units.get(entity_id)["health"] for entity_id in game_state.units.ids] == [90, 80]
+        assert [units.get(entity_id)["health"] for entity_id in units.ids] == [100, 100, 100]
+
+    def test_full_state_update_creates_table(self):
+        units = create_units()
+        full_update = GameStateUpdate.from_bytes(GameStateUpdate(1, units=units).to_bytes())
+        game_state = GameState() + full_update
+        assert game_state.units == units
+
+    def test_merge_update_dicts_copies_shared_tables(self):
+        units = create_units()
+        working_data = {"units": units}
+        merge_update_dicts(working_data, {"units": EntityTableUpdate({"health": ([0], [1])})}, delete=True)
+        assert working_data["units"].get(0)["health"] == 1
+        assert units.get(0)["health"] == 100
+
+    def test_merge_update_dicts_copies_tables_once(self):
+        units = create_units()
+        working_data = {"units": units}
+        copied_tables = []
+        merge_update_dicts(
+            working_data, {"units": EntityTableUpdate({"health": ([0], [1])})}, True, copied_tables=copied_tables
+        )
+        working_copy = working_data["units"]
+        assert len(copied_tables) == 1 and copied_tables[0] is working_copy is not units
+        merge_update_dicts(
+            working_data, {"units": EntityTableUpdate({"health": ([1], [2])})}, True, copied_tables=copied_tables
+        )
+        assert working_data["units"] is working_copy
+        assert [working_copy.get(entity_id)["health"] for entity_id in working_copy.ids] == [1, 2, 100]
+        assert units.get(0)["health"] == 100 and units.get(1)["health"] == 100
@@ -1,6 +1,18 @@
 # -*- coding: utf-8 -*-
 
-from pygase.gamestate import GameState, GameStateUpdate, GameStatus, TO_DELETE
+import pytest
+
+from pygase.gamestate import (
+    GameState,
+    GameStateUpdate,
+    GameStatus,
+    StateSubscriptions,
+    merge_update_dicts,
+    InterpolationBuffer,
+    InterestFilter,
+    PriorityAccumulator,
+    TO_DELETE,
+)
 
 
 def test_game_status_enum_values():
@@ -76,6 +88,20 @@ class TestGameStateUpdate:
         )
         assert game_state.time_order == 5 and game_state.test[1] == "test1"
 
+    def test_combining_updates_does_not_mutate_them(self):
+        first = GameStateUpdate(1, players={0: {"x": 1}})
+        second = GameStateUpdate(2, players={0: {"y": 2}, 1: {"x": 3}})
+        combined = second + first
+        assert combined.time_order == 2
+        assert combined.players == {0: {"x": 1, "y": 2}, 1: {"x": 3}}
+        assert first.players == {0: {"x": 1}}
+        assert second.players == {0: {"y": 2}, 1: {"x": 3}}
+        # Nested dicts that the game state took over from an update are not changed by later updates.
+        game_state = GameState(0) + first
+        game_state += GameStateUpdate(2, players={0: {"x": 5}})
+        assert game_state.players == {0: {"x": 5}}
+        assert first.players == {0: {"x": 1}}
+
     def test_update_can_set_game_status(self):
         game_state = GameState(time_order=0, game_status=GameStatus.PAUSED)
         game_state += GameStateUpdate(time_order=1, game_status=GameStatus.ACTIVE)
@@ -88,3 +114,150 @@ class TestGameStateUpdate:
         game_state += update
         assert game_state.time_order == 3
         assert game_state.time_order_payload == 1
+
+    def test_merge_update_dicts(self):
+        shared = {"a": 1, "b": 2}
+        target = {"nested": shared, "gone": 0}
+        merge_update_dicts(target, {"nested": {"a": 3}, "gone": TO_DELETE, "new": TO_DELETE})
+        assert target == {"nested": {"a": 3, "b": 2}, "gone": TO_DELETE, "new": TO_DELETE}
+        assert shared == {"a": 1, "b": 2}
+        merge_update_dicts(target, {"gone": TO_DELETE, "missing": TO_DELETE}, delete=True)
+        assert target == {"nested": {"a": 3, "b": 2}, "new": TO_DELETE}
+
+
+class TestStateSubscriptions:
+    def test_match_wildcard_paths(self):
+        subscriptions = StateSubscriptions()
+        on_position = lambda path, value: None
+        on_players = lambda path, value: None
+        subscriptions.subscribe("players.*.position", on_position)
+        subscriptions.subscribe("players", on_players)
+        update = GameStateUpdate(2, players={0: {"position": (1, 2), "name": "foo"}, 1: {"name": "bar"}}, chaser=0)
+        matches = subscriptions.match(update)
+        assert (on_players, ("players",), update.players) in matches
+        assert (on_position, ("players", 0, "position"), (1, 2)) in matches
+        assert len(matches) == 2
+        assert subscriptions.match(GameStateUpdate(3, chaser=1)) == []
+        assert subscriptions.match(GameStateUpdate(4, players={1: TO_DELETE})) == [
+            (on_players, ("players",), {1: TO_DELETE})
+        ]
+
+    def test_unsubscribe(self):
+        subscriptions = StateSubscriptions()
+        callback = lambda path, value: None
+        subscriptions.subscribe("foo.bar", callback)
+        subscriptions.subscribe("foo", callback)
+        subscriptions.unsubscribe("foo.bar", callback)
+        assert subscriptions.match(GameStateUpdate(1, foo={"bar": 1})) == [(callback, ("foo",), {"bar": 1})]
+        assert "bar" not in subscriptions._root.children["foo"].children
+        subscriptions.unsubscribe("foo", callback)
+        assert subscriptions._root.children == {}
+        with pytest.raises(ValueError):
+            subscriptions.unsubscribe("foo.baz", callback)
+
+
+class TestInterpolationBuffer:
+    def test_interpolate(self):
+        buffer = InterpolationBuffer(size=3)
+        with pytest.raises(LookupError):
+            buffer.interpolate(0.0)
+        buffer.push(GameState(1, pos=(0, 10.0), hp=100, speed=1.0, name="foo", alive=True), 1.0)
+        buffer.push(GameState(2, pos=(10.0, 20.0), hp=50, speed=2.0, name="bar", alive=False, new=1), 2.0)
+        state = buffer.interpolate(1.25)
+        assert state.time_order == 1
+        assert state.pos == pytest.approx((2.5, 12.5))
+        assert state.speed == pytest.approx(1.25)
+        assert state.hp == 100 and isinstance(state.hp, int)
+        assert state.name == "foo" and state.alive is True
+        assert not hasattr(state, "new")
+        assert buffer.interpolate(0.5).pos == (0.0, 10.0)
+        assert buffer.interpolate(3.0).pos == (10.0, 20.0)
+        assert [buffer.time_order_at(render_time) for render_time in (0.5, 1.25, 2.0, 3.0)] == [1, 1, 2, 2]
+        assert InterpolationBuffer().time_order_at(1.0) == 0
+
+    def test_interpolate_path_patterns(self):
+        buffer = InterpolationBuffer(path_patterns=["players.*.position"])
+        buffer.push(GameState(1, players={0: {"position": (0.0, 0.0), "speed": 0.0}}, timer=0.0), 1.0)
+        buffer.push(GameState(2, players={0: {"position": (2.0, 4.0), "speed": 2.0}}, timer=1.0), 2.0)
+        state = buffer.interpolate(1.5)
+        assert state.players[0]["position"] == pytest.approx((1.0, 2.0))
+        assert state.players[0]["speed"] == 0.0
+        assert state.timer == 0.0
+
+    def test_size_and_order(self):
+        buffer = InterpolationBuffer(size=2)
+        game_state = GameState(1, foo=0)
+        buffer.push(game_state, 1.0)
+        game_state.foo = 1
+        assert buffer.interpolate(1.0).foo == 0
+        buffer.push(GameState(2, foo=2), 2.0)
+        buffer.push(GameState(3, foo=1), 1.5)
+        buffer.push(GameState(4, foo=4), 3.0)
+        assert len(buffer) == 2
+        assert buffer.interpolate(0.0).foo == 2
+
+
+class TestInterestFilter:
+    def test_within_radius(self):
+        game_state = GameState(players={0: {"position": (0, 0)}, 1: {"position": (3, 4)}, 2: {"name": "foo"}})
+        focus = {("foo", 1): (0, 0), ("bar", 1): (6, 8)}
+        interest_filter = InterestFilter.within_radius("players", 5, lambda address, game_state: focus.get(address))
+        assert interest_filter.relevant_keys(("foo", 1), game_state) == {0, 1}
+        assert interest_filter.relevant_keys(("bar", 1), game_state) == {1}
+        assert interest_filter.relevant_keys(("baz", 1), game_state) == {0, 1, 2}
+        assert interest_filter.is_relevant(("bar", 1), game_state, 1, game_state.players[1])
+        assert not interest_filter.is_relevant(("bar", 1), game_state, 0, game_state.players[0])
+
+    def test_within_radius_calls_focus_once_and_follows_updates(self):
+        game_state = GameState(players={key: {"position": (10.0 * key, 0.0)} for key in range(100)})
+        focus_calls = []
+
+        def focus(address, game_state):
+            focus_calls.append(address)
+            return (45.0, 0.0)
+
+        interest_filter = InterestFilter.within_radius("players", 5, focus)
+        assert interest_filter.relevant_keys(("foo", 1), game_state) == {4, 5}
+        assert focus_calls == [("foo", 1)]
+        game_state += GameStateUpdate(1, players={3: {"position": (44.0, 0.0)}, 5: TO_DELETE})
+        assert interest_filter.relevant_keys(("foo", 1), game_state) == {3, 4}
+
+    def test_filter_changes(self):
+        game_state = GameState(players={0: {"x": 0, "hp": 5}, 1: {"x": 1, "hp": 5}, 2: {"x": 2, "hp": 5}})
+        interest_filter = InterestFilter("players", lambda address, game_state, key, entity: entity["x"] > 0)
+        relevant = interest_filter.relevant_keys(("foo", 1), game_state)
+        assert interest_filter.filter_changes(game_state.players, game_state, relevant, None) == {
+            1: {"x": 1, "hp": 5},
+            2: {"x": 2, "hp": 5},
+        }
+        changes = {0: {"x": 0}, 1: {"hp": 4}, 3: TO_DELETE}
+        # Entity 0 leaves, entity 2 enters and only the change of entity 1 is passed on.
+        assert interest_filter.filter_changes(changes, game_state, relevant, frozenset({0, 1, 3})) == {
+            0: TO_DELETE,
+            1: {"hp": 4},
+            2: {"x": 2, "hp": 5},
+            3: TO_DELETE,
+        }
+        assert interest_filter.filter_changes(TO_DELETE, game_state, frozenset(), frozenset()) == TO_DELETE
+
+
+class TestPriorityAccumulator:
+    def test_deferred_changes_accumulate_priority(self):
+        game_state = GameState(players={0: {"hp": 1}, 1: {"hp": 1}, 2: {"hp": 1}}, round=1)
+        accumulator = PriorityAccumulator(
+            {"players": lambda address, game_state, key, entity: 3.0 if key == 0 else 1.0}
+        )
+        data = {"players": {0: {"hp": 2}, 1: {"hp": 2}, 2: {"hp": 2}}, "round": 2}
+        selected, deferred = accumulator.select(data, {}, 12, ("foo", 1), game_state)
+        assert selected == {"players": {0: {"hp": 2}}, "round": 2}
+        assert deferred == {("players", 1): {"hp": 2}, ("players", 2): {"hp": 2}}
+        data = {"players": {0: {"hp": 3}, 2: {"x": 0}}}
+        selected, deferred = accumulator.select(data, deferred, 8, ("foo", 1), game_state)
+        # Entity 0 has accumulated priority 3, entities 1 and 2 have accumulated priority 2.
+        assert selected == {"players": {0: {"hp": 3}}}
+        selected, deferred = accumulator.select({}, deferred, 8, ("foo", 1), game_state)
+        assert selected == {"players": {1: {"hp": 2}}}
+        assert deferred == {("players", 2): {"hp": 2, "x": 0}}
+        selected, deferred = accumulator.select({"players": TO_DELETE}, deferred, 8, ("foo", 1), game_state)
+        assert selected == {"players": TO_DELETE}
+        assert not deferred and not accumulator.accumulated
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from pygase import aio
+from pygase.aio import socket
 import pytest
 from freezegun import freeze_time
 
 from helpers import assert_timeout
 
-from pygase.backend import Server, GameStateMachine, GameStateStore
+from pygase.backend import GameStateMachine, GameStateStore, Backend
+from pygase.server import Server
+from pygase.relay import Relay
 from pygase.client import Client
+from pygase.server import ServerConnection
+from pygase.packages import PROTOCOL_ID
 from pygase.gamestate import GameState, GameStatus
 
 
@@ -61,3 +66,104 @@ class TestIntegration:
 
         assert aio.run(test_task, True, with_monitor=True)
         assert aio.run(test_task, False, with_monitor=True)
+
+    def test_disconnected_clients_leave_groups(self, monkeypatch):
+        monkeypatch.setattr(ServerConnection, "_timeout", 0.2)
+        server = Server(GameStateStore())
+        client = Client()
+
+        async def test_task():
+            server_task = await aio.spawn(server.run)
+            await assert_timeout(3, lambda: server.port is not None)
+            client_task = await aio.spawn(client.connect, server.port, server.hostname)
+            await assert_timeout(3, lambda: server.connections != {})
+            (client_address,) = server.connections
+            server.add_to_group("red", client_address)
+            await client.disconnect()
+            await client_task.join()
+            await assert_timeout(3, lambda: server.groups["red"] == set())
+            await server.shutdown()
+            await server_task.join()
+            return True
+
+        assert aio.run(test_task)
+
+    def test_server_survives_truncated_datagrams(self):
+        server = Server(GameStateStore())
+        client = Client()
+
+        async def test_task():
+            server_task = await aio.spawn(server.run)
+            await assert_timeout(3, lambda: server.port is not None)
+            async with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                await sock.sendto(PROTOCOL_ID + bytes(10), (server.hostname, server.port))
+            client_task = await aio.spawn(client.connect, server.port, server.hostname)
+            await assert_timeout(3, lambda: server.connections != {})
+            await client.disconnect(shutdown_server=True)
+            await client_task.join()
+            await server_task.join()
+            return True
+
+        assert aio.run(test_task)
+
+    def test_single_loop_backend(self):
+        backend = Backend(
+            GameState(counter=0),
+            time_step_function=lambda game_state, dt: {},
+            event_handlers={"ADD": lambda amount, game_state, **kwargs: {"counter": game_state.counter + amount}},
+        )
+        client = Client()
+
+        async def test_task():
+            backend_task = await aio.spawn(backend.run_single_loop, "localhost", 0, 0.01)
+            await assert_timeout(3, lambda: backend.server.port is not None)
+            client_task = await aio.spawn(client.connect, backend.server.port, backend.server.hostname)
+            await assert_timeout(3, lambda: client.connection is not None)
+            client.dispatch_event("ADD", 3)
+            await assert_timeout(3, lambda: backend.game_state_store.get_game_state().counter == 3)
+            await client.disconnect(shutdown_server=True)
+            await client_task.join()
+            await backend_task.join()
+            return backend.game_state_store.get_game_state().game_status
+
+        assert aio.run(test_task) == GameStatus.PAUSED
+
+    def test_relay(self):
+        backend = Backend(
+            GameState(senders=[]),
+            time_step_function=lambda game_state, dt: {},
+            event_handlers={
+                "JOIN": lambda game_state, client_address, **kwargs: {
+                    "senders": game_state.senders + [list(client_address)]
+                }
+            },
+        )
+        backend.server.allow_relays("secret")
+        relay = Relay("secret")
+        client = Client()
+        received = []
+        client.register_event_handler("HELLO", received.append)
+
+        async def test_task():
+            backend_task = await aio.spawn(backend.run_single_loop, "localhost", 0, 0.01)
+            await assert_timeout(3, lambda: backend.server.port is not None)
+            relay_task = await aio.spawn(relay.run, backend.server.port)
+            await assert_timeout(3, lambda: relay.server.port is not None and relay.connection.accepted)
+            client_task = await aio.spawn(client.connect, relay.server.port)
+            await assert_timeout(3, lambda: client.connection is not None)
+            await assert_timeout(3, lambda: client.connection.game_state_context.resource.data.get("senders") == [])
+            client.dispatch_event("JOIN", delivery="reliable")
+            await assert_timeout(3, lambda: client.connection.game_state_context.resource.senders != [])
+            backend.server.dispatch_event("HELLO", "world")
+            await assert_timeout(3, lambda: received == ["world"])
+            await client.disconnect()
+            await client_task.join()
+            await relay.shutdown()
+            await relay_task.join()
+            await backend.server.shutdown()
+            await backend_task.join()
+            return backend.game_state_store.get_game_state().senders, relay.server.connections
+
+        senders, relay_clients = aio.run(test_task)
+        # The upstream server handles the event with the address of the client that sent it to the relay.
+        assert [tuple(sender) for sender in senders] == list(relay_clients)
@@ -1,5 +1,17 @@
 import pytest
-from pygase.utils import LockedResource, LockedRessource, Sqn, Sendable, get_available_ip_addresses, umsgpack
+from freezegun import freeze_time
+from pygase.utils import (
+    ClockSync,
+    JitterStats,
+    LockedResource,
+    LockedRessource,
+    RttEstimator,
+    Sqn,
+    Sendable,
+    TokenBucket,
+    get_available_ip_addresses,
+    umsgpack,
+)
 
 
 class TestSendable:
@@ -185,6 +197,72 @@ class TestLockedResourceCompatibility:
         assert locked_resource.resource == {"baz": "qux"}
 
 
+class TestJitterStats:
+    def test_percentiles(self):
+        jitter = JitterStats(size=100)
+        assert jitter.percentiles() == {}
+        for lateness in range(1, 201):
+            jitter.record(lateness / 1000)
+        assert len(jitter) == 100
+        assert jitter.percentiles() == {50: 0.15, 90: 0.19, 99: 0.199}
+        assert jitter.percentiles(0, 100) == {0: 0.101, 100: 0.2}
+        assert jitter.mean() == pytest.approx(0.1505)
+        jitter.reset()
+        assert len(jitter) == 0
+
+
+class TestTokenBucket:
+    def test_consume(self):
+        with freeze_time("2012-01-14 12:00:01") as frozen_time:
+            bucket = TokenBucket(rate=2, burst=3)
+            assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
+            frozen_time.tick(0.5)
+            assert bucket.consume()
+            assert not bucket.consume()
+            frozen_time.tick(10)
+            assert bucket.refill() == 3
+
+
+class TestRttEstimator:
+    def test_smoothing_and_timeout(self):
+        rtt = RttEstimator(initial_rto=1.0, min_rto=0.05, max_rto=2.0)
+        assert rtt.rto == 1.0
+        assert rtt.summary() == {}
+        rtt.record(0.1)
+        assert (rtt.srtt, rtt.rttvar) == (0.1, 0.05)
+        assert rtt.rto == pytest.approx(0.3)
+        rtt.record(0.2)
+        assert rtt.rttvar == pytest.approx(0.0625)
+        assert rtt.srtt == pytest.approx(0.1125)
+        assert rtt.rto == pytest.approx(0.3625)
+        for _ in range(100):
+            rtt.record(0.01)
+        assert rtt.rto == 0.05
+        assert rtt.summary() == {"min": 0.01, "avg": pytest.approx(1.3 / 102), "p99": 0.1}
+        rtt.record(100.0)
+        assert rtt.rto == 2.0
+        assert len(rtt) == len(rtt.samples) == 103 and rtt.percentiles(100) == {100: 100.0}
+
+
+class TestClockSync:
+    def test_offset_and_drift(self):
+        clock = ClockSync(size=32)
+        assert clock.remote_time(5.0) == 5.0
+
+        def remote(local_time):
+            # The remote clock is 100 seconds ahead and gains 1 ms per second.
+            return 100.0 + 1.001 * local_time
+
+        for i in range(32):
+            local_sent = float(i)
+            # Every other response is delayed on the way back, which distorts the offset of its sample.
+            return_delay = 0.01 if i % 2 else 0.2
+            remote_time = remote(local_sent + 0.01)
+            clock.record_exchange(local_sent, remote_time, remote_time, local_sent + 0.01 + return_delay)
+        assert clock.drift() == pytest.approx(0.001)
+        assert clock.remote_time(40.0) == pytest.approx(remote(40.0), abs=1e-3)
+
+
 class TestUtilFunctions:
     def test_get_IpAddresses(self):
         ips = get_available_ip_addresses()